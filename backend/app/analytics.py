@@ -0,0 +1,93 @@
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import Date, cast, func, literal_column, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import TripDailyRollup
+from .rollups import ORPHAN_ID
+
+# Trip aggregates computed in Postgres from the daily rollup table, which the
+# trip write paths keep exact (see rollups.py). All breakdowns for a request
+# come from one GROUPING SETS query over the matching rollup rows.
+
+MONTH = cast(func.date_trunc(literal_column("'month'"), TripDailyRollup.day), Date).label("month")
+
+# grouping(vehicle_id, user_id, month) bitmasks; a set bit means the column
+# is rolled up in that row
+BY_VEHICLE, BY_USER, BY_MONTH, TOTAL = 0b011, 0b101, 0b110, 0b111
+
+
+def stat_columns():
+    rollup = TripDailyRollup
+    return (
+        func.coalesce(func.sum(rollup.trip_count), 0).label("trip_count"),
+        func.coalesce(func.sum(rollup.total_distance), 0).label("total_distance"),
+        func.coalesce(func.sum(rollup.total_fuel), 0).label("total_fuel"),
+        (func.sum(rollup.total_distance) / func.nullif(func.sum(rollup.distance_count), 0)).label("avg_distance"),
+        (func.sum(rollup.total_fuel) / func.nullif(func.sum(rollup.fuel_count), 0)).label("avg_fuel_consumed"),
+        (func.sum(rollup.total_distance) / func.nullif(func.sum(rollup.total_fuel), 0)).label("km_per_litre"),
+        func.coalesce(func.sum(rollup.completed), 0).label("completed"),
+        func.coalesce(func.sum(rollup.cancelled), 0).label("cancelled"),
+        func.coalesce(func.sum(rollup.pending), 0).label("pending"),
+    )
+
+
+def trip_stats(row) -> dict:
+    def rounded(value, digits=3):
+        return None if value is None else round(float(value), digits)
+
+    return {
+        "trip_count": row.trip_count,
+        "total_distance": rounded(row.total_distance),
+        "total_fuel": rounded(row.total_fuel),
+        "avg_distance": rounded(row.avg_distance),
+        "avg_fuel_consumed": rounded(row.avg_fuel_consumed),
+        "km_per_litre": rounded(row.km_per_litre),
+        "completed": row.completed,
+        "cancelled": row.cancelled,
+        "pending": row.pending,
+    }
+
+
+def trip_filters(start_date: Optional[date], end_date: Optional[date],
+                 vehicle_id: Optional[int] = None) -> list:
+    # Rows whose trips were all deleted or moved stay behind with zero counts
+    filters = [TripDailyRollup.trip_count != 0]
+    if start_date:
+        filters.append(TripDailyRollup.day >= start_date)
+    if end_date:
+        filters.append(TripDailyRollup.day <= end_date)
+    if vehicle_id is not None:
+        filters.append(TripDailyRollup.vehicle_id == vehicle_id)
+    return filters
+
+
+async def trip_breakdown(db: AsyncSession, filters: list) -> dict:
+    """Totals plus per-vehicle, per-user and monthly stats for the filtered rollup rows."""
+    rollup = TripDailyRollup
+    sets = [tuple_(rollup.vehicle_id), tuple_(rollup.user_id), tuple_(MONTH), tuple_()]
+    query = (
+        select(rollup.vehicle_id, rollup.user_id, MONTH,
+               func.grouping(rollup.vehicle_id, rollup.user_id, MONTH).label("grouping"),
+               *stat_columns())
+        .where(*filters)
+        .group_by(func.grouping_sets(*sets))
+    )
+    return breakdown_from_rows((await db.execute(query)).all())
+
+
+def breakdown_from_rows(rows) -> dict:
+    result = {"totals": None, "by_vehicle": [], "by_user": [], "monthly": []}
+    for row in rows:
+        if row.grouping == TOTAL:
+            result["totals"] = trip_stats(row)
+        elif row.grouping == BY_VEHICLE and row.vehicle_id != ORPHAN_ID:
+            result["by_vehicle"].append({"vehicle_id": row.vehicle_id, **trip_stats(row)})
+        elif row.grouping == BY_USER and row.user_id != ORPHAN_ID:
+            result["by_user"].append({"user_id": row.user_id, **trip_stats(row)})
+        elif row.grouping == BY_MONTH and row.month is not None:
+            result["monthly"].append({"month": row.month, **trip_stats(row)})
+    for key, sort_key in (("by_vehicle", "vehicle_id"), ("by_user", "user_id"), ("monthly", "month")):
+        result[key].sort(key=lambda item: item[sort_key])
+    return result
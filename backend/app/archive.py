@@ -0,0 +1,562 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+from datetime import date, datetime, timezone
+from enum import Enum
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import BigInteger, Boolean, Date, Float, Integer, String, func, select, text, tuple_
+
+from .models import Inspection, ServiceHistory, Trip
+from .partitions import (PARTITIONED_TABLES, PartitionedTable, add_months, detached_partitions,
+                         ensure_partitions, month_start, partition_name, partitions)
+from .versions import bump_statement
+
+# Cold archive. Closed months of trips, inspections and service history move
+# out of PostgreSQL into zstd-compressed Parquet files under ARCHIVE_DIR, one
+# directory per table and month, listed in manifest.json with their row
+# counts, id and date ranges and checksums. The database keeps the recent
+# months, so dumps and vacuum stop growing with history, and the files are
+# backed up separately.
+#
+# A month is archived in one transaction: its rows are locked against
+# writes, written to a file that is read back and checked against the
+# database (row count and id sum), and then removed: the monthly partition
+# is dropped (or the retention-detached table, see partitions.py), and
+# service history rows are deleted. The manifest entry is written as
+# pending before that transaction commits and marked archived after, so a
+# run interrupted in between is resolved by the next one. Rows that reach
+# an archived month later (back-dated imports) are archived as another part
+# of that month.
+#
+# Archived rows are read-only and stay queryable: /api/history/{kind}
+# answers over both the database and the files, and the get-by-id endpoints
+# fall back to the files. Reads go through pyarrow datasets, which skip
+# files by the manifest's date and id ranges, skip row groups by their
+# column statistics (predicate pushdown) and only decode the requested
+# columns (column pushdown). Files are sorted by vehicle, then date, so
+# per-vehicle history skips most row groups. Like retention, archiving
+# leaves trip_daily_rollup alone and does not report the rows as deleted in
+# the change feed.
+#
+# Archiving runs on demand (python -m app.archive run) or, with
+# ARCHIVE_AFTER_MONTHS set, once a day in the API workers. A month is
+# closed once it ended more than ARCHIVE_AFTER_MONTHS months ago; keep a
+# partition retention longer than that, or in detach mode, so nothing is
+# dropped before it is archived.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ARCHIVE_DIR = os.getenv("ARCHIVE_DIR", os.path.join(BACKEND_DIR, "archive"))
+ARCHIVE_AFTER_MONTHS = int(os.getenv("ARCHIVE_AFTER_MONTHS", "0"))
+ARCHIVE_COMPRESSION = os.getenv("ARCHIVE_COMPRESSION", "zstd")
+ARCHIVE_ROW_GROUP_ROWS = int(os.getenv("ARCHIVE_ROW_GROUP_ROWS", "65536"))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", "86400"))
+ARCHIVE_LOCK_TIMEOUT = os.getenv("ARCHIVE_LOCK_TIMEOUT", "5s")
+
+# pg_try_advisory_xact_lock key, so only one process archives at a time
+ARCHIVE_LOCK_KEY = 0xA4C41E
+
+MANIFEST_NAME = "manifest.json"
+PENDING, ARCHIVED = "pending", "archived"
+
+logger = logging.getLogger(__name__)
+
+
+class ArchivedTable(NamedTuple):
+    kind: str
+    model: type
+    date: str
+    vehicle: str
+    user: Optional[str]
+    partitioned: Optional[PartitionedTable]
+
+    @property
+    def name(self) -> str:
+        return self.model.__table__.name
+
+    @property
+    def pk(self) -> str:
+        return self.model.__table__.primary_key.columns.values()[0].name
+
+    @property
+    def columns(self) -> List[str]:
+        return [column.name for column in self.model.__table__.columns]
+
+    def column(self, name: str):
+        return getattr(self.model, name)
+
+
+ARCHIVED_TABLES: Dict[str, ArchivedTable] = {
+    "trips": ArchivedTable("trips", Trip, "trip_date", "vehicle_id", "user_id", PARTITIONED_TABLES[0]),
+    "inspections": ArchivedTable("inspections", Inspection, "date", "vehicle_id", "user_id", PARTITIONED_TABLES[1]),
+    "service_history": ArchivedTable("service_history", ServiceHistory, "service_date", "vehicle_vin", None, None),
+}
+
+
+def parse_kind(kind: str) -> ArchivedTable:
+    if kind not in ARCHIVED_TABLES:
+        raise ValueError(f"Unknown history '{kind}', expected one of: {', '.join(ARCHIVED_TABLES)}")
+    return ARCHIVED_TABLES[kind]
+
+
+def parse_columns(table: ArchivedTable, columns: Optional[str]) -> List[str]:
+    """Comma separated column names, or all of them; raises ValueError on unknown names."""
+    if not columns:
+        return table.columns
+    requested = list(dict.fromkeys(name.strip() for name in columns.split(",") if name.strip()))
+    unknown = [name for name in requested if name not in table.columns]
+    if unknown or not requested:
+        raise ValueError(f"Unknown columns: {', '.join(unknown)}; expected a subset of {', '.join(table.columns)}")
+    return requested
+
+
+# Manifest
+
+
+_manifest_cache: Tuple[Optional[float], dict] = (None, {"files": []})
+
+
+def manifest_path() -> str:
+    return os.path.join(ARCHIVE_DIR, MANIFEST_NAME)
+
+
+def load_manifest(fresh: bool = False) -> dict:
+    """The manifest, re-read only when the file changed; ``fresh`` returns
+    a private copy for callers that change it."""
+    global _manifest_cache
+    try:
+        mtime = os.stat(manifest_path()).st_mtime
+    except FileNotFoundError:
+        return {"files": []}
+    if fresh or _manifest_cache[0] != mtime:
+        with open(manifest_path()) as f:
+            manifest = json.load(f)
+        if fresh:
+            return manifest
+        _manifest_cache = (mtime, manifest)
+    return _manifest_cache[1]
+
+
+def save_manifest(manifest: dict):
+    os.makedirs(ARCHIVE_DIR, exist_ok=True)
+    temporary = manifest_path() + ".tmp"
+    with open(temporary, "w") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary, manifest_path())
+
+
+def archived_files(table: ArchivedTable, start_date: Optional[date] = None, end_date: Optional[date] = None,
+                   pk: Optional[int] = None) -> List[dict]:
+    """Archived files of ``table`` that may hold rows in the date range or with id ``pk``."""
+    return [
+        entry for entry in load_manifest()["files"]
+        if entry["table"] == table.name and entry["state"] == ARCHIVED
+        and (start_date is None or date.fromisoformat(entry["max_date"]) >= start_date)
+        and (end_date is None or date.fromisoformat(entry["min_date"]) <= end_date)
+        and (pk is None or entry["min_id"] <= pk <= entry["max_id"])
+    ]
+
+
+def hot_since(table: ArchivedTable) -> Optional[date]:
+    """First day after the newest archived month of ``table``, if any."""
+    months = [date.fromisoformat(entry["month"]) for entry in archived_files(table)]
+    return add_months(max(months), 1) if months else None
+
+
+# Writing
+
+
+def arrow_schema(table: ArchivedTable):
+    import pyarrow as pa
+    fields = []
+    for column in table.model.__table__.columns:
+        kind = column.type
+        if isinstance(kind, BigInteger):
+            arrow_type = pa.int64()
+        elif isinstance(kind, Integer):
+            arrow_type = pa.int32()
+        elif isinstance(kind, Float):
+            arrow_type = pa.float64()
+        elif isinstance(kind, Date):
+            arrow_type = pa.date32()
+        elif isinstance(kind, Boolean):
+            arrow_type = pa.bool_()
+        elif isinstance(kind, String):
+            # Enums included: stored as their values
+            arrow_type = pa.string()
+        else:
+            raise TypeError(f"No archive type for {table.name}.{column.name} ({kind})")
+        fields.append(pa.field(column.name, arrow_type, nullable=bool(column.nullable)))
+    return pa.schema(fields)
+
+
+def _plain(values):
+    return [value.value if isinstance(value, Enum) else value for value in values]
+
+
+def write_file(connection, table: ArchivedTable, statement, path: str) -> int:
+    """Stream ``statement``'s rows (all columns of ``table``) into a Parquet file; returns the row count."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    schema = arrow_schema(table)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temporary = path + ".tmp"
+    rows = 0
+    result = connection.execute(
+        statement.execution_options(stream_results=True, max_row_buffer=ARCHIVE_ROW_GROUP_ROWS))
+    with pq.ParquetWriter(temporary, schema, compression=ARCHIVE_COMPRESSION) as writer:
+        for chunk in result.partitions(ARCHIVE_ROW_GROUP_ROWS):
+            arrays = [pa.array(_plain(values), type=field.type) for values, field in zip(zip(*chunk), schema)]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            rows += len(chunk)
+    with open(temporary, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(temporary, path)
+    return rows
+
+
+def _file_sum(path: str, column: str) -> int:
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    return pc.sum(pq.read_table(path, columns=[column])[column]).as_py() or 0
+
+
+class MonthSource(NamedTuple):
+    # Quoted relation to read from and what archiving does to it
+    relation: str
+    removal: str
+
+
+def _source(connection, table: ArchivedTable, month: date) -> Optional[MonthSource]:
+    quote = connection.dialect.identifier_preparer.quote
+    if table.partitioned is None:
+        return MonthSource(quote(table.name), "delete")
+    name = partition_name(table.name, month)
+    if any(partition.name == name for partition in partitions(connection, table.name)):
+        return MonthSource(quote(name), "detach")
+    if name in detached_partitions(connection, table.name):
+        return MonthSource(quote(name), "drop")
+    return None
+
+
+def closed_months(connection, table: ArchivedTable, before: date) -> List[date]:
+    """Months of ``table`` still in the database that end on or before ``before``."""
+    if table.partitioned is not None:
+        ensure_partitions(connection, table.partitioned)
+        attached = [partition.lower for partition in partitions(connection, table.name)
+                    if partition.upper is not None and partition.upper <= before]
+        detached = [date(int(name[-7:-3]), int(name[-2:]), 1) for name in detached_partitions(connection, table.name)]
+        return sorted(set(attached + [month for month in detached if add_months(month, 1) <= before]))
+    column = table.column(table.date)
+    month = func.date_trunc("month", column).cast(Date).label("month")
+    return connection.execute(
+        select(month).where(column < before).distinct().order_by(month)).scalars().all()
+
+
+def _entry_path(table: ArchivedTable, month: date, part: int) -> str:
+    return os.path.join(table.name, f"{month:%Y-%m}", f"part-{part}.parquet")
+
+
+def archive_month(engine, table: ArchivedTable, month: date) -> Optional[dict]:
+    """Move one month of ``table`` to a new archive file; returns its manifest entry."""
+    quote = engine.dialect.identifier_preparer.quote
+    manifest = load_manifest(fresh=True)
+    known = len(manifest["files"])
+    try:
+        entry = _archive_month(engine, table, month, manifest, quote)
+    except Exception:
+        # The transaction rolled back, so nothing left the database: forget the file
+        for entry in manifest["files"][known:]:
+            path = os.path.join(ARCHIVE_DIR, entry["path"])
+            if os.path.exists(path):
+                os.remove(path)
+        if len(manifest["files"]) > known:
+            del manifest["files"][known:]
+            save_manifest(manifest)
+        raise
+    if entry:
+        entry["state"] = ARCHIVED
+        save_manifest(manifest)
+    return entry
+
+
+def _archive_month(engine, table: ArchivedTable, month: date, manifest: dict, quote) -> Optional[dict]:
+    with engine.begin() as connection:
+        connection.execute(text("SELECT set_config('lock_timeout', :timeout, true)"),
+                           {"timeout": ARCHIVE_LOCK_TIMEOUT})
+        source = _source(connection, table, month)
+        if source is None:
+            return None
+        date_column, pk = quote(table.date), quote(table.pk)
+        in_month = f"{date_column} >= :lower AND {date_column} < :upper"
+        bounds = {"lower": month, "upper": add_months(month, 1)}
+        # Writes to the month wait until it is gone; reads carry on
+        connection.execute(text(f"LOCK TABLE {source.relation} IN SHARE MODE"))
+        stats = connection.execute(text(
+            f"SELECT count(*) AS rows, coalesce(sum({pk}), 0) AS id_sum, min({pk}) AS min_id, max({pk}) AS max_id, "
+            f"min({date_column}) AS min_date, max({date_column}) AS max_date "
+            f"FROM {source.relation} WHERE {in_month}"), bounds).one()
+        entry = None
+        if stats.rows:
+            part = sum(1 for existing in manifest["files"]
+                       if existing["table"] == table.name and existing["month"] == month.isoformat())
+            entry = {"table": table.name, "month": month.isoformat(), "path": _entry_path(table, month, part),
+                     "rows": stats.rows, "min_id": stats.min_id, "max_id": stats.max_id,
+                     "min_date": stats.min_date.isoformat(), "max_date": stats.max_date.isoformat(),
+                     "state": PENDING}
+            path = os.path.join(ARCHIVE_DIR, entry["path"])
+            columns = ", ".join(quote(name) for name in table.columns)
+            order = ", ".join(quote(name) for name in (table.vehicle, table.date, table.pk))
+            written = write_file(connection, table, text(
+                f"SELECT {columns} FROM {source.relation} WHERE {in_month} ORDER BY {order}").bindparams(**bounds),
+                path)
+            if written != stats.rows or _file_sum(path, table.pk) != stats.id_sum:
+                os.remove(path)
+                raise RuntimeError(f"{entry['path']} does not match {table.name} for {month:%Y-%m}")
+            entry["bytes"] = os.path.getsize(path)
+            entry["archived_at"] = datetime.now(timezone.utc).isoformat()
+            manifest["files"].append(entry)
+            save_manifest(manifest)
+
+        parent = quote(table.name)
+        if source.removal == "detach":
+            connection.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {source.relation}"))
+        if source.removal in ("detach", "drop"):
+            connection.execute(text(f"DROP TABLE {source.relation}"))
+        elif stats.rows:
+            # Archived, not deleted: keep the rows out of the change feed
+            connection.execute(text(f"ALTER TABLE {parent} DISABLE TRIGGER USER"))
+            connection.execute(text(f"DELETE FROM {parent} WHERE {in_month}"), bounds)
+            connection.execute(text(f"ALTER TABLE {parent} ENABLE TRIGGER USER"))
+        if stats.rows:
+            connection.execute(bump_statement([table.name]))
+    return entry
+
+
+def resolve_pending(engine) -> int:
+    """Settle entries left pending by an interrupted run; returns how many there were."""
+    manifest = load_manifest(fresh=True)
+    pending = [entry for entry in manifest["files"] if entry["state"] == PENDING]
+    if not pending:
+        return 0
+    with engine.connect() as connection:
+        for entry in pending:
+            table = next(table for table in ARCHIVED_TABLES.values() if table.name == entry["table"])
+            # The month's removal committed iff its rows are gone from the database
+            still_there = connection.execute(select(table.column(table.pk)).where(
+                table.column(table.pk) == entry["min_id"],
+                table.column(table.date) == date.fromisoformat(entry["min_date"]))).first()
+            if still_there:
+                path = os.path.join(ARCHIVE_DIR, entry["path"])
+                if os.path.exists(path):
+                    os.remove(path)
+                manifest["files"].remove(entry)
+            else:
+                entry["state"] = ARCHIVED
+    save_manifest(manifest)
+    return len(pending)
+
+
+def run(engine, before: Optional[date] = None, kinds: Sequence[str] = tuple(ARCHIVED_TABLES)) -> dict:
+    """Archive every closed month before ``before`` (by default the ARCHIVE_AFTER_MONTHS cutoff)."""
+    if before is None:
+        if ARCHIVE_AFTER_MONTHS <= 0:
+            return {"skipped": "ARCHIVE_AFTER_MONTHS is not set"}
+        before = add_months(month_start(date.today()), -ARCHIVE_AFTER_MONTHS)
+    with engine.connect() as lock:
+        # Session lock held across the per-month transactions
+        if not lock.execute(select(func.pg_try_advisory_lock(ARCHIVE_LOCK_KEY))).scalar():
+            return {"skipped": "another archive run is in progress"}
+        try:
+            report = {"resolved": resolve_pending(engine)}
+            for kind in kinds:
+                table = ARCHIVED_TABLES[kind]
+                with engine.begin() as connection:
+                    months = closed_months(connection, table, before)
+                entries = [archive_month(engine, table, month) for month in months]
+                report[kind] = {"months": len(months), "files": sum(1 for entry in entries if entry),
+                                "rows": sum(entry["rows"] for entry in entries if entry)}
+            return report
+        finally:
+            lock.execute(select(func.pg_advisory_unlock(ARCHIVE_LOCK_KEY)))
+            lock.commit()
+
+
+async def run_archiver(interval: float = ARCHIVE_INTERVAL_SECONDS):
+    from .database import engine
+    while True:
+        try:
+            result = await asyncio.to_thread(run, engine)
+            logger.info("Archive pass: %s", result)
+        except Exception:
+            logger.exception("Archive pass failed")
+        await asyncio.sleep(interval)
+
+
+def restore(engine, table: ArchivedTable, month: date) -> int:
+    """Load an archived month back into the database and forget its files; returns the rows restored."""
+    import pyarrow.parquet as pq
+    manifest = load_manifest(fresh=True)
+    entries = [entry for entry in manifest["files"]
+               if entry["table"] == table.name and entry["month"] == month.isoformat()]
+    restored = 0
+    quote = engine.dialect.identifier_preparer.quote
+    with engine.begin() as connection:
+        target = table.name
+        if table.partitioned is not None:
+            ensure_partitions(connection, table.partitioned, months=[month])
+            target = partition_name(table.name, month)
+        # Archiving did not report the rows as deleted, so restoring does not report them as inserted
+        connection.execute(text(f"ALTER TABLE {quote(target)} DISABLE TRIGGER USER"))
+        statement = table.model.__table__.insert()
+        for entry in entries:
+            parquet = pq.ParquetFile(os.path.join(ARCHIVE_DIR, entry["path"]))
+            for batch in parquet.iter_batches(batch_size=ARCHIVE_ROW_GROUP_ROWS):
+                rows = batch.to_pylist()
+                connection.execute(statement, rows)
+                restored += len(rows)
+        connection.execute(text(f"ALTER TABLE {quote(target)} ENABLE TRIGGER USER"))
+        if restored:
+            connection.execute(bump_statement([table.name]))
+    for entry in entries:
+        manifest["files"].remove(entry)
+    save_manifest(manifest)
+    for entry in entries:
+        os.remove(os.path.join(ARCHIVE_DIR, entry["path"]))
+    return restored
+
+
+# Reading
+
+
+def _filter(table: ArchivedTable, start_date, end_date, equals: dict, after):
+    import pyarrow.dataset as ds
+    conditions = []
+    if start_date:
+        conditions.append(ds.field(table.date) >= start_date)
+    if end_date:
+        conditions.append(ds.field(table.date) <= end_date)
+    for name, value in equals.items():
+        conditions.append(ds.field(name) == value)
+    if after:
+        after_date, after_id = after
+        conditions.append((ds.field(table.date) > after_date)
+                          | ((ds.field(table.date) == after_date) & (ds.field(table.pk) > after_id)))
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+
+def scan(table: ArchivedTable, columns: List[str], start_date: Optional[date] = None,
+         end_date: Optional[date] = None, equals: Optional[dict] = None,
+         after: Optional[Tuple[date, int]] = None, limit: Optional[int] = None) -> List[dict]:
+    """Archived rows of ``table`` in (date, id) order, with ``columns`` plus the date and id.
+
+    Blocking; months are scanned oldest first and the scan stops once
+    ``limit`` rows are found.
+    """
+    import pyarrow.dataset as ds
+    files = archived_files(table, after[0] if after and (not start_date or after[0] > start_date) else start_date,
+                           end_date)
+    if not files:
+        return []
+    by_month: Dict[str, List[str]] = {}
+    for entry in files:
+        by_month.setdefault(entry["month"], []).append(os.path.join(ARCHIVE_DIR, entry["path"]))
+    wanted = list(dict.fromkeys([*columns, table.date, table.pk]))
+    expression = _filter(table, start_date, end_date, equals or {}, after)
+    schema = arrow_schema(table)
+    rows: List[dict] = []
+    for month in sorted(by_month):
+        dataset = ds.dataset(by_month[month], format="parquet", schema=schema)
+        found = dataset.to_table(columns=wanted, filter=expression)
+        rows.extend(found.sort_by([(table.date, "ascending"), (table.pk, "ascending")]).to_pylist())
+        if limit and len(rows) >= limit:
+            break
+    return rows[:limit] if limit else rows
+
+
+def find(table: ArchivedTable, pk: int) -> Optional[dict]:
+    """The archived row with id ``pk``, if any. Blocking."""
+    import pyarrow.dataset as ds
+    files = archived_files(table, pk=pk)
+    if not files:
+        return None
+    dataset = ds.dataset([os.path.join(ARCHIVE_DIR, entry["path"]) for entry in files], format="parquet",
+                         schema=arrow_schema(table))
+    found = dataset.to_table(filter=ds.field(table.pk) == pk).to_pylist()
+    return found[0] if found else None
+
+
+async def find_archived(kind: str, pk: int) -> Optional[dict]:
+    """``find`` for the endpoints, off the event loop and only when a file may hold the row."""
+    table = ARCHIVED_TABLES[kind]
+    if not archived_files(table, pk=pk):
+        return None
+    return await asyncio.to_thread(find, table, pk)
+
+
+async def history(db, table: ArchivedTable, columns: List[str], start_date: Optional[date] = None,
+                  end_date: Optional[date] = None, equals: Optional[dict] = None,
+                  after: Optional[Tuple[date, int]] = None, limit: int = 1000) -> List[dict]:
+    """Rows of ``table`` from the database and the archive together, in (date, id) order."""
+    equals = equals or {}
+    date_column, pk = table.column(table.date), table.column(table.pk)
+    wanted = list(dict.fromkeys([*columns, table.date, table.pk]))
+    statement = select(*(table.column(name) for name in wanted)).where(
+        date_column.isnot(None), *(table.column(name) == value for name, value in equals.items()))
+    if start_date:
+        statement = statement.where(date_column >= start_date)
+    if end_date:
+        statement = statement.where(date_column <= end_date)
+    if after:
+        statement = statement.where(tuple_(date_column, pk) > after)
+    hot = [dict(row._mapping) for row in
+           (await db.execute(statement.order_by(date_column, pk).limit(limit))).all()]
+    for row in hot:
+        for name, value in row.items():
+            if isinstance(value, Enum):
+                row[name] = value.value
+    archived = await asyncio.to_thread(scan, table, columns, start_date, end_date, equals, after, limit) \
+        if archived_files(table, start_date, end_date) else []
+    # A back-dated row can sit in the database in an archived month, so merge
+    rows = sorted(hot + archived, key=lambda row: (row[table.date], row[table.pk]))[:limit]
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive closed months to Parquet, or restore them.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="archive closed months")
+    run_parser.add_argument("--before", help="archive months ending on or before this month (YYYY-MM), "
+                                             "instead of the ARCHIVE_AFTER_MONTHS cutoff")
+    run_parser.add_argument("--kinds", help=f"comma separated subset of {', '.join(ARCHIVED_TABLES)}")
+    restore_parser = commands.add_parser("restore", help="load an archived month back into the database")
+    restore_parser.add_argument("kind", choices=list(ARCHIVED_TABLES))
+    restore_parser.add_argument("month", help="YYYY-MM")
+    commands.add_parser("status", help="list the archived files")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from .database import engine
+    if args.command == "run":
+        before = datetime.strptime(args.before, "%Y-%m").date() if args.before else None
+        kinds = [parse_kind(kind.strip()).kind for kind in args.kinds.split(",")] if args.kinds \
+            else list(ARCHIVED_TABLES)
+        print(run(engine, before, kinds))
+    elif args.command == "restore":
+        month = datetime.strptime(args.month, "%Y-%m").date()
+        print(f"Restored {restore(engine, ARCHIVED_TABLES[args.kind], month)} rows")
+    else:
+        for entry in load_manifest()["files"]:
+            print(f"{entry['table']:<16} {entry['month'][:7]}  {entry['state']:<8} {entry['rows']:>10} rows "
+                  f"{entry.get('bytes', 0) / 2 ** 20:>8.1f} MiB  {entry['path']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+import json
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Type
+
+from fastapi import HTTPException, Request
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import insert, select
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .events import EVENT_MODELS, queue_event
+
+# Set-based ingestion for the nightly telematics/logbook imports. Rows are
+# validated individually, reference checks run once per batch and valid rows
+# are written with one multi-row INSERT ... RETURNING, so a bad row is
+# reported without rejecting its neighbours. The INSERT bypasses the unit of
+# work, so push events for the new rows are queued here rather than by the
+# after_flush hook in events.py.
+
+BULK_BATCH_SIZE = 1000
+
+# (row index, decoded JSON value, parse error)
+PayloadRow = Tuple[int, Optional[object], Optional[str]]
+
+
+@dataclass
+class BulkSpec:
+    model: type
+    schema: Type[BaseModel]
+    pk: str
+    # payload field -> (referenced model, its primary key attribute)
+    references: Dict[str, Tuple[type, str]] = field(default_factory=dict)
+    # Called with the inserted rows (payload values plus the new key) before
+    # the batch commits, for bookkeeping that must share its transaction
+    after_insert: Optional[Callable[[AsyncSession, List[dict]], Awaitable]] = None
+
+
+@dataclass
+class BulkReport:
+    received: int = 0
+    inserted: int = 0
+    ids: List[int] = field(default_factory=list)
+    errors: List[dict] = field(default_factory=list)
+
+    def fail(self, row: int, detail):
+        self.errors.append({"row": row, "detail": detail})
+
+    def as_dict(self) -> dict:
+        return {"received": self.received, "inserted": self.inserted,
+                "failed": len(self.errors), "ids": self.ids,
+                "errors": sorted(self.errors, key=lambda e: e["row"])}
+
+
+async def read_rows(request: Request) -> AsyncIterator[PayloadRow]:
+    """Decode a JSON array or an NDJSON stream from the request body.
+
+    NDJSON is read incrementally so a large import never has to be held in
+    memory as one document; a JSON array has to be parsed whole.
+    """
+    content_type = request.headers.get("content-type", "")
+    if "ndjson" in content_type or "jsonl" in content_type:
+        index, buffer = 0, b""
+        async for chunk in request.stream():
+            buffer += chunk
+            *lines, buffer = buffer.split(b"\n")
+            for line in lines:
+                if line.strip():
+                    yield _decode_line(index, line)
+                    index += 1
+        if buffer.strip():
+            yield _decode_line(index, buffer)
+        return
+
+    try:
+        payload = json.loads(await request.body())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid JSON body: {e}")
+    if not isinstance(payload, list):
+        raise HTTPException(
+            status_code=400, detail="Expected a JSON array or an NDJSON stream")
+    for index, value in enumerate(payload):
+        yield index, value, None
+
+
+def _decode_line(index: int, line: bytes) -> PayloadRow:
+    try:
+        return index, json.loads(line), None
+    except ValueError as e:
+        return index, None, f"Invalid JSON: {e}"
+
+
+async def ingest(db: AsyncSession, spec: BulkSpec, rows: AsyncIterator[PayloadRow]) -> dict:
+    report = BulkReport()
+    batch: List[Tuple[int, dict]] = []
+    async for index, value, error in rows:
+        report.received += 1
+        if error:
+            report.fail(index, error)
+            continue
+        try:
+            item = spec.schema.model_validate(value)
+        except ValidationError as e:
+            report.fail(index, e.errors(include_url=False, include_context=False))
+            continue
+        batch.append((index, item.model_dump()))
+        if len(batch) >= BULK_BATCH_SIZE:
+            await _flush(db, spec, batch, report)
+            batch = []
+    if batch:
+        await _flush(db, spec, batch, report)
+    return report.as_dict()
+
+
+async def _existing_ids(db: AsyncSession, batch, field_name: str, model, pk: str) -> set:
+    wanted = {values[field_name] for _, values in batch if values.get(field_name) is not None}
+    if not wanted:
+        return set()
+    column = getattr(model, pk)
+    return set((await db.scalars(select(column).where(column.in_(wanted)))).all())
+
+
+def _queue_created(db: AsyncSession, spec: BulkSpec, rows: List[dict]):
+    target = EVENT_MODELS.get(spec.model)
+    if target is None:
+        return
+    kind, schema = target
+    for row in rows:
+        queue_event(db, kind, "created", schema.model_validate(row).model_dump(mode="json"),
+                    row.get("vehicle_id"), row.get("user_id"))
+
+
+async def _flush(db: AsyncSession, spec: BulkSpec, batch, report: BulkReport):
+    existing = {
+        field_name: await _existing_ids(db, batch, field_name, model, pk)
+        for field_name, (model, pk) in spec.references.items()
+    }
+    valid = []
+    for index, values in batch:
+        missing = [
+            f"{model.__name__} with ID {values[field_name]} not found"
+            for field_name, (model, _) in spec.references.items()
+            if values.get(field_name) is not None and values[field_name] not in existing[field_name]
+        ]
+        if missing:
+            report.fail(index, missing)
+        else:
+            valid.append((index, values))
+    if not valid:
+        return
+
+    statement = insert(spec.model).returning(
+        getattr(spec.model, spec.pk), sort_by_parameter_order=True)
+    try:
+        ids = (await db.scalars(statement, [values for _, values in valid])).all()
+        inserted = [{**values, spec.pk: pk} for (_, values), pk in zip(valid, ids)]
+        if spec.after_insert:
+            await spec.after_insert(db, inserted)
+        _queue_created(db, spec, inserted)
+        await db.commit()
+    except DBAPIError:
+        # Something slipped past validation (e.g. a row deleted between the
+        # reference check and the insert). Retry row by row so only the
+        # offending rows are reported.
+        await db.rollback()
+        ids = await _insert_individually(db, spec, valid, report)
+    report.ids.extend(ids)
+    report.inserted += len(ids)
+
+
+async def _insert_individually(db: AsyncSession, spec: BulkSpec, valid, report: BulkReport) -> List[int]:
+    ids, inserted = [], []
+    statement = insert(spec.model).returning(getattr(spec.model, spec.pk))
+    for index, values in valid:
+        try:
+            async with db.begin_nested():
+                pk = await db.scalar(statement, values)
+                if spec.after_insert:
+                    await spec.after_insert(db, [{**values, spec.pk: pk}])
+            ids.append(pk)
+            inserted.append({**values, spec.pk: pk})
+        except DBAPIError as e:
+            report.fail(index, str(e.orig))
+    _queue_created(db, spec, inserted)
+    await db.commit()
+    return ids
@@ -0,0 +1,238 @@
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Optional
+
+# Read-through cache for hot reference rows (vehicles, users). Entries are
+# plain JSON-safe dicts, never ORM objects, so they outlive the session that
+# loaded them. Each RecordCache has an in-process LRU with a TTL in front of
+# an optional shared backend; writers invalidate the affected keys after
+# commit. The local TTL bounds how long another worker process can serve a
+# row that was changed elsewhere.
+
+# "memory" (in-process only), "redis" (in-process plus shared) or "off"
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "10000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "30"))
+CACHE_SHARED_TTL_SECONDS = float(os.getenv("CACHE_SHARED_TTL_SECONDS", "300"))
+# memory:// swaps Redis for an in-process stand-in with the same interface
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL", "redis://redis:6379/0")
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        lookups = self.hits + self.shared_hits + self.misses
+        return {
+            "hits": self.hits,
+            "shared_hits": self.shared_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.shared_hits) / lookups, 4) if lookups else None,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "invalidations": self.invalidations,
+        }
+
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe in-process LRU whose entries expire ``ttl`` seconds after being set."""
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL_SECONDS,
+                 stats: Optional[CacheStats] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.stats = stats or CacheStats()
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return _MISSING
+            value, expires = entry
+            if expires <= time.monotonic():
+                del self._entries[key]
+                self.stats.incr("expirations")
+                return _MISSING
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats.incr("evictions")
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SharedBackend:
+    """Cache store shared between worker processes; values are bytes."""
+
+    async def get(self, key: str) -> Optional[bytes]:
+        raise NotImplementedError
+
+    async def set(self, key: str, value: bytes, ttl: float):
+        raise NotImplementedError
+
+    async def delete(self, *keys: str):
+        raise NotImplementedError
+
+
+class MemoryBackend(SharedBackend):
+    """Local stand-in for a shared backend, e.g. for development without Redis."""
+
+    def __init__(self):
+        self._entries = {}
+
+    async def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[1] <= time.monotonic():
+            self._entries.pop(key, None)
+            return None
+        return entry[0]
+
+    async def set(self, key, value, ttl):
+        self._entries[key] = (value, time.monotonic() + ttl)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self._entries.pop(key, None)
+
+
+class RedisBackend(SharedBackend):
+    def __init__(self, url: str = CACHE_REDIS_URL):
+        try:
+            import redis.asyncio as redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' package") from e
+        self._client = redis.from_url(url)
+
+    async def get(self, key):
+        return await self._client.get(key)
+
+    async def set(self, key, value, ttl):
+        await self._client.set(key, value, px=int(ttl * 1000))
+
+    async def delete(self, *keys):
+        if keys:
+            await self._client.delete(*keys)
+
+
+class RecordCache:
+    """Read-through cache of one record type, keyed by primary key.
+
+    Loaders return a JSON-safe dict, or None when the row does not exist;
+    missing rows are not cached, so a later insert needs no invalidation.
+    """
+
+    def __init__(self, name: str, local: Optional[LRUCache] = None,
+                 shared: Optional[SharedBackend] = None,
+                 shared_ttl: float = CACHE_SHARED_TTL_SECONDS):
+        self.name = name
+        self.stats = local.stats if local is not None else CacheStats()
+        self.local = local
+        self.shared = shared
+        self.shared_ttl = shared_ttl
+        # Invalidation sequence per key, so a load that raced with a write
+        # (read the old row, then the writer invalidated) is not cached.
+        # Entries are dropped after the local TTL: a load slower than that
+        # could cache a stale row, but only for as long as the TTL allows.
+        self._sequence = 0
+        self._invalidated = OrderedDict()
+        self._forget_after = local.ttl if local is not None else CACHE_TTL_SECONDS
+
+    def _shared_key(self, key) -> str:
+        return f"vms:{self.name}:{key}"
+
+    async def get(self, key, loader: Callable[[], Awaitable[Optional[dict]]]) -> Optional[dict]:
+        if self.local is not None:
+            value = self.local.get(key)
+            if value is not _MISSING:
+                self.stats.incr("hits")
+                return value
+        if self.shared is not None:
+            data = await self.shared.get(self._shared_key(key))
+            if data is not None:
+                self.stats.incr("shared_hits")
+                value = json.loads(data)
+                if self.local is not None:
+                    self.local.set(key, value)
+                return value
+        self.stats.incr("misses")
+        started = self._sequence
+        value = await loader()
+        if value is not None and self._invalidated.get(key, (-1,))[0] <= started:
+            await self.put(key, value)
+        return value
+
+    async def put(self, key, value: dict):
+        if self.local is not None:
+            self.local.set(key, value)
+        if self.shared is not None:
+            await self.shared.set(self._shared_key(key), json.dumps(value).encode(), self.shared_ttl)
+
+    async def invalidate(self, *keys):
+        now = time.monotonic()
+        for key in keys:
+            self._sequence += 1
+            self._invalidated[key] = (self._sequence, now)
+            self._invalidated.move_to_end(key)
+            if self.local is not None:
+                self.local.delete(key)
+            self.stats.incr("invalidations")
+        while self._invalidated and next(iter(self._invalidated.values()))[1] < now - self._forget_after:
+            self._invalidated.popitem(last=False)
+        if self.shared is not None:
+            await self.shared.delete(*(self._shared_key(key) for key in keys))
+
+    def snapshot(self) -> dict:
+        return {
+            "backend": CACHE_BACKEND,
+            "entries": len(self.local) if self.local is not None else 0,
+            **self.stats.snapshot(),
+        }
+
+
+def build_record_cache(name: str, backend: str = CACHE_BACKEND) -> RecordCache:
+    if backend == "off":
+        return RecordCache(name)
+    if backend == "memory":
+        return RecordCache(name, LRUCache())
+    if backend == "redis":
+        shared = MemoryBackend() if CACHE_REDIS_URL == "memory://" else RedisBackend(CACHE_REDIS_URL)
+        return RecordCache(name, LRUCache(), shared)
+    raise ValueError(f"Unknown CACHE_BACKEND {backend!r}; expected memory, redis or off")
+
+
+vehicle_cache = build_record_cache("vehicle")
+user_cache = build_record_cache("user")
@@ -0,0 +1,138 @@
+from sqlalchemy import bindparam, select, text, tuple_
+
+from .loading import loader_options
+from .models import ChangeLog, Inspection, ServiceHistory, ServiceNotification, Trip, User, Vehicle
+from .pagination import decode_cursor, encode_cursor
+from .schemas import (InspectionResponse, ServiceHistoryResponse, ServiceNotificationResponse,
+                      TripResponse, UserResponse, VehicleResponse)
+
+# Incremental change feed. Row-level triggers append every insert, update
+# and delete on the synced tables to change_log, so hard deletes and writes
+# made outside the API are captured too.
+#
+# Entries are read in (txid, id) order and only from transactions older than
+# the oldest one still running. Ids are handed out before commit, so a plain
+# id cursor could step past an entry whose transaction commits late; this
+# way a cursor never skips anything, at the cost of holding the feed back
+# while a long transaction is open.
+
+# feed name -> (model, primary key attribute, response schema)
+CHANGE_FEEDS = {
+    "vehicle": (Vehicle, "id", VehicleResponse),
+    "user": (User, "user_id", UserResponse),
+    "trip": (Trip, "trip_id", TripResponse),
+    "inspection": (Inspection, "inspection_id", InspectionResponse),
+    "service_notification": (ServiceNotification, "notification_id", ServiceNotificationResponse),
+    "service_history": (ServiceHistory, "service_id", ServiceHistoryResponse),
+}
+FEED_BY_TABLE = {model.__table__.name: name for name, (model, _pk, _schema) in CHANGE_FEEDS.items()}
+
+# Larger than any change_log id, for cursors that only mark a transaction horizon
+_MAX_ID = 2 ** 62
+
+CHANGE_FUNCTION = text("""
+CREATE OR REPLACE FUNCTION vms_log_change() RETURNS trigger LANGUAGE plpgsql AS $$
+DECLARE
+    changed jsonb;
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        changed := to_jsonb(OLD);
+    ELSE
+        changed := to_jsonb(NEW);
+    END IF;
+    -- TG_TABLE_NAME would name the partition on a partitioned table
+    INSERT INTO change_log (table_name, row_id, op)
+    VALUES (coalesce(TG_ARGV[1], TG_TABLE_NAME), (changed ->> TG_ARGV[0])::integer, lower(TG_OP));
+    RETURN NULL;
+END
+$$
+""")
+
+HORIZON = text("SELECT (pg_snapshot_xmin(pg_current_snapshot())::text)::bigint")
+
+
+def ensure_change_triggers(connection):
+    """Install the change_log triggers on any synced table that lacks them."""
+    existing = set(connection.execute(text(
+        "SELECT tgrelid::regclass::text || '/' || tgname FROM pg_trigger "
+        "WHERE tgname IN ('vms_change_log', 'vms_change_log_update')")).scalars())
+    missing = []
+    for model, pk, _schema in CHANGE_FEEDS.values():
+        table_name = model.__table__.name
+        table = connection.dialect.identifier_preparer.quote(table_name)
+        for name, events, condition in (
+                ("vms_change_log", "INSERT OR DELETE", ""),
+                # Updates that leave the row unchanged are not changes
+                ("vms_change_log_update", "UPDATE", "WHEN (OLD.* IS DISTINCT FROM NEW.*) ")):
+            if f"{table}/{name}" not in existing:
+                missing.append(f"CREATE TRIGGER {name} AFTER {events} ON {table} FOR EACH ROW "
+                               f"{condition}EXECUTE FUNCTION vms_log_change('{pk}', '{table_name}')")
+    if missing:
+        connection.execute(CHANGE_FUNCTION)
+        for statement in missing:
+            connection.execute(text(statement))
+
+
+def parse_feeds(tables):
+    """Comma separated feed names, or all of them; raises ValueError on unknown names."""
+    if not tables:
+        return tuple(CHANGE_FEEDS)
+    requested = tuple(dict.fromkeys(name.strip() for name in tables.split(",") if name.strip()))
+    unknown = [name for name in requested if name not in CHANGE_FEEDS]
+    if unknown or not requested:
+        raise ValueError(f"Unknown tables: {', '.join(unknown)}; expected {', '.join(CHANGE_FEEDS)}")
+    return requested
+
+
+async def _current_rows(db, feed, ids) -> dict:
+    model, pk, schema = CHANGE_FEEDS[feed]
+    rows = (await db.scalars(
+        select(model).options(*loader_options(model, schema)).where(getattr(model, pk).in_(ids)))).all()
+    return {getattr(row, pk): schema.model_validate(row).model_dump(mode="json") for row in rows}
+
+
+async def read_changes(db, since, feeds, limit: int) -> dict:
+    """One page of the feed after the ``since`` cursor.
+
+    ``since`` may be None to replay the whole log, or "latest" to only get a
+    cursor for the present, e.g. right before a full reload. Inserts and
+    updates carry the row as it is now (null if deleted since; the delete
+    follows later in the feed).
+    """
+    horizon = await db.scalar(HORIZON)
+    if since == "latest":
+        return {"changes": [], "next_cursor": encode_cursor(horizon - 1, _MAX_ID), "has_more": False}
+
+    statement = select(ChangeLog).where(
+        ChangeLog.txid < bindparam("horizon", horizon),
+        ChangeLog.table_name.in_([CHANGE_FEEDS[feed][0].__table__.name for feed in feeds]))
+    if since:
+        txid, change_id = decode_cursor(since)
+        statement = statement.where(tuple_(ChangeLog.txid, ChangeLog.id) > (txid, change_id))
+    entries = (await db.scalars(statement.order_by(ChangeLog.txid, ChangeLog.id).limit(limit + 1))).all()
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    ids_by_feed = {}
+    for entry in entries:
+        if entry.op != "delete":
+            ids_by_feed.setdefault(FEED_BY_TABLE[entry.table_name], set()).add(entry.row_id)
+    rows = {feed: await _current_rows(db, feed, ids) for feed, ids in ids_by_feed.items()}
+
+    if has_more:
+        next_cursor = encode_cursor(entries[-1].txid, entries[-1].id)
+    else:
+        # Everything before the horizon has been returned, so the cursor can
+        # move up to it even if the filtered page was short or empty
+        next_cursor = encode_cursor(horizon - 1, _MAX_ID)
+    changes = []
+    for entry in entries:
+        feed = FEED_BY_TABLE[entry.table_name]
+        changes.append({
+            "table": feed,
+            "id": entry.row_id,
+            "op": entry.op,
+            "changed_at": entry.changed_at,
+            "data": None if entry.op == "delete" else rows[feed].get(entry.row_id),
+        })
+    return {"changes": changes, "next_cursor": next_cursor, "has_more": has_more}
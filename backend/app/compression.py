@@ -0,0 +1,78 @@
+import os
+
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import (DEFAULT_EXCLUDED_CONTENT_TYPES, GZipMiddleware, GZipResponder,
+                                       IdentityResponder)
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Negotiated response compression. Brotli is preferred when the client
+# accepts it and the package is installed, then gzip. Bodies under
+# COMPRESSION_MIN_SIZE go out as is, and event streams are never buffered.
+# Levels are kept moderate: past them the CPU cost grows much faster than
+# the size shrinks.
+
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+# Already compressed formats; recompressing them costs CPU and saves nothing
+EXCLUDED_CONTENT_TYPES = DEFAULT_EXCLUDED_CONTENT_TYPES + (
+    "application/pdf", "application/zip", "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "4"))
+
+
+def accepted_encodings(accept_encoding: str) -> set:
+    """Codings the client accepts, honouring q=0 exclusions."""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, _, params = part.strip().partition(";")
+        quality = params.strip()
+        if quality.startswith("q="):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip())
+    return accepted
+
+
+class BrotliResponder(IdentityResponder):
+    content_encoding = "br"
+
+    def __init__(self, app, minimum_size: int, quality: int = BROTLI_QUALITY, **kwargs):
+        super().__init__(app, minimum_size, **kwargs)
+        self.quality = quality
+        self._compressor = None
+
+    async def apply_compression(self, body: bytes, *, more_body: bool) -> bytes:
+        if self._compressor is None:
+            self._compressor = brotli.Compressor(quality=self.quality)
+        compressed = self._compressor.process(body)
+        return compressed + (self._compressor.flush() if more_body else self._compressor.finish())
+
+
+class CompressionMiddleware(GZipMiddleware):
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_SIZE, gzip_level: int = GZIP_LEVEL,
+                 brotli_quality: int = BROTLI_QUALITY):
+        super().__init__(app, minimum_size=minimum_size, compresslevel=gzip_level,
+                         exclude_content_types=EXCLUDED_CONTENT_TYPES)
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accepted = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        options = {"exclude_content_types": self.exclude_content_types}
+        if brotli is not None and "br" in accepted:
+            responder = BrotliResponder(self.app, self.minimum_size, self.brotli_quality, **options)
+        elif "gzip" in accepted:
+            responder = GZipResponder(self.app, self.minimum_size, compresslevel=self.compresslevel,
+                                      thread_minimum_size=self.thread_minimum_size, **options)
+        else:
+            responder = IdentityResponder(self.app, self.minimum_size, **options)
+        await responder(scope, receive, send)
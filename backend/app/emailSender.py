@@ -1,53 +1,227 @@
+import base64
+from contextlib import contextmanager
 from email.message import EmailMessage
-from email.mime.base import MIMEBase
-from email import encoders
+from email.header import Header
+from email.utils import formatdate, make_msgid
+import logging
+import mimetypes
 import os
+import queue
 import smtplib
+import threading
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-EMAIL_HOST = os.getenv("EMAIL_HOST")
-EMAIL_PORT = os.getenv("EMAIL_PORT")
-EMAIL_USER = os.getenv("EMAIL_USER")
-EMAIL_PASS = os.getenv("EMAIL_PASS")
+logger = logging.getLogger(__name__)
 
-def send_email(to_email, subject, message, attachment=None):
-    try:
-        smtp_server = os.getenv("EMAIL_HOST")
-        smtp_port = int(os.getenv("EMAIL_PORT"))
-        smtp_user = os.getenv("EMAIL_USER")
-        smtp_password = os.getenv("EMAIL_PASS")
-
-        # Create the email message
-        msg = EmailMessage()
-        msg["Subject"] = subject
-        msg["From"] = smtp_user
-        msg["To"] = to_email
-
-        # Set the email content
-        msg.set_content(message)
-
-        # If an attachment is provided, make the message multipart
-        if attachment:
-            # Change the message to multipart
-            msg.add_alternative(message, subtype='plain')  # Add plain text alternative
-            with open(attachment, "rb") as att:
-                part = MIMEBase("application", "octet-stream")
-                part.set_payload(att.read())
-                encoders.encode_base64(part)
-                part.add_header("Content-Disposition", f"attachment; filename={os.path.basename(attachment)}")
-                msg.attach(part)
-
-        # Send the email
-        with smtplib.SMTP(smtp_server, smtp_port) as server:
-            server.ehlo()
+# Local stand-in servers (e.g. aiosmtpd) usually speak plain SMTP
+EMAIL_USE_TLS = os.getenv("EMAIL_USE_TLS", "true").lower() in ("1", "true", "yes")
+# Number of SMTP sessions kept open, which also bounds concurrent sends
+EMAIL_POOL_SIZE = int(os.getenv("EMAIL_POOL_SIZE", "4"))
+
+
+class SMTPConnectionPool:
+    """Reuses logged-in SMTP sessions instead of connecting per message.
+
+    At most ``size`` sessions exist at once; callers wait for a free one.
+    Sessions idle for longer than ``idle_check`` seconds are probed with
+    NOOP before reuse, and broken sessions are dropped and replaced.
+    """
+
+    def __init__(self, host, port, user=None, password=None, size=EMAIL_POOL_SIZE,
+                 use_tls=EMAIL_USE_TLS, timeout=30, idle_check=30):
+        self.host = host
+        self.port = int(port)
+        self.user = user
+        self.password = password
+        self.size = size
+        self.use_tls = use_tls
+        self.timeout = timeout
+        self.idle_check = idle_check
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+
+    def _connect(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        server.ehlo()
+        if self.use_tls:
             server.starttls()  # Start TLS for security
             server.ehlo()
-            server.login(smtp_user, smtp_password)
-            server.send_message(msg)
+        if self.user:
+            server.login(self.user, self.password)
+        return server
+
+    def _checkout(self):
+        while True:
+            try:
+                server, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if time.monotonic() - last_used < self.idle_check:
+                return server
+            try:
+                if server.noop()[0] == 250:
+                    return server
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._discard(server)
+
+    @staticmethod
+    def _discard(server):
+        try:
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
+
+    @contextmanager
+    def connection(self):
+        with self._slots:
+            server = self._checkout()
+            try:
+                yield server
+            except (smtplib.SMTPServerDisconnected, OSError):
+                self._discard(server)
+                raise
+            except smtplib.SMTPException:
+                # A rejected message leaves the session usable, but reset it
+                try:
+                    server.rset()
+                except (smtplib.SMTPException, OSError):
+                    self._discard(server)
+                    raise
+                self._idle.put((server, time.monotonic()))
+                raise
+            else:
+                self._idle.put((server, time.monotonic()))
+
+    def close(self):
+        while True:
+            try:
+                server, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(server)
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+
+def smtp_configured():
+    return bool(os.getenv("EMAIL_HOST") and os.getenv("EMAIL_PORT"))
+
+
+def get_default_pool():
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = SMTPConnectionPool(
+                os.getenv("EMAIL_HOST"), os.getenv("EMAIL_PORT"),
+                os.getenv("EMAIL_USER"), os.getenv("EMAIL_PASS"))
+        return _default_pool
+
 
-        print(f"Sent email to {to_email}")
-    except Exception as e:
-        print(f"Error sending email to {to_email}: {e}")
+def sender_address():
+    # EMAIL_FROM covers servers that need no login, e.g. a local relay
+    return os.getenv("EMAIL_FROM") or os.getenv("EMAIL_USER")
+
+
+def build_message(to_email, subject, message):
+    sender = sender_address()
+
+    # Create the email message
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = sender
+    msg["To"] = to_email
+
+    # Set the email content
+    msg.set_content(message)
+    return msg
+
+
+# 57 input bytes encode to one 76 character base64 line
+ATTACHMENT_READ_SIZE = 57 * 1024
+
+
+def _base64_lines(data):
+    return base64.encodebytes(data).replace(b"\n", b"\r\n")
+
+
+def send_with_attachment(server, to_email, subject, message, attachment):
+    """Send a multipart message, streaming the attachment from disk.
+
+    The attachment is read and base64 encoded chunk by chunk straight onto
+    the SMTP connection, so memory use does not grow with the file size.
+    Base64 output never contains '.', so only the headers and text part
+    need SMTP dot-stuffing.
+    """
+    sender = sender_address()
+    recipients = [address.strip() for address in to_email.split(",") if address.strip()]
+    boundary = make_msgid(domain="vms").strip("<>").replace("@", "=_")
+    filename = os.path.basename(attachment)
+    content_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    head = (
+        f"From: {sender}\r\n"
+        f"To: {to_email}\r\n"
+        f"Subject: {subject if subject.isascii() else Header(subject, 'utf-8').encode()}\r\n"
+        f"Date: {formatdate(localtime=True)}\r\n"
+        f"Message-ID: {make_msgid()}\r\n"
+        "MIME-Version: 1.0\r\n"
+        f'Content-Type: multipart/mixed; boundary="{boundary}"\r\n'
+        "\r\n"
+        f"--{boundary}\r\n"
+        'Content-Type: text/plain; charset="utf-8"\r\n'
+        "Content-Transfer-Encoding: base64\r\n"
+        "\r\n"
+    ).encode() + _base64_lines(message.encode("utf-8")) + (
+        f"--{boundary}\r\n"
+        f'Content-Type: {content_type}; name="{filename}"\r\n'
+        f'Content-Disposition: attachment; filename="{filename}"\r\n'
+        "Content-Transfer-Encoding: base64\r\n"
+        "\r\n"
+    ).encode()
+
+    server.ehlo_or_helo_if_needed()
+    code, response = server.mail(sender)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, response, sender)
+    for recipient in recipients:
+        code, response = server.rcpt(recipient)
+        if code not in (250, 251):
+            raise smtplib.SMTPRecipientsRefused({recipient: (code, response)})
+    code, response = server.docmd("data")
+    if code != 354:
+        raise smtplib.SMTPDataError(code, response)
+    server.send(head.replace(b"\r\n.", b"\r\n.."))
+    with open(attachment, "rb") as att:
+        while True:
+            chunk = att.read(ATTACHMENT_READ_SIZE)
+            if not chunk:
+                break
+            server.send(_base64_lines(chunk))
+    server.send(f"--{boundary}--\r\n.\r\n".encode())
+    code, response = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, response)
+
+
+def deliver(server, to_email, subject, message, attachment=None):
+    if attachment:
+        send_with_attachment(server, to_email, subject, message, attachment)
+    else:
+        server.send_message(build_message(to_email, subject, message))
+
+
+def send_email(to_email, subject, message, attachment=None):
+    # Blocking; request handlers should use outbox.enqueue_email instead
+    try:
+        with get_default_pool().connection() as server:
+            deliver(server, to_email, subject, message, attachment)
+    except Exception:
+        logger.exception("Error sending email to %s", to_email)
+        raise
+    logger.info("Sent email to %s", to_email)
@@ -0,0 +1,258 @@
+import asyncio
+import json
+import logging
+import os
+from typing import Optional
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import Session
+
+from .models import Inspection, ServiceNotification, Trip
+from .schemas import InspectionResponse, ServiceNotificationResponse, TripResponse
+
+# Push channel for trip, inspection and service notification changes.
+# Session events collect what a transaction wrote, the same way the table
+# version counters do, and the events are published only once it commits.
+# With EVENTS_BACKEND=postgres they go out through NOTIFY inside the commit
+# and every worker relays them from a LISTEN connection, so a subscriber sees
+# writes made by any process. Each subscriber has a bounded queue; one that
+# falls behind is sent an "overflow" event and disconnected, and resyncs
+# through /api/changes.
+
+logger = logging.getLogger(__name__)
+
+# "memory" (this process only) or "postgres" (LISTEN/NOTIFY across workers)
+EVENTS_BACKEND = os.getenv("EVENTS_BACKEND", "memory")
+EVENTS_CHANNEL = os.getenv("EVENTS_CHANNEL", "vms_events")
+EVENTS_QUEUE_SIZE = int(os.getenv("EVENTS_QUEUE_SIZE", "100"))
+EVENTS_HEARTBEAT_SECONDS = float(os.getenv("EVENTS_HEARTBEAT_SECONDS", "15"))
+EVENTS_RETRY_MS = int(os.getenv("EVENTS_RETRY_MS", "3000"))
+
+# model -> (event type, schema for the event data)
+EVENT_MODELS = {
+    Trip: ("trip", TripResponse),
+    Inspection: ("inspection", InspectionResponse),
+    ServiceNotification: ("service_notification", ServiceNotificationResponse),
+}
+EVENT_TYPES = tuple(kind for kind, _schema in EVENT_MODELS.values())
+
+# NOTIFY payloads must stay under 8000 bytes; larger events are sent without data
+NOTIFY_PAYLOAD_LIMIT = 7900
+
+_PENDING_KEY = "pending_events"
+_COMMITTING_KEY = "committing_events"
+
+
+def parse_event_types(types: Optional[str]) -> tuple:
+    if not types:
+        return EVENT_TYPES
+    requested = tuple(dict.fromkeys(name.strip() for name in types.split(",") if name.strip()))
+    unknown = [name for name in requested if name not in EVENT_TYPES]
+    if unknown or not requested:
+        raise ValueError(f"Unknown types: {', '.join(unknown)}; expected {', '.join(EVENT_TYPES)}")
+    return requested
+
+
+def queue_event(session, kind: str, action: str, data: Optional[dict] = None,
+                vehicle_id: Optional[int] = None, user_id: Optional[int] = None):
+    """Publish an event when ``session`` commits; for writes the flush does not see."""
+    session.info.setdefault(_PENDING_KEY, []).append({
+        "type": kind, "action": action, "vehicle_id": vehicle_id, "user_id": user_id, "data": data})
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flushed_events(session, flush_context):
+    for objects, action in ((session.new, "created"), (session.dirty, "updated"),
+                            (session.deleted, "deleted")):
+        for obj in objects:
+            target = EVENT_MODELS.get(type(obj))
+            if target is None:
+                continue
+            if action == "updated" and not session.is_modified(obj, include_collections=False):
+                continue
+            kind, schema = target
+            queue_event(session, kind, action, schema.model_validate(obj).model_dump(mode="json"),
+                        obj.vehicle_id, getattr(obj, "user_id", None))
+
+
+def _notify_payload(item: dict) -> str:
+    payload = json.dumps(item, separators=(",", ":"))
+    if len(payload.encode()) > NOTIFY_PAYLOAD_LIMIT:
+        payload = json.dumps({**item, "data": None}, separators=(",", ":"))
+    return payload
+
+
+_NOTIFY = text("SELECT pg_notify(:channel, payload) FROM unnest(CAST(:payloads AS text[])) AS payload")
+
+
+@event.listens_for(Session, "before_commit")
+def _send_events(session):
+    if session.in_nested_transaction():
+        return
+    session.flush()
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    if EVENTS_BACKEND == "postgres":
+        # Delivered by Postgres when, and only if, the transaction commits
+        session.execute(_NOTIFY, {"channel": EVENTS_CHANNEL,
+                                  "payloads": [_notify_payload(item) for item in pending]})
+    else:
+        session.info[_COMMITTING_KEY] = pending
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_committed(session):
+    committed = session.info.pop(_COMMITTING_KEY, None)
+    if committed:
+        broadcaster.publish(committed)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_events(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_PENDING_KEY, None)
+        session.info.pop(_COMMITTING_KEY, None)
+
+
+class Subscription:
+    def __init__(self, types, vehicle_id: Optional[int], user_id: Optional[int], queue_size: int):
+        self.types = frozenset(types)
+        self.vehicle_id = vehicle_id
+        self.user_id = user_id
+        self.queue = asyncio.Queue(queue_size)
+        self.overflowed = False
+
+    def matches(self, item: dict) -> bool:
+        return (item["type"] in self.types
+                and (self.vehicle_id is None or item.get("vehicle_id") == self.vehicle_id)
+                and (self.user_id is None or item.get("user_id") == self.user_id))
+
+
+class Broadcaster:
+    """Fans events out to the subscribers of this process.
+
+    publish may be called from any thread (the scheduler commits in one);
+    delivery always happens on the event loop the subscribers live on.
+    """
+
+    def __init__(self, queue_size: int = EVENTS_QUEUE_SIZE):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._loop = None
+        self.published = 0
+        self.delivered = 0
+        self.overflowed = 0
+
+    def subscribe(self, types, vehicle_id: Optional[int] = None,
+                  user_id: Optional[int] = None) -> Subscription:
+        self._loop = asyncio.get_running_loop()
+        subscription = Subscription(types, vehicle_id, user_id, self.queue_size)
+        self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self._subscribers.discard(subscription)
+
+    def publish(self, items: list):
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        if _running_loop() is loop:
+            self._dispatch(items)
+        else:
+            loop.call_soon_threadsafe(self._dispatch, items)
+
+    def _dispatch(self, items: list):
+        self.published += len(items)
+        for subscription in list(self._subscribers):
+            for item in items:
+                if not subscription.matches(item):
+                    continue
+                try:
+                    subscription.queue.put_nowait(item)
+                    self.delivered += 1
+                except asyncio.QueueFull:
+                    # Never block the others on a slow client
+                    subscription.overflowed = True
+                    self._subscribers.discard(subscription)
+                    self.overflowed += 1
+                    break
+
+    def snapshot(self) -> dict:
+        return {
+            "backend": EVENTS_BACKEND,
+            "subscribers": len(self._subscribers),
+            "published": self.published,
+            "delivered": self.delivered,
+            "overflowed": self.overflowed,
+        }
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+broadcaster = Broadcaster()
+
+
+def format_event(item: dict) -> str:
+    return f"event: {item['type']}.{item['action']}\ndata: {json.dumps(item, separators=(',', ':'))}\n\n"
+
+
+async def sse_stream(request, subscription: Subscription, heartbeat: float = EVENTS_HEARTBEAT_SECONDS):
+    """text/event-stream body for one subscriber, with comment heartbeats."""
+    try:
+        yield f"retry: {EVENTS_RETRY_MS}\n\n"
+        while True:
+            if subscription.overflowed and subscription.queue.empty():
+                yield "event: overflow\ndata: {}\n\n"
+                return
+            try:
+                item = await asyncio.wait_for(subscription.queue.get(), heartbeat)
+            except asyncio.TimeoutError:
+                if await request.is_disconnected():
+                    return
+                yield ": keepalive\n\n"
+                continue
+            yield format_event(item)
+    finally:
+        broadcaster.unsubscribe(subscription)
+
+
+async def listen_for_events(retry_delay: float = 5.0):
+    """Relay NOTIFY payloads from all workers to this process's subscribers."""
+    import asyncpg
+    from .database import ASYNC_SQLALCHEMY_DATABASE_URL
+    dsn = make_url(ASYNC_SQLALCHEMY_DATABASE_URL).set(drivername="postgresql") \
+        .render_as_string(hide_password=False)
+
+    def relay(connection, pid, channel, payload):
+        try:
+            broadcaster.publish([json.loads(payload)])
+        except ValueError:
+            logger.warning("Ignoring malformed event payload on %s", channel)
+
+    while True:
+        connection = None
+        try:
+            connection = await asyncpg.connect(dsn)
+            closed = asyncio.get_running_loop().create_future()
+            connection.add_termination_listener(
+                lambda _connection: closed.done() or closed.set_result(None))
+            await connection.add_listener(EVENTS_CHANNEL, relay)
+            logger.info("Listening for events on %s", EVENTS_CHANNEL)
+            await closed
+            logger.warning("Event listener connection closed, reconnecting")
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Event listener failed, retrying in %ss", retry_delay)
+        finally:
+            if connection is not None and not connection.is_closed():
+                await connection.close()
+        await asyncio.sleep(retry_delay)
@@ -0,0 +1,326 @@
+import asyncio
+import os
+import re
+import zlib
+import zipfile
+from datetime import date
+from typing import AsyncIterator, List, NamedTuple, Optional
+from xml.sax.saxutils import escape
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql
+
+from .compression import GZIP_LEVEL
+from .models import Inspection, ServiceHistory, Trip, Vehicle
+
+# Bulk exports for spreadsheets and finance tools. CSV comes straight out of
+# PostgreSQL with COPY (SELECT ...) TO STDOUT: the server formats the rows
+# and asyncpg hands over its buffers, which go to the client as they arrive,
+# so memory stays flat whatever the row count. A bounded queue between the
+# two makes a slow client slow down the COPY instead of piling up chunks.
+# gzip=true sends a .csv.gz file instead (plain CSV is still compressed on
+# the wire when the client accepts it, see compression.py).
+#
+# XLSX is a zip of XML parts, written here as the rows arrive: each batch
+# from a server-side cursor is added to the open worksheet entry and the
+# compressed bytes are sent on, and the workbook parts that list the sheets
+# come last. A sheet holds at most 1,048,576 rows, so longer exports
+# continue on further sheets.
+#
+# Rows are ordered by date and id, which the partitioned tables read from
+# their date index in order rather than sorting. Months moved to the archive
+# (see archive.py) are not exported; the X-Archived-Before header says from
+# which date the export is complete.
+
+EXPORT_QUEUE_CHUNKS = int(os.getenv("EXPORT_QUEUE_CHUNKS", "16"))
+XLSX_BATCH_ROWS = int(os.getenv("XLSX_BATCH_ROWS", "5000"))
+# Excel's row limit, less the header row
+XLSX_SHEET_ROWS = 1_048_575
+
+EXPORT_FORMATS = ("csv", "xlsx")
+CSV_MEDIA_TYPE = "text/csv; charset=utf-8"
+GZIP_MEDIA_TYPE = "application/gzip"
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+ARCHIVED_BEFORE_HEADER = "X-Archived-Before"
+
+
+class ExportSpec(NamedTuple):
+    model: type
+    # None when the rows have no date to filter on
+    date: Optional[str]
+    vehicle: str
+    pk: str
+
+    @property
+    def columns(self) -> List[str]:
+        return [column.name for column in self.model.__table__.columns]
+
+
+EXPORTS = {
+    "trips": ExportSpec(Trip, "trip_date", "vehicle_id", "trip_id"),
+    "inspections": ExportSpec(Inspection, "date", "vehicle_id", "inspection_id"),
+    "service_history": ExportSpec(ServiceHistory, "service_date", "vehicle_vin", "service_id"),
+    "vehicles": ExportSpec(Vehicle, None, "id", "id"),
+}
+
+
+def parse_export(kind: str, fmt: str) -> ExportSpec:
+    if kind not in EXPORTS:
+        raise ValueError(f"Unknown export '{kind}', expected one of: {', '.join(EXPORTS)}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown format '{fmt}', expected one of: {', '.join(EXPORT_FORMATS)}")
+    return EXPORTS[kind]
+
+
+def export_sql(spec: ExportSpec, start_date: Optional[date] = None, end_date: Optional[date] = None,
+               vehicle_id: Optional[int] = None) -> str:
+    """The export query as SQL text, since COPY takes no parameters; the
+    filter values are dates and integers, so inlining them is safe."""
+    model = spec.model
+    statement = select(*model.__table__.columns)
+    if (start_date or end_date) and spec.date is None:
+        raise ValueError(f"{model.__table__.name} cannot be filtered by date")
+    if start_date:
+        statement = statement.where(getattr(model, spec.date) >= start_date)
+    if end_date:
+        statement = statement.where(getattr(model, spec.date) <= end_date)
+    if vehicle_id is not None:
+        statement = statement.where(getattr(model, spec.vehicle) == vehicle_id)
+    order = [getattr(model, spec.date)] if spec.date else []
+    statement = statement.order_by(*order, getattr(model, spec.pk))
+    return str(statement.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+
+def export_filename(kind: str, fmt: str, gzip: bool, vehicle_id: Optional[int] = None,
+                    start_date: Optional[date] = None, end_date: Optional[date] = None) -> str:
+    parts = [kind]
+    if vehicle_id is not None:
+        parts.append(f"vehicle{vehicle_id}")
+    parts.extend(day.isoformat() for day in (start_date, end_date) if day)
+    return "_".join(parts) + f".{fmt}" + (".gz" if gzip else "")
+
+
+async def _raw_connection(connection):
+    return (await connection.get_raw_connection()).driver_connection
+
+
+async def csv_stream(sql: str, gzip: bool = False) -> AsyncIterator[bytes]:
+    """Yield the CSV (with a header row) of ``sql`` as PostgreSQL sends it.
+
+    The connection is owned by the generator, as in stream_ndjson, because
+    the body is produced after the endpoint has returned.
+    """
+    from .database import async_engine
+    queue: asyncio.Queue = asyncio.Queue(EXPORT_QUEUE_CHUNKS)
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31) if gzip else None
+    async with async_engine.connect() as connection:
+        raw = await _raw_connection(connection)
+
+        async def put(data):
+            # asyncpg may hand over a buffer it goes on to reuse
+            await queue.put(bytes(data))
+
+        async def copy():
+            try:
+                await raw.copy_from_query(sql, output=put, format="csv", header=True)
+            finally:
+                await queue.put(None)
+
+        task = asyncio.create_task(copy())
+        finished = False
+        try:
+            while True:
+                chunk = await queue.get()
+                if chunk is None:
+                    break
+                if compressor:
+                    chunk = compressor.compress(chunk)
+                if chunk:
+                    yield chunk
+            await task
+            finished = True
+            if compressor:
+                yield compressor.flush()
+        finally:
+            if not finished:
+                # Client gone or COPY failed: the connection may be mid-COPY
+                task.cancel()
+                await connection.invalidate()
+
+
+# XLSX
+
+_EXCEL_EPOCH = date(1899, 12, 30)
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{sheets}</Types>')
+_SHEET_CONTENT_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{n}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>')
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Target="xl/workbook.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument"/>'
+    '</Relationships>')
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>')
+_WORKBOOK_SHEET = '<sheet name="{name}" sheetId="{n}" r:id="rId{n}"/>'
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}<Relationship Id="rIdStyles" Target="styles.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"/></Relationships>')
+_WORKBOOK_SHEET_REL = (
+    '<Relationship Id="rId{n}" Target="worksheets/sheet{n}.xml" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"/>')
+# Style 1 shows a day number as a date
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="1"><font><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="2"><xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/></cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles></styleSheet>')
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>')
+_SHEET_END = "</sheetData></worksheet>"
+
+
+def _text(value) -> str:
+    text = value if type(value) is str else str(value)
+    if not text.isprintable():
+        text = _INVALID_XML.sub("", text)
+    return f'<c t="inlineStr"><is><t xml:space="preserve">{escape(text)}</t></is></c>'
+
+
+def _number(value) -> str:
+    return f"<c><v>{value!r}</v></c>"
+
+
+# Looked up by exact type: one dict hit per cell instead of isinstance chains
+_CELLS = {
+    type(None): lambda value: "<c/>",
+    bool: lambda value: f'<c t="b"><v>{int(value)}</v></c>',
+    int: _number,
+    float: _number,
+    date: lambda value: f'<c s="1"><v>{(value - _EXCEL_EPOCH).days}</v></c>',
+    str: _text,
+}
+
+
+def _cell(value) -> str:
+    return _CELLS.get(type(value), _text)(value)
+
+
+def _row(values) -> str:
+    return "<row>" + "".join(map(_cell, values)) + "</row>"
+
+
+class _Sink:
+    """Write-only file for zipfile; what was written is taken out in chunks."""
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, data) -> int:
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self) -> bytes:
+        data, self.chunks = b"".join(self.chunks), []
+        return data
+
+
+class XlsxWriter:
+    """An XLSX workbook written row batch by row batch to an unseekable stream."""
+
+    def __init__(self, columns: List[str], sheet_name: str):
+        self.sink = _Sink()
+        self.zip = zipfile.ZipFile(self.sink, "w", zipfile.ZIP_DEFLATED)
+        self.header = _row(columns)
+        self.sheet_name = sheet_name
+        self.sheets = 0
+        self.sheet = None
+        self.rows = 0
+
+    def _new_sheet(self):
+        if self.sheet:
+            self.sheet.write(_SHEET_END.encode())
+            self.sheet.close()
+        self.sheets += 1
+        self.sheet = self.zip.open(f"xl/worksheets/sheet{self.sheets}.xml", "w")
+        self.sheet.write((_SHEET_START + self.header).encode())
+        self.rows = 0
+
+    def write(self, rows) -> bytes:
+        """Add ``rows``; returns the bytes ready to send."""
+        if self.sheet is None:
+            self._new_sheet()
+        parts = []
+        for row in rows:
+            if self.rows == XLSX_SHEET_ROWS:
+                self.sheet.write("".join(parts).encode())
+                parts = []
+                self._new_sheet()
+            parts.append(_row(row))
+            self.rows += 1
+        self.sheet.write("".join(parts).encode())
+        return self.sink.take()
+
+    def close(self) -> bytes:
+        if self.sheet is None:
+            self._new_sheet()
+        self.sheet.write(_SHEET_END.encode())
+        self.sheet.close()
+        numbers = range(1, self.sheets + 1)
+        names = [self.sheet_name if n == 1 else f"{self.sheet_name} {n}" for n in numbers]
+        self.zip.writestr("xl/workbook.xml", _WORKBOOK.format(sheets="".join(
+            _WORKBOOK_SHEET.format(name=escape(name), n=n) for name, n in zip(names, numbers))))
+        self.zip.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS.format(
+            sheets="".join(_WORKBOOK_SHEET_REL.format(n=n) for n in numbers)))
+        self.zip.writestr("xl/styles.xml", _STYLES)
+        self.zip.writestr("_rels/.rels", _ROOT_RELS)
+        self.zip.writestr("[Content_Types].xml", _CONTENT_TYPES.format(
+            sheets="".join(_SHEET_CONTENT_TYPE.format(n=n) for n in numbers)))
+        self.zip.close()
+        return self.sink.take()
+
+
+async def xlsx_stream(sql: str, columns: List[str], sheet_name: str) -> AsyncIterator[bytes]:
+    """Yield an XLSX workbook of ``sql``'s rows, reading them from a server-side cursor."""
+    from .database import async_engine
+    writer = XlsxWriter(columns, sheet_name)
+    async with async_engine.connect() as connection:
+        raw = await _raw_connection(connection)
+        async with raw.transaction():
+            cursor = await raw.cursor(sql)
+            while True:
+                batch = await cursor.fetch(XLSX_BATCH_ROWS)
+                if not batch:
+                    break
+                # Formatting and deflating a batch takes a while: keep it off the event loop
+                chunk = await asyncio.to_thread(writer.write, batch)
+                if chunk:
+                    yield chunk
+    yield writer.close()
@@ -0,0 +1,56 @@
+from functools import lru_cache
+from typing import List, Optional, Type
+
+from fastapi import HTTPException, Query
+from fastapi.responses import Response
+from pydantic import BaseModel, TypeAdapter
+from pydantic_core import to_json
+
+# Alternative encodings for the list endpoints. "columnar" sends one array
+# per field, so field names appear once per response instead of once per
+# row; "arrow" is an Arrow IPC stream for analytics clients and needs the
+# optional pyarrow package. Both keep the fields of the response schema.
+
+RESPONSE_FORMATS = ("json", "columnar", "arrow")
+ARROW_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+
+
+def response_format(
+    format: str = Query("json", description="json (one object per row), columnar or arrow")
+) -> str:
+    if format not in RESPONSE_FORMATS:
+        raise HTTPException(
+            status_code=400, detail=f"Unknown format '{format}', expected one of: {', '.join(RESPONSE_FORMATS)}")
+    return format
+
+
+@lru_cache(maxsize=None)
+def _list_adapter(schema: Type[BaseModel]) -> TypeAdapter:
+    return TypeAdapter(List[schema])
+
+
+def to_columns(rows, schema: Type[BaseModel]) -> dict:
+    """Validated field values per column, in one pass over the list; nested models stay models."""
+    models = _list_adapter(schema).validate_python(rows, from_attributes=True)
+    return {name: [getattr(model, name) for model in models] for name in schema.model_fields}
+
+
+def arrow_ipc(columns: dict) -> bytes:
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise HTTPException(status_code=400, detail="format=arrow requires the 'pyarrow' package")
+    table = pa.table({name: [value.model_dump() if isinstance(value, BaseModel) else value for value in values]
+                      for name, values in columns.items()})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def list_response(rows, schema: Type[BaseModel], fmt: str, headers: Optional[dict] = None) -> Response:
+    """Encode a list endpoint's rows in a non-default format."""
+    columns = to_columns(rows, schema)
+    if fmt == "arrow":
+        return Response(arrow_ipc(columns), media_type=ARROW_MEDIA_TYPE, headers=headers)
+    return Response(to_json(columns), media_type="application/json", headers=headers)
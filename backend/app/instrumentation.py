@@ -0,0 +1,258 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Tuple
+
+from .metrics import Histogram, pool_snapshot
+from .querycount import StatementCounter, active_counters, counting
+
+# Per-request timing. RequestMetricsMiddleware times every HTTP request and
+# counts the bytes it sends; the statement counter in querycount adds each
+# statement's count and duration to the request that issued it. Everything is aggregated per route template
+# in-process, so /metrics reports one worker per scrape like the other
+# metrics endpoints. Statements slower than SLOW_QUERY_MS are logged with
+# their SQL and parameters and kept in a short ring buffer.
+
+REQUEST_METRICS = os.getenv("REQUEST_METRICS", "true").lower() in ("1", "true", "yes")
+# <= 0 turns the slow query / slow request log off
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+SLOW_REQUEST_MS = float(os.getenv("SLOW_REQUEST_MS", "1000"))
+SLOW_QUERY_LOG_PARAMS = os.getenv("SLOW_QUERY_LOG_PARAMS", "true").lower() in ("1", "true", "yes")
+SLOW_QUERY_HISTORY = int(os.getenv("SLOW_QUERY_HISTORY", "100"))
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+# Bind parameters whose values never reach the log
+REDACTED_PARAMS = ("password", "token", "secret")
+MAX_LOGGED_CHARS = 2000
+
+logger = logging.getLogger(__name__)
+slow_query_logger = logging.getLogger(__name__ + ".slow_query")
+
+
+class RequestStats(StatementCounter):
+    __slots__ = ("path",)
+
+    def __init__(self, path: str = ""):
+        super().__init__()
+        self.path = path
+
+
+class RouteMetrics:
+    def __init__(self):
+        self.duration = Histogram(LATENCY_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.statements = Histogram(STATEMENT_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.routes: Dict[Tuple[str, str], RouteMetrics] = {}
+        self.responses: Dict[Tuple[str, str, int], int] = {}
+        self.slow_queries = 0
+        self.slow_requests = 0
+        self.recent_slow_queries = deque(maxlen=SLOW_QUERY_HISTORY)
+        self._lock = threading.Lock()
+
+    def observe(self, method: str, route: str, status: int, duration: float, stats: RequestStats, size: int):
+        key = (method, route)
+        metrics = self.routes.get(key)
+        if metrics is None:
+            with self._lock:
+                metrics = self.routes.setdefault(key, RouteMetrics())
+        metrics.duration.observe(duration)
+        metrics.db_time.observe(stats.db_time)
+        metrics.statements.observe(stats.count)
+        metrics.response_size.observe(size)
+        with self._lock:
+            self.responses[(method, route, status)] = self.responses.get((method, route, status), 0) + 1
+
+    def record_slow_query(self, entry: dict):
+        with self._lock:
+            self.slow_queries += 1
+            self.recent_slow_queries.append(entry)
+
+    def record_slow_request(self):
+        with self._lock:
+            self.slow_requests += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            routes = dict(self.routes)
+            responses = dict(self.responses)
+            recent = list(self.recent_slow_queries)
+        return {
+            "routes": {f"{method} {route}": {
+                "duration_seconds": metrics.duration.snapshot(),
+                "db_seconds": metrics.db_time.snapshot(),
+                "statements": metrics.statements.snapshot(),
+                "response_bytes": metrics.response_size.snapshot(),
+                "responses": {str(status): count for (m, r, status), count in sorted(responses.items())
+                              if (m, r) == (method, route)},
+            } for (method, route), metrics in sorted(routes.items())},
+            "slow_queries": self.slow_queries,
+            "slow_requests": self.slow_requests,
+            "recent_slow_queries": recent,
+        }
+
+
+request_metrics = RequestMetrics()
+
+
+def _loggable_parameters(context, parameters):
+    # Compiled parameters carry the bind names, which the redaction needs;
+    # plain driver-level statements only have the positional values.
+    compiled = getattr(context, "compiled_parameters", None) if context is not None else None
+    if compiled:
+        values = [{name: "<redacted>" if any(word in name.lower() for word in REDACTED_PARAMS) else value
+                   for name, value in params.items()} for params in compiled]
+        values = values[0] if len(values) == 1 else values
+    else:
+        values = parameters
+    text = repr(values)
+    return text if len(text) <= MAX_LOGGED_CHARS else text[:MAX_LOGGED_CHARS] + "..."
+
+
+def log_slow_query(statement, parameters, context, executemany, elapsed):
+    """Statement observer (see querycount.observe_statements) logging those over SLOW_QUERY_MS."""
+    if 0 < SLOW_QUERY_MS <= elapsed * 1000:
+        stats = next((counter for counter in active_counters() if isinstance(counter, RequestStats)), None)
+        _log_slow_query(statement, parameters, context, executemany, elapsed, stats)
+
+
+def _log_slow_query(statement, parameters, context, executemany, elapsed, stats):
+    sql = " ".join(statement.split())
+    if len(sql) > MAX_LOGGED_CHARS:
+        sql = sql[:MAX_LOGGED_CHARS] + "..."
+    entry = {
+        "at": time.time(),
+        "duration_ms": round(elapsed * 1000, 2),
+        "path": stats.path if stats is not None else None,
+        "statement": sql,
+        "parameters": _loggable_parameters(context, parameters) if SLOW_QUERY_LOG_PARAMS else None,
+        "executemany": executemany,
+    }
+    request_metrics.record_slow_query(entry)
+    slow_query_logger.warning("slow query %.1fms (%s): %s; parameters: %s", entry["duration_ms"],
+                              entry["path"] or "no request", sql, entry["parameters"])
+
+
+def _route_template(scope) -> str:
+    route = scope.get("route")
+    # Unmatched paths share one label so scanners cannot grow the metric set
+    return getattr(route, "path_format", None) or getattr(route, "path", None) or "unmatched"
+
+
+class RequestMetricsMiddleware:
+    """Records latency, SQL statements, DB time and response bytes per route.
+
+    Installed outermost, so the size is what went over the wire after
+    compression. Event streams are left out: they stay open for as long as
+    the client listens and would swamp the latency histogram.
+    """
+
+    def __init__(self, app, enabled: bool = REQUEST_METRICS):
+        self.app = app
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(scope.get("path", ""))
+        started = time.perf_counter()
+        status = 500
+        size = 0
+        event_stream = False
+
+        async def send_with_metrics(message):
+            nonlocal status, size, event_stream
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message.get("headers", ()):
+                    if name.lower() == b"content-type" and value.startswith(b"text/event-stream"):
+                        event_stream = True
+                server_timing = (f'db;dur={stats.db_time * 1000:.1f};desc="{stats.count} stmt", '
+                                 f"app;dur={(time.perf_counter() - started) * 1000:.1f}")
+                message = {**message, "headers": [*message.get("headers", ()),
+                                                  (b"server-timing", server_timing.encode())]}
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            with counting(stats):
+                await self.app(scope, receive, send_with_metrics)
+        finally:
+            if not event_stream:
+                duration = time.perf_counter() - started
+                route = _route_template(scope)
+                request_metrics.observe(scope["method"], route, status, duration, stats, size)
+                if 0 < SLOW_REQUEST_MS <= duration * 1000:
+                    request_metrics.record_slow_request()
+                    logger.warning("slow request %s %s -> %s in %.1fms: %d statements, %.1fms in the database",
+                                   scope["method"], stats.path, status, duration * 1000,
+                                   stats.count, stats.db_time * 1000)
+
+
+def _labels(**labels) -> str:
+    def escape(value) -> str:
+        return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{name}="{escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _histogram_lines(name: str, labels: dict, snapshot: dict) -> list:
+    lines = [f"{name}_bucket{_labels(**labels, le=bound)} {count}" for bound, count in snapshot["buckets"].items()]
+    lines.append(f"{name}_sum{_labels(**labels)} {snapshot['sum']}")
+    lines.append(f"{name}_count{_labels(**labels)} {snapshot['count']}")
+    return lines
+
+
+def render_prometheus(pools: Dict[str, object]) -> str:
+    """Request, SQL and connection pool metrics in the Prometheus text format."""
+    with request_metrics._lock:
+        routes = sorted(request_metrics.routes.items())
+        responses = sorted(request_metrics.responses.items())
+    out = []
+
+    def family(name: str, kind: str, help_text: str):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} {kind}")
+
+    family("vms_http_requests_total", "counter", "HTTP responses by route and status")
+    out.extend(f"vms_http_requests_total{_labels(method=method, route=route, status=status)} {count}"
+               for (method, route, status), count in responses)
+    for name, attribute, help_text in (
+            ("vms_http_request_duration_seconds", "duration", "Time from request to last response byte"),
+            ("vms_http_request_db_seconds", "db_time", "Time spent executing SQL per request"),
+            ("vms_http_request_statements", "statements", "SQL statements executed per request"),
+            ("vms_http_response_size_bytes", "response_size", "Response body bytes sent per request")):
+        family(name, "histogram", help_text)
+        for (method, route), metrics in routes:
+            out.extend(_histogram_lines(name, {"method": method, "route": route},
+                                        getattr(metrics, attribute).snapshot()))
+    family("vms_slow_queries_total", "counter", f"SQL statements slower than {SLOW_QUERY_MS:g}ms")
+    out.append(f"vms_slow_queries_total {request_metrics.slow_queries}")
+    family("vms_slow_requests_total", "counter", f"Requests slower than {SLOW_REQUEST_MS:g}ms")
+    out.append(f"vms_slow_requests_total {request_metrics.slow_requests}")
+
+    snapshots = {name: pool_snapshot(pool) for name, pool in pools.items()}
+    for key, kind, help_text in (
+            ("checked_out", "gauge", "Connections currently checked out"),
+            ("checked_in", "gauge", "Idle connections in the pool"),
+            ("overflow", "gauge", "Connections open beyond pool_size"),
+            ("checkouts", "counter", "Connection checkouts"),
+            ("checkout_timeouts", "counter", "Checkouts that gave up after pool_timeout"),
+            ("connections_opened", "counter", "Database connections opened")):
+        name = f"vms_db_pool_{key}" + ("_total" if kind == "counter" and not key.endswith("_total") else "")
+        family(name, kind, help_text)
+        out.extend(f"{name}{_labels(pool=pool)} {snapshot[key]}" for pool, snapshot in snapshots.items())
+    family("vms_db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a pooled connection")
+    for pool, snapshot in snapshots.items():
+        out.extend(_histogram_lines("vms_db_pool_checkout_wait_seconds", {"pool": pool},
+                                    snapshot["checkout_wait_seconds"]))
+    return "\n".join(out) + "\n"
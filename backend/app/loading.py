@@ -0,0 +1,41 @@
+import typing
+from functools import lru_cache
+from typing import Optional, Type
+
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload, selectinload
+
+# Eager-loading strategy derived from the response schema: every relationship
+# the schema serializes is loaded up front, joined for many-to-one and with a
+# second IN query for collections. Under AsyncSession a missed relationship
+# fails with MissingGreenlet instead of silently issuing one query per row.
+
+
+def nested_schema(annotation) -> Optional[Type[BaseModel]]:
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return annotation
+    for arg in typing.get_args(annotation):
+        nested = nested_schema(arg)
+        if nested is not None:
+            return nested
+    return None
+
+
+@lru_cache(maxsize=None)
+def loader_options(model, schema: Type[BaseModel]) -> tuple:
+    """Loader options for each relationship of ``model`` that ``schema`` touches."""
+    relationships = inspect(model).relationships
+    options = []
+    for name, field in schema.model_fields.items():
+        if name not in relationships:
+            continue
+        nested = nested_schema(field.annotation)
+        if nested is None:
+            continue
+        relationship = relationships[name]
+        attribute = getattr(model, name)
+        loader = selectinload(attribute) if relationship.uselist else joinedload(attribute)
+        children = loader_options(relationship.mapper.class_, nested)
+        options.append(loader.options(*children) if children else loader)
+    return tuple(options)
@@ -1,10 +1,16 @@
 from datetime import time as datetime_time
+from datetime import date
+import asyncio
 import logging
 import os
-import time
+from contextlib import asynccontextmanager
+from functools import partial
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi import FastAPI, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, FastAPI, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from pydantic_core import to_json
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List, Optional
 from .schemas import (
     UserCreate, UserResponse,
@@ -13,332 +19,598 @@ from .schemas import (
     ServiceNotificationCreate, ServiceNotificationResponse,
     InspectionCreate, InspectionResponse,
     ServiceHistoryCreate, ServiceHistoryResponse,
-    Login
+    FleetAnalyticsResponse, VehicleAnalyticsResponse,
+    BulkResult, SearchHit, ChangeFeed,
+    ReportJobResponse, Login
 )
-from .models import User, Vehicle, Trip, ServiceNotification, Inspection, ServiceHistory
-from .models import Base
-import psycopg2
-
-app = FastAPI()
+from .models import User, Vehicle, Trip, ServiceNotification, Inspection, ServiceHistory, ReportJob
+from .analytics import trip_breakdown, trip_filters
+from .archive import (ARCHIVE_AFTER_MONTHS, ARCHIVED_TABLES, find_archived, history, hot_since, parse_columns,
+                      parse_kind, run_archiver)
+from .bulk import BulkSpec, ingest, read_rows
+from .cache import user_cache, vehicle_cache
+from .changes import CHANGE_FEEDS, parse_feeds, read_changes
+from .compression import CompressionMiddleware
+from .emailSender import smtp_configured
+from .events import (EVENTS_BACKEND, broadcaster, listen_for_events, parse_event_types,
+                     sse_stream)
+from .exports import (ARCHIVED_BEFORE_HEADER, CSV_MEDIA_TYPE, GZIP_MEDIA_TYPE, XLSX_MEDIA_TYPE, csv_stream,
+                      export_filename, export_sql, parse_export, xlsx_stream)
+from .formats import ARROW_MEDIA_TYPE, arrow_ipc, list_response, response_format
+from .instrumentation import RequestMetricsMiddleware, render_prometheus, request_metrics
+from .loading import loader_options
+from .pagination import (MAX_PAGE_SIZE, NEXT_CURSOR_HEADER, check_date_range, date_range, decode_cursor,
+                         encode_cursor, paginate, stream_ndjson)
+from .odometer import (apply_odometer, check_transition, merge_changes, odometer_changes,
+                       odometer_committed)
+from .querycount import query_budget
+from .reports import (cache_path, ensure_rendered, file_response, inspection_report, job_response,
+                      parse_kinds, parse_month, report_filename, shutdown_pool, start_job, trip_report)
+from .rollups import apply_trip_deltas, orphan_rollups, record_trip_change, trip_delta, trip_values
+from .outbox import OUTBOX_WORKER_ENABLED, OutboxWorker, outbox_snapshot
+from .partitions import PARTITION_MAINTENANCE_ENABLED, run_partition_maintenance
+from .scheduler import SERVICE_SCHEDULER_ENABLED, run_scheduler
+from .serialization import FAST_SERIALIZATION, FastJSONResponse, rows_to_dicts, select_rows
+from .security import (JWT_TTL_SECONDS, CurrentUser, check_jwt_secret, create_token, hash_password,
+                       needs_rehash, password_hash_snapshot, require_employee, verify_password)
+from .readiness import Readiness, database_reachable, wait_until_ready
+from .search import SEARCH_MAX_LIMIT, parse_types, search_statement, vehicle_contains
+from .versions import current_validators, not_modified, validator_headers
+
+# Routes are registered on this router and mounted by create_app
+router = APIRouter()
 
 # Load CORS origins from environment variable
 origins = os.getenv("BACKEND_CORS_ORIGINS", "http://localhost:3000").split(",")
 
-# Add CORS middleware
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
 # Dependency to get DB session
 
 
-def get_db():
-    from .database import SessionLocal
-    db = SessionLocal()
-    try:
+async def get_db():
+    from .database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
-# Initialize database tables on app startup with retry
+# Startup only schedules work: the database is awaited in the background
+# (see readiness.py) and the workers that need it start once it is ready.
+# Schema changes are applied by python -m app.migrations, not here.
 
 
-@app.on_event("startup")
-async def startup_event():
-    from .models import Base
-    from .database import engine
-    from sqlalchemy import text
-    print("Starting database initialization...")
-    max_retries = 10
-    retry_delay = 5  # seconds
-    for i in range(max_retries):
-        try:
-            print(f"Attempt {i + 1}/{max_retries}: Connecting to database...")
-            with engine.connect() as connection:
-                result = connection.execute(text("SELECT 1"))
-                print(f"Connection successful: {result.fetchone()}")
-            print("Creating tables...")
-            Base.metadata.create_all(bind=engine)
-            # Verify tables were created
-            with engine.connect() as connection:
-                result = connection.execute(text(
-                    "SELECT table_name FROM information_schema.tables WHERE table_schema = 'public'"))
-                tables = [row[0] for row in result]
-                print(f"Tables in database: {tables}")
-            if "users" in tables:
-                print("Database tables created successfully, including 'users'")
-            else:
-                print("Table 'users' not created!")
-            break
-        except Exception as e:
-            print(f"Attempt {i + 1}/{max_retries} failed: {str(e)}")
-            if i < max_retries - 1:
-                time.sleep(retry_delay)
-            else:
-                raise Exception(
-                    f"Failed to initialize database after {max_retries} retries: {str(e)}")
+def _task_done(name: str, task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        logger.error("Background task %s stopped", name, exc_info=task.exception())
+
+
+def start_task(app: FastAPI, name: str, start):
+    # Each worker starts on its own, so one that fails to build or later
+    # crashes is logged without keeping the others from running
+    try:
+        task = asyncio.create_task(start())
+    except Exception:
+        logger.exception("Could not start background task %s", name)
+        return
+    task.add_done_callback(partial(_task_done, name))
+    setattr(app.state, name, task)
+
+
+async def start_when_ready(app: FastAPI):
+    await wait_until_ready(app.state.readiness)
+    if SERVICE_SCHEDULER_ENABLED:
+        start_task(app, "scheduler_task", run_scheduler)
+    if OUTBOX_WORKER_ENABLED and not smtp_configured():
+        logger.warning("EMAIL_HOST/EMAIL_PORT are not set; the email outbox worker is not started "
+                       "and queued mail waits in email_outbox")
+    elif OUTBOX_WORKER_ENABLED:
+        start_task(app, "outbox_task", lambda: OutboxWorker().run())
+    if EVENTS_BACKEND == "postgres":
+        start_task(app, "events_task", listen_for_events)
+    if PARTITION_MAINTENANCE_ENABLED:
+        start_task(app, "partitions_task", run_partition_maintenance)
+    if ARCHIVE_AFTER_MONTHS > 0:
+        start_task(app, "archive_task", run_archiver)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.readiness = Readiness()
+    app.state.startup_task = asyncio.create_task(start_when_ready(app))
+    yield
+    for name in ("startup_task", "scheduler_task", "outbox_task", "events_task", "partitions_task",
+                 "archive_task"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    shutdown_pool()
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Columns the list endpoints may be keyset-paginated on; each is indexed or
+# bounded enough that (column, primary key) range scans stay cheap.
+VEHICLE_SORT_COLUMNS = ("id", "year", "mileage", "licence_plate")
+USER_SORT_COLUMNS = ("user_id", "email")
+TRIP_SORT_COLUMNS = ("trip_id", "trip_date")
+INSPECTION_SORT_COLUMNS = ("inspection_id", "date")
+
+
+async def trips_inserted(db: AsyncSession, rows: List[dict]):
+    values = [trip_values(row) for row in rows]
+    await apply_trip_deltas(db, [trip_delta(trip, 1) for trip in values])
+    await apply_odometer(db, merge_changes(odometer_changes(None, trip) for trip in values))
+
+
+TRIP_BULK = BulkSpec(Trip, TripCreate, "trip_id", {
+    "vehicle_id": (Vehicle, "id"), "user_id": (User, "user_id")}, after_insert=trips_inserted)
+INSPECTION_BULK = BulkSpec(Inspection, InspectionCreate, "inspection_id", {
+    "vehicle_id": (Vehicle, "id"), "user_id": (User, "user_id")})
+SERVICE_HISTORY_BULK = BulkSpec(ServiceHistory, ServiceHistoryCreate, "service_id", {
+    "vehicle_vin": (Vehicle, "id")})
+
 
-@app.post("/api/login/")
-def login(user: Login, db: Session = Depends(get_db)):
-    logger.info(
-        f"Attempting login with email: {user.email}, role: {user.role}, password: {user.password}")
+def conditional_get(*models):
+    """Route dependency adding ETag/Last-Modified from the table versions.
+
+    Answers a matching If-None-Match or If-Modified-Since with 304 before
+    the handler runs, so an unchanged list costs one primary key lookup.
+    """
+    tables = tuple(sorted(model.__table__.name for model in models))
+
+    async def check(request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+        validators = await current_validators(db, tables)
+        headers = validator_headers(validators)
+        if not_modified(request.headers, validators):
+            raise HTTPException(status_code=304, headers=headers)
+        response.headers.update(headers)
+
+    return check
+
+
+async def load_user(db: AsyncSession, user_id: int):
+    return await db.scalar(
+        select(User).options(*loader_options(User, UserResponse)).where(User.user_id == user_id)
+        .execution_options(populate_existing=True))
+
+
+# Cached reference rows. Entries are response-shaped dicts; users are cached
+# without their vehicle, which is looked up in the vehicle cache, so a
+# vehicle change only invalidates the vehicle entry.
+
+
+async def vehicle_record(db: AsyncSession, vehicle_id: int) -> Optional[dict]:
+    async def load():
+        vehicle = await db.get(Vehicle, vehicle_id)
+        return VehicleResponse.model_validate(vehicle).model_dump(mode="json") if vehicle else None
+    return await vehicle_cache.get(vehicle_id, load)
+
+
+async def user_entry(db: AsyncSession, user_id: int) -> Optional[dict]:
+    async def load():
+        user = await load_user(db, user_id)
+        if not user:
+            return None
+        if user.vehicle:
+            await vehicle_cache.put(
+                user.vehicle_id, VehicleResponse.model_validate(user.vehicle).model_dump(mode="json"))
+        return UserResponse.model_validate(user).model_dump(mode="json", exclude={"vehicle"})
+    return await user_cache.get(user_id, load)
+
+
+async def user_record(db: AsyncSession, user_id: int) -> Optional[dict]:
+    user = await user_entry(db, user_id)
+    if not user:
+        return None
+    vehicle = await vehicle_record(db, user["vehicle_id"]) if user["vehicle_id"] else None
+    return {**user, "vehicle": vehicle}
+
+
+@router.post("/api/login/")
+async def login(user: Login, db: AsyncSession = Depends(get_db)):
+    logger.info("Attempting login with email: %s, role: %s", user.email, user.role.value)
     try:
-        db_user = db.query(User).filter(
+        db_user = (await db.execute(select(User.user_id, User.hashed_password).where(
             User.email == user.email,
             User.role == user.role.value
-        ).first()
-        if not db_user:
-            logger.error(
-                "User not found or role mismatch for email: %s, role: %s", user.email, user.role.value)
-            raise HTTPException(status_code=400, detail="Invalid credentials")
-        logger.info(
-            f"Found user: {db_user.email}, stored password: {db_user.hashed_password}")
-        if user.password != db_user.hashed_password:
-            logger.error("Password mismatch for user: %s", db_user.email)
+        ))).first()
+        if not await verify_password(user.password, db_user.hashed_password if db_user else None):
+            logger.error("Invalid credentials for email: %s, role: %s", user.email, user.role.value)
             raise HTTPException(status_code=400, detail="Invalid credentials")
-        return {"user": db_user, "token": "mock-token"}
+        if needs_rehash(db_user.hashed_password):
+            await db.execute(update(User).where(User.user_id == db_user.user_id).values(
+                hashed_password=await hash_password(user.password)))
+            await db.commit()
+        return {
+            "user": await user_record(db, db_user.user_id),
+            "token": create_token(db_user.user_id, user.email, user.role.value),
+            "token_type": "bearer",
+            "expires_in": JWT_TTL_SECONDS,
+        }
     except HTTPException as http_exc:
-        logger.error(f"HTTP Exception: {str(http_exc.detail)}")
+        logger.error("HTTP Exception: %s", http_exc.detail)
         raise http_exc
     except Exception as e:
-        logger.error(f"Internal server error: {str(e)}")
+        logger.error("Internal server error: %s", e)
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 # Vehicle CRUD Endpoints
 
 
-@app.post("/api/add_vehicle/", response_model=VehicleResponse)
-def create_vehicle(vehicle: VehicleCreate, db: Session = Depends(get_db)):
+@router.post("/api/add_vehicle/", response_model=VehicleResponse)
+async def create_vehicle(vehicle: VehicleCreate, db: AsyncSession = Depends(get_db)):
     try:
-        if db.query(Vehicle).filter(Vehicle.vin == vehicle.vin).first():
+        if await db.scalar(select(Vehicle.id).where(Vehicle.vin == vehicle.vin)):
             raise HTTPException(
                 status_code=400, detail="Vehicle with this VIN already exists")
-        if db.query(Vehicle).filter(Vehicle.licence_plate == vehicle.licence_plate).first():
+        if await db.scalar(select(Vehicle.id).where(Vehicle.licence_plate == vehicle.licence_plate)):
             raise HTTPException(
                 status_code=400, detail="Vehicle with this licence plate already exists")
         db_vehicle = Vehicle(**vehicle.model_dump())
         db.add(db_vehicle)
-        db.commit()
-        db.refresh(db_vehicle)
+        await db.commit()
+        await db.refresh(db_vehicle)
         return db_vehicle
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.get("/api/get_vehicle/{vehicle_id}", response_model=VehicleResponse)
-def get_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
+@router.get("/api/get_vehicle/{vehicle_id}", response_model=VehicleResponse,
+          dependencies=[Depends(query_budget(1, "get_vehicle"))])
+async def get_vehicle(vehicle_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
+        vehicle = await vehicle_record(db, vehicle_id)
         if not vehicle:
             raise HTTPException(
                 status_code=404, detail=f"Vehicle with ID {vehicle_id} not found")
         return vehicle
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.get("/api/get_all_vehicles/", response_model=List[VehicleResponse])
-def get_all_vehicles(
+@router.get("/api/get_all_vehicles/", response_model=List[VehicleResponse],
+          dependencies=[Depends(query_budget(2, "get_all_vehicles")),
+                       Depends(conditional_get(Vehicle))])
+async def get_all_vehicles(
+    response: Response,
     make: Optional[str] = None,
     model: Optional[str] = None,
     licence_plate: Optional[str] = None,
-    db: Session = Depends(get_db)
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    sort: str = "id",
+    desc: bool = False,
+    stream: bool = False,
+    fmt: str = Depends(response_format),
+    db: AsyncSession = Depends(get_db)
 ):
     try:
-        query = db.query(Vehicle)
+        # Plain rows straight to orjson unless another format or streaming is asked for
+        fast = FAST_SERIALIZATION and fmt == "json" and not stream
+        query = select_rows(Vehicle, VehicleResponse) if fast else select(Vehicle)
         if make:
-            query = query.filter(Vehicle.make.ilike(f"%{make}%"))
+            query = query.where(vehicle_contains(Vehicle.make, make))
         if model:
-            query = query.filter(Vehicle.model.ilike(f"%{model}%"))
+            query = query.where(vehicle_contains(Vehicle.model, model))
         if licence_plate:
-            query = query.filter(
-                Vehicle.licence_plate.ilike(f"%{licence_plate}%"))
-        vehicles = query.all()
-        if not vehicles:
+            query = query.where(
+                vehicle_contains(Vehicle.licence_plate, licence_plate))
+        query, next_cursor = paginate(
+            query, Vehicle, "id", sort, VEHICLE_SORT_COLUMNS, limit, after, desc)
+        if stream:
+            if fmt != "json":
+                raise HTTPException(status_code=400, detail="Only format=json can be streamed")
+            return StreamingResponse(
+                stream_ndjson(query, VehicleResponse), media_type="application/x-ndjson")
+        vehicles = (await db.execute(query) if fast else await db.scalars(query)).all()
+        if not vehicles and not after:
             raise HTTPException(status_code=404, detail="No vehicles found")
+        cursor = next_cursor(vehicles)
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
+        if fast:
+            return FastJSONResponse(rows_to_dicts(vehicles, Vehicle, VehicleResponse), headers=response.headers)
+        if fmt != "json":
+            return list_response(vehicles, VehicleResponse, fmt, response.headers)
         return vehicles
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+# Typeahead search across vehicles, users and trips, ranked by relevance
+
+
+@router.get("/api/search", response_model=List[SearchHit],
+         dependencies=[Depends(query_budget(1, "search"))])
+async def search(
+    q: str = Query(..., min_length=1, max_length=200),
+    types: Optional[str] = Query(
+        None, description="Comma separated subset of vehicle, user, trip"),
+    limit: int = Query(10, ge=1, le=SEARCH_MAX_LIMIT),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        try:
+            kinds = parse_types(types)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        if not q.strip():
+            return []
+        return (await db.execute(search_statement(q, kinds, limit))).mappings().all()
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+# Incremental sync: inserts, updates and deletes since a cursor, in commit order
+
+
+@router.get("/api/changes", response_model=ChangeFeed,
+         dependencies=[Depends(query_budget(2 + len(CHANGE_FEEDS), "get_changes"))])
+async def get_changes(
+    response: Response,
+    since: Optional[str] = Query(
+        None, description="next_cursor of the previous page; omit to replay the whole log, 'latest' to start from now"),
+    tables: Optional[str] = Query(
+        None, description="Comma separated subset of " + ", ".join(CHANGE_FEEDS)),
+    limit: int = Query(500, ge=1, le=MAX_PAGE_SIZE),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        try:
+            feeds = parse_feeds(tables)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        page = await read_changes(db, since, feeds, limit)
+        response.headers[NEXT_CURSOR_HEADER] = page["next_cursor"]
+        return page
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.put("/api/update_vehicle/{vehicle_id}", response_model=VehicleResponse)
-def update_vehicle(vehicle_id: int, vehicle: VehicleCreate, db: Session = Depends(get_db)):
+# Server-sent events for trip, inspection and service notification changes
+
+
+@router.get("/api/events")
+async def stream_events(
+    request: Request,
+    types: Optional[str] = Query(
+        None, description="Comma separated subset of trip, inspection, service_notification"),
+    vehicle_id: Optional[int] = None,
+    user_id: Optional[int] = None
+):
+    try:
+        kinds = parse_event_types(types)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    subscription = broadcaster.subscribe(kinds, vehicle_id, user_id)
+    return StreamingResponse(
+        sse_stream(request, subscription), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.put("/api/update_vehicle/{vehicle_id}", response_model=VehicleResponse)
+async def update_vehicle(vehicle_id: int, vehicle: VehicleCreate, db: AsyncSession = Depends(get_db)):
     try:
-        db_vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
+        db_vehicle = await db.get(Vehicle, vehicle_id)
         if not db_vehicle:
             raise HTTPException(status_code=404, detail="Vehicle not found")
-        db.query(Vehicle).filter(Vehicle.id == vehicle_id).update(
-            **vehicle.model_dump())
-        db.commit()
-        db.refresh(db_vehicle)
+        await db.execute(update(Vehicle).where(Vehicle.id == vehicle_id).values(
+            **vehicle.model_dump()))
+        await db.commit()
+        await vehicle_cache.invalidate(vehicle_id)
+        await db.refresh(db_vehicle)
         return db_vehicle
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.delete("/api/delete_vehicle/{vehicle_id}")
-def delete_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
+@router.delete("/api/delete_vehicle/{vehicle_id}")
+async def delete_vehicle(vehicle_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
+        vehicle = await db.get(Vehicle, vehicle_id)
         if not vehicle:
             raise HTTPException(status_code=404, detail="Vehicle not found")
-        db.delete(vehicle)
-        db.commit()
+        # Deleting the vehicle clears vehicle_id on its assigned users
+        user_ids = (await db.scalars(select(User.user_id).where(User.vehicle_id == vehicle_id))).all()
+        await db.delete(vehicle)
+        await orphan_rollups(db, "vehicle_id", vehicle_id)
+        await db.commit()
+        await vehicle_cache.invalidate(vehicle_id)
+        await user_cache.invalidate(*user_ids)
         return {"message": "Vehicle deleted successfully"}
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.put("/api/assign_vehicle_by_email/")
-def assign_vehicle_by_email(email: str, vehicle_id: int, db: Session = Depends(get_db)):
+@router.put("/api/assign_vehicle_by_email/")
+async def assign_vehicle_by_email(email: str, vehicle_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        user = db.query(User).filter(User.email == email).first()
+        user = await db.scalar(select(User).where(User.email == email))
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
 
-        vehicle = db.query(Vehicle).filter(Vehicle.id == vehicle_id).first()
-        if not vehicle:
+        if not await vehicle_record(db, vehicle_id):
             raise HTTPException(status_code=404, detail="Vehicle not found")
 
-        db.query(User).filter(User.email == email).update(
-            {"vehicle_id": vehicle_id})
-        db.commit()
-        db.refresh(user)
+        await db.execute(update(User).where(User.email == email).values(
+            vehicle_id=vehicle_id))
+        await db.commit()
+        await user_cache.invalidate(user.user_id)
+        await db.refresh(user)
         return {"message": "Vehicle assigned successfully", "user": {"user_id": user.user_id, "email": user.email, "vehicle_id": user.vehicle_id}}
     except Exception as e:
-        logger.error(f"Error assigning vehicle: {str(e)}")
+        logger.error("Error assigning vehicle: %s", e)
         raise HTTPException(status_code=500, detail="Failed to assign vehicle")
 
 
-@app.get("/api/vehicles/assigned", response_model=VehicleResponse)
-def get_assigned_vehicle(db: Session = Depends(get_db)):
+@router.get("/api/vehicles/assigned", response_model=VehicleResponse)
+async def get_assigned_vehicle(current_user: CurrentUser = Depends(require_employee),
+                               db: AsyncSession = Depends(get_db)):
     try:
-        # This assumes the request includes a way to identify the user (e.g., via a header or context)
-        # For now, we'll need to pass the email via query parameter or header since no auth is used
-        email = None  # You might need to get this from a request header or query param
-        if not email:
-            raise HTTPException(
-                status_code=400, detail="Email is required to fetch assigned vehicle")
-
-        user = db.query(User).filter(User.email == email).first()
-        if not user or user.vehicle_id is None:
+        user = await user_entry(db, current_user.user_id)
+        if not user or user["vehicle_id"] is None:
             raise HTTPException(status_code=404, detail="No vehicle assigned")
 
-        vehicle = db.query(Vehicle).filter(
-            Vehicle.id == user.vehicle_id).first()
+        vehicle = await vehicle_record(db, user["vehicle_id"])
         if not vehicle:
             raise HTTPException(
                 status_code=404, detail="Assigned vehicle not found")
         return vehicle
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Error fetching assigned vehicle: {str(e)}")
-        # User CRUD Endpoints
+        logger.error("Error fetching assigned vehicle: %s", e)
         raise HTTPException(
             status_code=500, detail="Failed to fetch assigned vehicle")
 
+# User CRUD Endpoints
 
-@app.post("/api/add_user/", response_model=UserResponse)
-def create_user(user: UserCreate, db: Session = Depends(get_db)):
+
+@router.post("/api/add_user/", response_model=UserResponse,
+          dependencies=[Depends(query_budget(4, "create_user"))])
+async def create_user(user: UserCreate, db: AsyncSession = Depends(get_db)):
     try:
-        if db.query(User).filter(User.email == user.email).first():
+        if await db.scalar(select(User.user_id).where(User.email == user.email)):
             raise HTTPException(
                 status_code=400, detail="User with this email already exists")
         if user.vehicle_id:
             if user.role == "admin":
                 raise HTTPException(
                     status_code=400, detail="Admins cannot be assigned a vehicle")
-            if not db.query(Vehicle).filter(Vehicle.id == user.vehicle_id).first():
+            if not await vehicle_record(db, user.vehicle_id):
                 raise HTTPException(
                     status_code=400, detail=f"Vehicle with ID {user.vehicle_id} not found")
         db_user = User(name=user.name, email=user.email,
-                       hashed_password=user.password, role=user.role, vehicle_id=user.vehicle_id)
+                       hashed_password=await hash_password(user.password), role=user.role,
+                       vehicle_id=user.vehicle_id)
         db.add(db_user)
-        db.commit()
-        db.refresh(db_user)
-        return db_user
+        await db.commit()
+        return await load_user(db, db_user.user_id)
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.get("/api/get_user/{user_id}", response_model=UserResponse)
-def get_user(user_id: int, db: Session = Depends(get_db)):
+@router.get("/api/get_user/{user_id}", response_model=UserResponse,
+          dependencies=[Depends(query_budget(1, "get_user"))])
+async def get_user(user_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        user = db.query(User).filter(User.user_id == user_id).first()
+        user = await user_record(db, user_id)
         if not user:
             raise HTTPException(
                 status_code=404, detail=f"User with ID {user_id} not found")
         return user
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.get("/api/get_all_users/", response_model=List[UserResponse])
-def get_all_users(db: Session = Depends(get_db)):
+@router.get("/api/get_all_users/", response_model=List[UserResponse],
+          dependencies=[Depends(query_budget(2, "get_all_users")),
+                       Depends(conditional_get(User, Vehicle))])
+async def get_all_users(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    sort: str = "user_id",
+    desc: bool = False,
+    stream: bool = False,
+    fmt: str = Depends(response_format),
+    db: AsyncSession = Depends(get_db)
+):
     try:
-        users = db.query(User).all()
-        if not users:
+        fast = FAST_SERIALIZATION and fmt == "json" and not stream
+        query = select_rows(User, UserResponse) if fast else \
+            select(User).options(*loader_options(User, UserResponse))
+        query, next_cursor = paginate(
+            query, User, "user_id", sort, USER_SORT_COLUMNS, limit, after, desc)
+        if stream:
+            if fmt != "json":
+                raise HTTPException(status_code=400, detail="Only format=json can be streamed")
+            return StreamingResponse(
+                stream_ndjson(query, UserResponse), media_type="application/x-ndjson")
+        users = (await db.execute(query) if fast else await db.scalars(query)).all()
+        if not users and not after:
             raise HTTPException(status_code=404, detail="No users found")
+        cursor = next_cursor(users)
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
+        if fast:
+            return FastJSONResponse(rows_to_dicts(users, User, UserResponse), headers=response.headers)
+        if fmt != "json":
+            return list_response(users, UserResponse, fmt, response.headers)
         return users
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.put("/api/update_user/{user_id}", response_model=UserResponse)
-def update_user(user_id: int, user: UserCreate, db: Session = Depends(get_db)):
+@router.put("/api/update_user/{user_id}", response_model=UserResponse,
+          dependencies=[Depends(query_budget(4, "update_user"))])
+async def update_user(user_id: int, user: UserCreate, db: AsyncSession = Depends(get_db)):
     try:
-        db_user = db.query(User).filter(User.user_id == user_id).first()
+        db_user = await db.get(User, user_id)
         if not db_user:
             raise HTTPException(status_code=404, detail="User not found")
         if user.vehicle_id:
             if user.role == "admin":
                 raise HTTPException(
                     status_code=400, detail="Admins cannot be assigned a vehicle")
-            if not db.query(Vehicle).filter(Vehicle.id == user.vehicle_id).first():
+            if not await vehicle_record(db, user.vehicle_id):
                 raise HTTPException(
                     status_code=400, detail=f"Vehicle with ID {user.vehicle_id} not found")
-        db.query(User).filter(User.user_id == user_id).update({
+        await db.execute(update(User).where(User.user_id == user_id).values({
             "name": user.name,
             "email": user.email,
-            "hashed_password": user.password,
+            "hashed_password": await hash_password(user.password),
             "role": user.role,
             "vehicle_id": user.vehicle_id
-        })
-        db.commit()
-        db.refresh(db_user)
-        return db_user
+        }))
+        await db.commit()
+        await user_cache.invalidate(user_id)
+        return await load_user(db, user_id)
+    except HTTPException:
+        await db.rollback()
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.delete("/api/delete_user/{user_id}")
-def delete_user(user_id: int, db: Session = Depends(get_db)):
+@router.delete("/api/delete_user/{user_id}")
+async def delete_user(user_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        user = db.query(User).filter(User.user_id == user_id).first()
+        user = await db.get(User, user_id)
         if not user:
             raise HTTPException(status_code=404, detail="User not found")
-        db.delete(user)
-        db.commit()
+        await db.delete(user)
+        await orphan_rollups(db, "user_id", user_id)
+        await db.commit()
+        await user_cache.invalidate(user_id)
         return {"message": "User deleted successfully"}
     except Exception as e:
         raise HTTPException(
@@ -350,48 +622,90 @@ def delete_user(user_id: int, db: Session = Depends(get_db)):
 # add/log trip
 
 
-@app.post("/api/add_trip/", response_model=TripResponse)
-def create_trip(trip: TripCreate, db: Session = Depends(get_db)):
+@router.post("/api/add_trip/", response_model=TripResponse)
+async def create_trip(trip: TripCreate, db: AsyncSession = Depends(get_db)):
     try:
-        if not db.query(Vehicle).filter(Vehicle.id == trip.vehicle_id).first():
+        if not await vehicle_record(db, trip.vehicle_id):
             raise HTTPException(
                 status_code=400, detail=f"Vehicle with ID {trip.vehicle_id} not found")
-        if not db.query(User).filter(User.user_id == trip.user_id).first():
+        if not await user_entry(db, trip.user_id):
             raise HTTPException(
                 status_code=400, detail=f"User with ID {trip.user_id} not found")
         db_trip = Trip(**trip.model_dump())
         db.add(db_trip)
-        db.commit()
-        db.refresh(db_trip)
+        await db.flush()
+        await record_trip_change(db, None, trip_values(db_trip))
+        await apply_odometer(db, odometer_changes(None, trip_values(db_trip)))
+        await db.commit()
+        await odometer_committed(db)
+        await db.refresh(db_trip)
         return db_trip
+    except HTTPException:
+        raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 # get a specific trip
 
 
-@app.get("/api/get_trip/{trip_id}", response_model=TripResponse)
-def get_trip(trip_id: int, db: Session = Depends(get_db)):
+@router.get("/api/get_trip/{trip_id}", response_model=TripResponse,
+          dependencies=[Depends(query_budget(1, "get_trip"))])
+async def get_trip(trip_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        trip = db.query(Trip).filter(Trip.trip_id == trip_id).first()
+        # Rows of archived months are read from the archive files
+        trip = await db.get(Trip, trip_id) or await find_archived("trips", trip_id)
         if not trip:
             raise HTTPException(
                 status_code=404, detail=f"Trip with ID {trip_id} not found")
         return trip
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.get("/api/get_all_trips/", response_model=List[TripResponse])
-def get_all_trips(db: Session = Depends(get_db)):
+@router.get("/api/get_all_trips/", response_model=List[TripResponse],
+          dependencies=[Depends(query_budget(2, "get_all_trips")),
+                       Depends(conditional_get(Trip))])
+async def get_all_trips(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    sort: str = "trip_id",
+    desc: bool = False,
+    stream: bool = False,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    fmt: str = Depends(response_format),
+    db: AsyncSession = Depends(get_db)
+):
     try:
-        trips = db.query(Trip).all()
-        if not trips:
+        fast = FAST_SERIALIZATION and fmt == "json" and not stream
+        query, next_cursor = paginate(
+            (select_rows(Trip, TripResponse) if fast else select(Trip))
+            .where(*date_range(Trip.trip_date, start_date, end_date)), Trip, "trip_id", sort,
+            TRIP_SORT_COLUMNS, limit, after, desc)
+        if stream:
+            if fmt != "json":
+                raise HTTPException(status_code=400, detail="Only format=json can be streamed")
+            return StreamingResponse(
+                stream_ndjson(query, TripResponse), media_type="application/x-ndjson")
+        trips = (await db.execute(query) if fast else await db.scalars(query)).all()
+        if not trips and not after:
             raise HTTPException(status_code=404, detail="No trips found")
+        cursor = next_cursor(trips)
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
+        if fast:
+            return FastJSONResponse(rows_to_dicts(trips, Trip, TripResponse), headers=response.headers)
+        if fmt != "json":
+            return list_response(trips, TripResponse, fmt, response.headers)
         return trips
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
@@ -399,41 +713,78 @@ def get_all_trips(db: Session = Depends(get_db)):
 # get trips of a user
 
 
-@app.get("/api/get_user_trips/{user_id}", response_model=List[TripResponse])
-def get_user_trips(user_id: int, db: Session = Depends(get_db)):
+@router.get("/api/get_user_trips/{user_id}", response_model=List[TripResponse],
+          dependencies=[Depends(query_budget(2, "get_user_trips")),
+                       Depends(conditional_get(Trip))])
+async def get_user_trips(user_id: int, response: Response,
+                         start_date: Optional[date] = None, end_date: Optional[date] = None,
+                         fmt: str = Depends(response_format),
+                         db: AsyncSession = Depends(get_db)):
     try:
-        trips = db.query(Trip).filter(Trip.user_id == user_id).all()
+        trips = (await db.scalars(select(Trip).where(
+            Trip.user_id == user_id, *date_range(Trip.trip_date, start_date, end_date)))).all()
         if not trips:
             raise HTTPException(
                 status_code=404, detail="No trips found for this user")
+        if fmt != "json":
+            return list_response(trips, TripResponse, fmt, response.headers)
         return trips
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.put("/api/update_trip/{trip_id}", response_model=TripResponse)
-def update_trip(trip_id: int, trip: TripCreate, db: Session = Depends(get_db)):
-    db_trip = db.query(Trip).filter(
-        Trip.trip_id == trip_id).first()
-    if not db_trip:
-        raise HTTPException(status_code=404, detail="Trip not found")
-    for key, value in trip.dict(exclude_unset=True).items():
-        setattr(db_trip, key, value)
-    db.commit()
-    db.refresh(db_trip)
-    return db_trip
+@router.put("/api/update_trip/{trip_id}", response_model=TripResponse)
+async def update_trip(trip_id: int, trip: TripCreate, db: AsyncSession = Depends(get_db)):
+    try:
+        # Locked, so concurrent updates of one trip see each other's status
+        db_trip = await db.scalar(select(Trip).where(Trip.trip_id == trip_id).with_for_update()
+                                  .execution_options(populate_existing=True))
+        if not db_trip:
+            raise HTTPException(status_code=404, detail="Trip not found")
+        old_values = trip_values(db_trip)
+        for key, value in trip.model_dump(exclude_unset=True).items():
+            setattr(db_trip, key, value)
+        new_values = trip_values(db_trip)
+        try:
+            check_transition(old_values["trip_status"], new_values["trip_status"])
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        await db.flush()
+        await record_trip_change(db, old_values, new_values)
+        await apply_odometer(db, odometer_changes(old_values, new_values))
+        await db.commit()
+        await odometer_committed(db)
+        await db.refresh(db_trip)
+        return db_trip
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.delete("/api/delete_trip/{trip_id}")
-def delete_trip(trip_id: int, db: Session = Depends(get_db)):
+@router.delete("/api/delete_trip/{trip_id}")
+async def delete_trip(trip_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        trip = db.query(Trip).filter(Trip.trip_id == trip_id).first()
+        trip = await db.scalar(select(Trip).where(Trip.trip_id == trip_id).with_for_update()
+                               .execution_options(populate_existing=True))
         if not trip:
             raise HTTPException(status_code=404, detail="Trip not found")
-        db.delete(trip)
-        db.commit()
+        old_values = trip_values(trip)
+        await record_trip_change(db, old_values, None)
+        await db.delete(trip)
+        await db.flush()
+        await apply_odometer(db, odometer_changes(old_values, None))
+        await db.commit()
+        await odometer_committed(db)
         return {"message": "Trip deleted successfully"}
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
@@ -441,28 +792,27 @@ def delete_trip(trip_id: int, db: Session = Depends(get_db)):
 # ServiceNotification CRUD Endpoints
 
 
-@app.post("/api/add_service_notification/", response_model=ServiceNotificationResponse)
-def create_service_notification(notification: ServiceNotificationCreate, db: Session = Depends(get_db)):
+@router.post("/api/add_service_notification/", response_model=ServiceNotificationResponse)
+async def create_service_notification(notification: ServiceNotificationCreate, db: AsyncSession = Depends(get_db)):
     try:
-        if not db.query(Vehicle).filter(Vehicle.id == notification.vehicle_id).first():
+        if not await vehicle_record(db, notification.vehicle_id):
             raise HTTPException(
                 status_code=400, detail=f"Vehicle with ID {notification.vehicle_id} not found")
         db_notification = ServiceNotification(**notification.model_dump())
         db.add(db_notification)
-        db.commit()
-        db.refresh(db_notification)
+        await db.commit()
+        await db.refresh(db_notification)
         return db_notification
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.get("/api/get_service_notification/{notification_id}", response_model=ServiceNotificationResponse)
-def get_service_notification(notification_id: int, db: Session = Depends(get_db)):
+@router.get("/api/get_service_notification/{notification_id}", response_model=ServiceNotificationResponse)
+async def get_service_notification(notification_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        notification = db.query(ServiceNotification).filter(
-            ServiceNotification.notification_id == notification_id).first()
+        notification = await db.get(ServiceNotification, notification_id)
         if not notification:
             raise HTTPException(
                 status_code=404, detail=f"Service Notification with ID {notification_id} not found")
@@ -474,49 +824,61 @@ def get_service_notification(notification_id: int, db: Session = Depends(get_db)
 # Inspection CRUD Endpoints
 
 
-@app.post("/api/add_inspection/", response_model=InspectionResponse)
-def create_inspection(inspection: InspectionCreate, db: Session = Depends(get_db)):
+@router.post("/api/add_inspection/", response_model=InspectionResponse)
+async def create_inspection(inspection: InspectionCreate, db: AsyncSession = Depends(get_db)):
     try:
-        if not db.query(Vehicle).filter(Vehicle.id == inspection.vehicle_id).first():
+        if not await vehicle_record(db, inspection.vehicle_id):
             raise HTTPException(
                 status_code=400, detail=f"Vehicle with ID {inspection.vehicle_id} not found")
-        if not db.query(User).filter(User.user_id == inspection.user_id).first():
+        if not await user_entry(db, inspection.user_id):
             raise HTTPException(
                 status_code=400, detail=f"User with ID {inspection.user_id} not found")
         db_inspection = Inspection(**inspection.model_dump())
         db.add(db_inspection)
-        db.commit()
-        db.refresh(db_inspection)
+        await db.commit()
+        await db.refresh(db_inspection)
         return db_inspection
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.get("/api/get_inspection/{inspection_id}", response_model=InspectionResponse)
-def get_inspection(inspection_id: int, db: Session = Depends(get_db)):
+@router.get("/api/get_inspection/{inspection_id}", response_model=InspectionResponse,
+          dependencies=[Depends(query_budget(1, "get_inspection"))])
+async def get_inspection(inspection_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        inspection = db.query(Inspection).filter(
-            Inspection.inspection_id == inspection_id).first()
+        # Rows of archived months are read from the archive files
+        inspection = await db.get(Inspection, inspection_id) or await find_archived("inspections", inspection_id)
         if not inspection:
             raise HTTPException(
                 status_code=404, detail=f"Inspection with ID {inspection_id} not found")
         return inspection
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.get("/api/get_inspections_by_vehicle/{vehicle_id}", response_model=List[InspectionResponse])
-def get_inspections_by_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
+@router.get("/api/get_inspections_by_vehicle/{vehicle_id}", response_model=List[InspectionResponse],
+          dependencies=[Depends(query_budget(2, "get_inspections_by_vehicle")),
+                       Depends(conditional_get(Inspection))])
+async def get_inspections_by_vehicle(vehicle_id: int, response: Response,
+                                     start_date: Optional[date] = None, end_date: Optional[date] = None,
+                                     fmt: str = Depends(response_format),
+                                     db: AsyncSession = Depends(get_db)):
     try:
-        inspections = db.query(Inspection).filter(
-            Inspection.vehicle_id == vehicle_id).all()
+        inspections = (await db.scalars(select(Inspection).where(
+            Inspection.vehicle_id == vehicle_id, *date_range(Inspection.date, start_date, end_date)))).all()
         if not inspections:
             raise HTTPException(
                 status_code=404, detail="No inspections found for this vehicle")
+        if fmt != "json":
+            return list_response(inspections, InspectionResponse, fmt, response.headers)
         return inspections
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
@@ -524,13 +886,46 @@ def get_inspections_by_vehicle(vehicle_id: int, db: Session = Depends(get_db)):
 # get all inspections
 
 
-@app.get("/api/get_all_inspections/", response_model=List[InspectionResponse])
-def get_all_inspections(db: Session = Depends(get_db)):
+@router.get("/api/get_all_inspections/", response_model=List[InspectionResponse],
+          dependencies=[Depends(query_budget(2, "get_all_inspections")),
+                       Depends(conditional_get(Inspection))])
+async def get_all_inspections(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    sort: str = "inspection_id",
+    desc: bool = False,
+    stream: bool = False,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    fmt: str = Depends(response_format),
+    db: AsyncSession = Depends(get_db)
+):
     try:
-        inspections = db.query(Inspection).all()
-        if not inspections:
+        fast = FAST_SERIALIZATION and fmt == "json" and not stream
+        query, next_cursor = paginate(
+            (select_rows(Inspection, InspectionResponse) if fast else select(Inspection))
+            .where(*date_range(Inspection.date, start_date, end_date)),
+            Inspection, "inspection_id", sort,
+            INSPECTION_SORT_COLUMNS, limit, after, desc)
+        if stream:
+            if fmt != "json":
+                raise HTTPException(status_code=400, detail="Only format=json can be streamed")
+            return StreamingResponse(
+                stream_ndjson(query, InspectionResponse), media_type="application/x-ndjson")
+        inspections = (await db.execute(query) if fast else await db.scalars(query)).all()
+        if not inspections and not after:
             raise HTTPException(status_code=404, detail="No inspections found")
+        cursor = next_cursor(inspections)
+        if cursor:
+            response.headers[NEXT_CURSOR_HEADER] = cursor
+        if fast:
+            return FastJSONResponse(rows_to_dicts(inspections, Inspection, InspectionResponse), headers=response.headers)
+        if fmt != "json":
+            return list_response(inspections, InspectionResponse, fmt, response.headers)
         return inspections
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
@@ -538,45 +933,424 @@ def get_all_inspections(db: Session = Depends(get_db)):
 # ServiceHistory CRUD Endpoints
 
 
-@app.post("/api/add_service_history/", response_model=ServiceHistoryResponse)
-def create_service_history(service_history: ServiceHistoryCreate, db: Session = Depends(get_db)):
+@router.post("/api/add_service_history/", response_model=ServiceHistoryResponse)
+async def create_service_history(service_history: ServiceHistoryCreate, db: AsyncSession = Depends(get_db)):
     try:
-        if not db.query(Vehicle).filter(Vehicle.id == service_history.vehicle_vin).first():
+        if not await vehicle_record(db, service_history.vehicle_vin):
             raise HTTPException(
                 status_code=400, detail=f"Vehicle with ID {service_history.vehicle_vin} not found")
         db_service_history = ServiceHistory(**service_history.model_dump())
         db.add(db_service_history)
-        db.commit()
-        db.refresh(db_service_history)
+        await db.commit()
+        await db.refresh(db_service_history)
         return db_service_history
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
 
-@app.get("/api/get_service_history/{service_id}", response_model=ServiceHistoryResponse)
-def get_service_history(service_id: int, db: Session = Depends(get_db)):
+@router.get("/api/get_service_history/{service_id}", response_model=ServiceHistoryResponse)
+async def get_service_history(service_id: int, db: AsyncSession = Depends(get_db)):
     try:
-        service_history = db.query(ServiceHistory).filter(
-            ServiceHistory.service_id == service_id).first()
+        # Rows of archived months are read from the archive files
+        service_history = await db.get(ServiceHistory, service_id) or await find_archived("service_history", service_id)
         if not service_history:
             raise HTTPException(
                 status_code=404, detail=f"Service History with ID {service_id} not found")
         return service_history
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Export Endpoints
+# CSV and XLSX downloads of whole tables, streamed as they are read (see
+# exports.py); memory stays flat however many rows match.
+
+
+@router.get("/api/export/{kind}", response_class=StreamingResponse,
+         responses={200: {"content": {CSV_MEDIA_TYPE: {}, GZIP_MEDIA_TYPE: {}, XLSX_MEDIA_TYPE: {}}}})
+async def export_rows(
+    kind: str,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    vehicle_id: Optional[int] = None,
+    format: str = Query("csv", description="csv or xlsx"),
+    gzip: bool = Query(False, description="send the CSV as a .csv.gz file")
+):
+    try:
+        try:
+            spec = parse_export(kind, format)
+            sql = export_sql(spec, start_date, end_date, vehicle_id)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        check_date_range(start_date, end_date)
+        filename = export_filename(kind, format, gzip and format == "csv", vehicle_id, start_date, end_date)
+        headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+        archived = ARCHIVED_TABLES.get(kind)
+        archived_before = hot_since(archived) if archived else None
+        if archived_before and (not start_date or start_date < archived_before):
+            headers[ARCHIVED_BEFORE_HEADER] = archived_before.isoformat()
+        if format == "xlsx":
+            return StreamingResponse(xlsx_stream(sql, spec.columns, kind), media_type=XLSX_MEDIA_TYPE,
+                                     headers=headers)
+        return StreamingResponse(csv_stream(sql, gzip), media_type=GZIP_MEDIA_TYPE if gzip else CSV_MEDIA_TYPE,
+                                 headers=headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+# History Endpoint
+# Trips, inspections and service history over the database and the archive
+# files of closed months together (see archive.py), in (date, id) order.
+# Archived rows are filtered and projected inside the Parquet reader, so
+# naming the columns and a vehicle or date range keeps old queries cheap.
+
+
+@router.get("/api/history/{kind}",
+         dependencies=[Depends(query_budget(2, "get_history")),
+                       Depends(conditional_get(Trip, Inspection, ServiceHistory))])
+async def get_history(
+    kind: str,
+    response: Response,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    vehicle_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    columns: Optional[str] = Query(None, description="comma separated; the date and id are always included"),
+    limit: int = Query(MAX_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    fmt: str = Depends(response_format),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        try:
+            table = parse_kind(kind)
+            selected = parse_columns(table, columns)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        check_date_range(start_date, end_date)
+        equals = {}
+        if vehicle_id is not None:
+            equals[table.vehicle] = vehicle_id
+        if user_id is not None:
+            if not table.user:
+                raise HTTPException(status_code=400, detail=f"{kind} cannot be filtered by user_id")
+            equals[table.user] = user_id
+        cursor = None
+        if after:
+            after_date, after_id = decode_cursor(after)
+            try:
+                cursor = (date.fromisoformat(after_date), int(after_id))
+            except (TypeError, ValueError):
+                raise HTTPException(status_code=400, detail="Invalid cursor")
+        rows = await history(db, table, selected, start_date, end_date, equals, cursor, limit)
+        if len(rows) == limit:
+            response.headers[NEXT_CURSOR_HEADER] = encode_cursor(rows[-1][table.date], rows[-1][table.pk])
+        if fmt == "json":
+            return FastJSONResponse(rows, headers=response.headers)
+        names = list(rows[0]) if rows else list(dict.fromkeys([*selected, table.date, table.pk]))
+        values = {name: [row[name] for row in rows] for name in names}
+        if fmt == "arrow":
+            return Response(arrow_ipc(values), media_type=ARROW_MEDIA_TYPE, headers=response.headers)
+        return Response(to_json(values), media_type="application/json", headers=response.headers)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Analytics Endpoints
+# Aggregates are computed in Postgres so the dashboard no longer downloads
+# every trip to add them up in the browser.
+
+
+@router.get("/api/analytics/fleet", response_model=FleetAnalyticsResponse,
+         dependencies=[Depends(query_budget(2, "get_fleet_analytics")),
+                       Depends(conditional_get(Trip, Vehicle, User))])
+async def get_fleet_analytics(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        breakdown = await trip_breakdown(db, trip_filters(start_date, end_date))
+        return {"start_date": start_date, "end_date": end_date, **breakdown}
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.get("/api/analytics/vehicle/{vehicle_id}", response_model=VehicleAnalyticsResponse,
+         dependencies=[Depends(query_budget(3, "get_vehicle_analytics")),
+                       Depends(conditional_get(Trip, Vehicle, User))])
+async def get_vehicle_analytics(
+    vehicle_id: int,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        if not await db.scalar(select(Vehicle.id).where(Vehicle.id == vehicle_id)):
+            raise HTTPException(
+                status_code=404, detail=f"Vehicle with ID {vehicle_id} not found")
+        breakdown = await trip_breakdown(
+            db, trip_filters(start_date, end_date, vehicle_id))
+        breakdown.pop("by_vehicle")
+        return {"vehicle_id": vehicle_id, "start_date": start_date, "end_date": end_date, **breakdown}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Bulk ingestion Endpoints
+# Each accepts a JSON array or an NDJSON stream (Content-Type: application/x-ndjson)
+# and reports failures per row instead of rejecting the whole upload.
+
+
+@router.post("/api/bulk/trips", response_model=BulkResult)
+async def bulk_create_trips(request: Request, db: AsyncSession = Depends(get_db)):
+    try:
+        result = await ingest(db, TRIP_BULK, read_rows(request))
+        await odometer_committed(db)
+        return result
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.post("/api/bulk/inspections", response_model=BulkResult)
+async def bulk_create_inspections(request: Request, db: AsyncSession = Depends(get_db)):
+    try:
+        return await ingest(db, INSPECTION_BULK, read_rows(request))
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.post("/api/bulk/service_history", response_model=BulkResult)
+async def bulk_create_service_history(request: Request, db: AsyncSession = Depends(get_db)):
+    try:
+        return await ingest(db, SERVICE_HISTORY_BULK, read_rows(request))
+    except HTTPException:
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+# PDF reports, rendered in a process pool and cached on disk (see reports.py)
+
+
+@router.get("/api/reports/inspections", response_class=FileResponse,
+         responses={200: {"content": {"application/pdf": {}}}})
+async def get_inspection_report(
+    request: Request,
+    vehicle_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        report = await inspection_report(db, vehicle_id, start_date, end_date)
+        await db.close()
+        key, path = await ensure_rendered(report)
+        return file_response(request.headers, key, path,
+                             report_filename("inspections", vehicle_id, None, start_date, end_date))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.get("/api/reports/trips", response_class=FileResponse,
+         responses={200: {"content": {"application/pdf": {}}}})
+async def get_trip_report(
+    request: Request,
+    vehicle_id: Optional[int] = None,
+    user_id: Optional[int] = None,
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        report = await trip_report(db, vehicle_id, user_id, start_date, end_date)
+        await db.close()
+        key, path = await ensure_rendered(report)
+        return file_response(request.headers, key, path,
+                             report_filename("trips", vehicle_id, user_id, start_date, end_date))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+
+@router.post("/api/reports/monthly", response_model=ReportJobResponse, status_code=202)
+async def create_monthly_reports(
+    month: str = Query(..., description="YYYY-MM"),
+    kinds: Optional[str] = Query(None, description="Comma separated subset of inspections, trips"),
+    db: AsyncSession = Depends(get_db)
+):
+    try:
+        job = await start_job(db, parse_month(month), parse_kinds(kinds))
+        return job_response(job)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Internal server error: {str(e)}")
 
+
+@router.get("/api/reports/jobs/{job_id}", response_model=ReportJobResponse)
+async def get_report_job(job_id: int, db: AsyncSession = Depends(get_db)):
+    job = await db.get(ReportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    return job_response(job)
+
+
+@router.get("/api/reports/jobs/{job_id}/archive", response_class=FileResponse,
+         responses={200: {"content": {"application/zip": {}}}})
+async def get_report_job_archive(job_id: int, request: Request, db: AsyncSession = Depends(get_db)):
+    job = await db.get(ReportJob, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Report job not found")
+    path = cache_path(job.archive_key, ".zip") if job.archive_key else None
+    if not path or not os.path.exists(path):
+        raise HTTPException(status_code=404, detail="Report archive not available")
+    return file_response(request.headers, job.archive_key, path,
+                         f"reports_{job.month.strftime('%Y-%m')}.zip", "application/zip")
+
+# Connection pool health, per worker process
+
+
+@router.get("/api/metrics/db_pool")
+async def get_db_pool_metrics():
+    from .database import engine, async_engine
+    from .metrics import pool_snapshot
+    return {"sync": pool_snapshot(engine.pool), "async": pool_snapshot(async_engine.pool)}
+
+# Read-through cache counters, per worker process
+
+
+@router.get("/api/metrics/cache")
+async def get_cache_metrics():
+    return {"vehicle": vehicle_cache.snapshot(), "user": user_cache.snapshot()}
+
+# Push channel subscribers and delivery counters, per worker process
+
+
+@router.get("/api/metrics/events")
+async def get_event_metrics():
+    return broadcaster.snapshot()
+
+# Per-route request timing, SQL statements and recent slow queries
+
+
+@router.get("/api/metrics/requests")
+async def get_request_metrics():
+    return request_metrics.snapshot()
+
+# Prometheus scrape endpoint, per worker process
+
+
+@router.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    from .database import engine, async_engine
+    return Response(render_prometheus({"sync": engine.pool, "async": async_engine.pool}),
+                    media_type="text/plain; version=0.0.4; charset=utf-8")
+
+# Password hashing pool load, per worker process
+
+
+@router.get("/api/metrics/auth")
+async def get_auth_metrics():
+    return password_hash_snapshot()
+
+# Email outbox depth and delivery latency
+
+
+@router.get("/api/metrics/email_outbox")
+async def get_email_outbox_metrics(db: AsyncSession = Depends(get_db)):
+    try:
+        return await outbox_snapshot(db)
+    except Exception as e:
+        raise HTTPException(
+            status_code=500, detail=f"Internal server error: {str(e)}")
+
+# Liveness: the process is up. Readiness: the database is reachable and
+# migrated, so this worker can take traffic
+
+
+@router.get("/healthz", include_in_schema=False)
+async def healthz():
+    return {"status": "ok"}
+
+
+@router.get("/readyz", include_in_schema=False)
+async def readyz(request: Request):
+    readiness = request.app.state.readiness
+    state = readiness.snapshot()
+    if readiness.ready:
+        state["error"] = await database_reachable()
+    ready = readiness.ready and state["error"] is None
+    return FastJSONResponse({"status": "ready" if ready else "not ready", **state},
+                            status_code=200 if ready else 503)
+
 # Test database connection
 
 
-@app.get("/api/test_db")
-def test_db(db: Session = Depends(get_db)):
+@router.get("/api/test_db")
+async def test_db(db: AsyncSession = Depends(get_db)):
     from sqlalchemy.sql import text
     try:
-        result = db.execute(text("SELECT 1"))
+        result = await db.execute(text("SELECT 1"))
         return {"status": "success", "message": "Database connection working"}
     except Exception as e:
         raise HTTPException(
             status_code=500, detail=f"Database connection failed: {str(e)}")
+
+
+def create_app() -> FastAPI:
+    check_jwt_secret()
+    app = FastAPI(lifespan=lifespan)
+
+    # Add CORS middleware
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=[NEXT_CURSOR_HEADER, ARCHIVED_BEFORE_HEADER, "Content-Disposition", "ETag", "Last-Modified"],
+    )
+
+    # Compress larger responses with brotli or gzip, whichever the client accepts
+    app.add_middleware(CompressionMiddleware)
+
+    # Per-route latency, SQL and response size metrics; added last so it is
+    # outermost and times the whole stack
+    app.add_middleware(RequestMetricsMiddleware)
+
+    app.include_router(router)
+    return app
+
+
+app = create_app()
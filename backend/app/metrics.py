@@ -0,0 +1,131 @@
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, Optional, Sequence
+
+from sqlalchemy import event
+from sqlalchemy import exc as sa_exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+# In-process metrics. Each uvicorn worker keeps its own counters, so a
+# scraper sees one worker per request; that is what pool sizing needs since
+# pools are per process too.
+
+# Checkout waits are mostly sub-millisecond; the upper buckets catch pool
+# exhaustion, which tops out at pool_timeout.
+WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    def __init__(self, buckets: Sequence[float]):
+        self.buckets = tuple(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        # first bucket whose upper bound is >= value
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._sum
+        cumulative, buckets = 0, {}
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {"count": cumulative, "sum": round(total, 6), "buckets": buckets}
+
+
+class PoolMetrics:
+    def __init__(self):
+        self.checkout_wait = Histogram(WAIT_BUCKETS)
+        self.checkouts = 0
+        self.checkout_timeouts = 0
+        self.connects = 0
+        self.closes = 0
+        self.invalidations = 0
+        self._lock = threading.Lock()
+
+    def incr(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+_pool_metrics: Dict[str, PoolMetrics] = {}
+
+
+def get_pool_metrics(name: Optional[str]) -> PoolMetrics:
+    return _pool_metrics.setdefault(name or "default", PoolMetrics())
+
+
+class _TimedCheckoutMixin:
+    """Times how long a caller waits for a connection from the pool.
+
+    The measured time includes opening a new connection when the pool has
+    to grow, which is part of the latency a request actually sees.
+    """
+
+    def _do_get(self):
+        metrics = get_pool_metrics(getattr(self, "logging_name", None))
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except sa_exc.TimeoutError:
+            metrics.incr("checkout_timeouts")
+            raise
+        finally:
+            metrics.checkout_wait.observe(time.perf_counter() - started)
+
+
+class TimedQueuePool(_TimedCheckoutMixin, QueuePool):
+    pass
+
+
+class TimedAsyncAdaptedQueuePool(_TimedCheckoutMixin, AsyncAdaptedQueuePool):
+    pass
+
+
+def instrument_pool(engine, name: str):
+    """Count checkouts and connection churn for ``engine`` (a sync Engine)."""
+    metrics = get_pool_metrics(name)
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.incr("checkouts")
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        metrics.incr("connects")
+
+    @event.listens_for(engine, "close")
+    def on_close(dbapi_connection, connection_record):
+        metrics.incr("closes")
+
+    @event.listens_for(engine, "close_detached")
+    def on_close_detached(dbapi_connection):
+        metrics.incr("closes")
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        metrics.incr("invalidations")
+
+
+def pool_snapshot(pool) -> dict:
+    metrics = get_pool_metrics(getattr(pool, "logging_name", None))
+    return {
+        "pool_size": pool.size(),
+        "checked_out": pool.checkedout(),
+        "checked_in": pool.checkedin(),
+        "overflow": pool.overflow(),
+        "checkouts": metrics.checkouts,
+        "checkout_timeouts": metrics.checkout_timeouts,
+        "checkout_wait_seconds": metrics.checkout_wait.snapshot(),
+        "connections_opened": metrics.connects,
+        "connections_closed": metrics.closes,
+        "invalidations": metrics.invalidations,
+    }
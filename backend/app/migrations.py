@@ -0,0 +1,311 @@
+import argparse
+import logging
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import text
+
+from .changes import CHANGE_FUNCTION, ensure_change_triggers
+
+# Versioned schema migrations, applied by a separate command before the API
+# starts (python -m app.migrations upgrade; the compose files run it as a
+# one-shot service) instead of by every worker on every boot. Applied
+# versions are recorded in schema_migrations and each migration runs in its
+# own transaction under an advisory lock, so concurrent runs apply it once.
+# The API never changes the schema: /readyz reports not ready until the
+# database is at HEAD.
+#
+# Migration 1 brings a database created by the old startup code, or an
+# empty one, to the version 1 schema. Its DDL is frozen below rather than
+# derived from the models, so a fresh database always passes through the
+# same schema before the later migrations change it; model changes need a
+# new migration, not an edit here.
+
+VERSION_TABLE = "schema_migrations"
+# Arbitrary, shared by every process running migrations against this database
+MIGRATION_LOCK_ID = 7_312_004_221
+
+logger = logging.getLogger(__name__)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    apply: Callable
+
+
+# The schema of version 1; every statement is a no-op on a database the old
+# startup code already created
+BASELINE_TYPES = {
+    "role": ("admin", "employee"),
+    "status": ("completed", "cancelled", "pending"),
+    "inspectiontype": ("pre_trip", "post_trip"),
+    "outboxstatus": ("pending", "sending", "sent", "dead"),
+    "reportjobstatus": ("queued", "running", "done", "failed"),
+}
+
+BASELINE_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    """CREATE TABLE IF NOT EXISTS vehicle (
+        id SERIAL NOT NULL,
+        vin VARCHAR,
+        make VARCHAR NOT NULL,
+        model VARCHAR NOT NULL,
+        year INTEGER NOT NULL,
+        licence_plate VARCHAR,
+        fuel_type VARCHAR,
+        mileage INTEGER NOT NULL,
+        last_service_date DATE NOT NULL,
+        last_service_km INTEGER NOT NULL,
+        PRIMARY KEY (id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_vehicle_id ON vehicle (id)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_vehicle_licence_plate ON vehicle (licence_plate)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_vehicle_vin ON vehicle (vin)",
+    """CREATE INDEX IF NOT EXISTS ix_vehicle_search_trgm ON vehicle USING gist (((((((coalesce(make, '') || ' ')
+        || coalesce(model, '')) || ' ') || coalesce(licence_plate, '')) || ' ') || coalesce(vin, '')) gist_trgm_ops)""",
+    """CREATE TABLE IF NOT EXISTS users (
+        user_id SERIAL NOT NULL,
+        name VARCHAR,
+        email VARCHAR,
+        hashed_password VARCHAR,
+        role role,
+        vehicle_id INTEGER,
+        PRIMARY KEY (user_id),
+        FOREIGN KEY (vehicle_id) REFERENCES vehicle (id)
+    )""",
+    "CREATE UNIQUE INDEX IF NOT EXISTS ix_users_email ON users (email)",
+    "CREATE INDEX IF NOT EXISTS ix_users_user_id ON users (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_users_vehicle_id ON users (vehicle_id)",
+    """CREATE INDEX IF NOT EXISTS ix_users_search_trgm ON users
+        USING gist (((coalesce(name, '') || ' ') || coalesce(email, '')) gist_trgm_ops)""",
+    """CREATE TABLE IF NOT EXISTS trip (
+        trip_id SERIAL NOT NULL,
+        vehicle_id INTEGER,
+        user_id INTEGER,
+        start_location VARCHAR,
+        destination VARCHAR,
+        purpose VARCHAR,
+        trip_date DATE,
+        distance FLOAT,
+        fuel_consumed FLOAT,
+        trip_status status,
+        PRIMARY KEY (trip_id),
+        FOREIGN KEY (vehicle_id) REFERENCES vehicle (id),
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_trip_trip_id ON trip (trip_id)",
+    "CREATE INDEX IF NOT EXISTS ix_trip_user_id ON trip (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_trip_vehicle_id ON trip (vehicle_id)",
+    """CREATE INDEX IF NOT EXISTS ix_trip_search_trgm ON trip USING gist (((((coalesce(start_location, '') || ' ')
+        || coalesce(destination, '')) || ' ') || coalesce(purpose, '')) gist_trgm_ops)""",
+    """CREATE TABLE IF NOT EXISTS "Inspection" (
+        inspection_id SERIAL NOT NULL,
+        vehicle_id INTEGER,
+        user_id INTEGER,
+        type inspectiontype,
+        date DATE,
+        signed_by VARCHAR,
+        status status,
+        PRIMARY KEY (inspection_id),
+        FOREIGN KEY (vehicle_id) REFERENCES vehicle (id),
+        FOREIGN KEY (user_id) REFERENCES users (user_id)
+    )""",
+    'CREATE INDEX IF NOT EXISTS "ix_Inspection_inspection_id" ON "Inspection" (inspection_id)',
+    'CREATE INDEX IF NOT EXISTS "ix_Inspection_user_id" ON "Inspection" (user_id)',
+    'CREATE INDEX IF NOT EXISTS "ix_Inspection_vehicle_id" ON "Inspection" (vehicle_id)',
+    """CREATE TABLE IF NOT EXISTS "ServiceNotification" (
+        notification_id SERIAL NOT NULL,
+        vehicle_id INTEGER,
+        service_date DATE,
+        notified BOOLEAN,
+        PRIMARY KEY (notification_id),
+        FOREIGN KEY (vehicle_id) REFERENCES vehicle (id)
+    )""",
+    'CREATE INDEX IF NOT EXISTS "ix_ServiceNotification_notification_id" ON "ServiceNotification" (notification_id)',
+    'CREATE INDEX IF NOT EXISTS "ix_ServiceNotification_vehicle_id" ON "ServiceNotification" (vehicle_id)',
+    """CREATE TABLE IF NOT EXISTS "ServiceHistory" (
+        service_id SERIAL NOT NULL,
+        vehicle_vin INTEGER,
+        service_date DATE,
+        service_mileage INTEGER,
+        PRIMARY KEY (service_id),
+        FOREIGN KEY (vehicle_vin) REFERENCES vehicle (id)
+    )""",
+    'CREATE INDEX IF NOT EXISTS "ix_ServiceHistory_service_id" ON "ServiceHistory" (service_id)',
+    'CREATE INDEX IF NOT EXISTS "ix_ServiceHistory_vehicle_vin" ON "ServiceHistory" (vehicle_vin)',
+    """CREATE TABLE IF NOT EXISTS trip_daily_rollup (
+        day DATE NOT NULL,
+        vehicle_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        trip_count INTEGER NOT NULL,
+        distance_count INTEGER NOT NULL,
+        total_distance FLOAT NOT NULL,
+        fuel_count INTEGER NOT NULL,
+        total_fuel FLOAT NOT NULL,
+        completed INTEGER NOT NULL,
+        cancelled INTEGER NOT NULL,
+        pending INTEGER NOT NULL,
+        PRIMARY KEY (day, vehicle_id, user_id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_trip_daily_rollup_user_id ON trip_daily_rollup (user_id)",
+    "CREATE INDEX IF NOT EXISTS ix_trip_daily_rollup_vehicle_id ON trip_daily_rollup (vehicle_id)",
+    """CREATE TABLE IF NOT EXISTS table_versions (
+        table_name VARCHAR NOT NULL,
+        version BIGINT NOT NULL,
+        updated_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+        PRIMARY KEY (table_name)
+    )""",
+    """CREATE TABLE IF NOT EXISTS change_log (
+        id BIGSERIAL NOT NULL,
+        txid BIGINT DEFAULT (pg_current_xact_id()::text)::bigint NOT NULL,
+        table_name VARCHAR NOT NULL,
+        row_id INTEGER NOT NULL,
+        op VARCHAR NOT NULL,
+        changed_at TIMESTAMP WITH TIME ZONE DEFAULT clock_timestamp() NOT NULL,
+        PRIMARY KEY (id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_change_log_cursor ON change_log (txid, id)",
+    """CREATE TABLE IF NOT EXISTS email_outbox (
+        id SERIAL NOT NULL,
+        to_email VARCHAR NOT NULL,
+        subject VARCHAR NOT NULL,
+        body TEXT NOT NULL,
+        attachment_path VARCHAR,
+        status outboxstatus NOT NULL,
+        attempts INTEGER NOT NULL,
+        next_attempt_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+        last_error VARCHAR,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+        sent_at TIMESTAMP WITH TIME ZONE,
+        PRIMARY KEY (id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_email_outbox_due ON email_outbox (status, next_attempt_at)",
+    "CREATE INDEX IF NOT EXISTS ix_email_outbox_id ON email_outbox (id)",
+    """CREATE TABLE IF NOT EXISTS report_job (
+        job_id SERIAL NOT NULL,
+        month DATE NOT NULL,
+        kinds VARCHAR NOT NULL,
+        status reportjobstatus NOT NULL,
+        total INTEGER NOT NULL,
+        done INTEGER NOT NULL,
+        failed INTEGER NOT NULL,
+        reports JSONB,
+        archive_key VARCHAR,
+        error VARCHAR,
+        created_at TIMESTAMP WITH TIME ZONE DEFAULT now() NOT NULL,
+        started_at TIMESTAMP WITH TIME ZONE,
+        finished_at TIMESTAMP WITH TIME ZONE,
+        PRIMARY KEY (job_id)
+    )""",
+    "CREATE INDEX IF NOT EXISTS ix_report_job_job_id ON report_job (job_id)",
+    """CREATE OR REPLACE FUNCTION vms_log_change() RETURNS trigger LANGUAGE plpgsql AS $$
+    DECLARE
+        changed jsonb;
+    BEGIN
+        IF TG_OP = 'DELETE' THEN
+            changed := to_jsonb(OLD);
+        ELSE
+            changed := to_jsonb(NEW);
+        END IF;
+        INSERT INTO change_log (table_name, row_id, op)
+        VALUES (TG_TABLE_NAME, (changed ->> TG_ARGV[0])::integer, lower(TG_OP));
+        RETURN NULL;
+    END
+    $$""",
+]
+
+# Tables feeding change_log in version 1, with the primary key they log
+BASELINE_CHANGE_TABLES = (
+    ("vehicle", "id"), ("users", "user_id"), ("trip", "trip_id"), ('"Inspection"', "inspection_id"),
+    ('"ServiceNotification"', "notification_id"), ('"ServiceHistory"', "service_id"),
+)
+
+
+def _baseline(connection):
+    existing_types = set(connection.execute(text(
+        "SELECT typname FROM pg_type WHERE typnamespace = 'public'::regnamespace")).scalars())
+    for name, values in BASELINE_TYPES.items():
+        if name not in existing_types:
+            labels = ", ".join(f"'{value}'" for value in values)
+            connection.execute(text(f"CREATE TYPE {name} AS ENUM ({labels})"))
+    for statement in BASELINE_DDL:
+        connection.execute(text(statement))
+    existing = set(connection.execute(text(
+        "SELECT tgrelid::regclass::text || '/' || tgname FROM pg_trigger "
+        "WHERE tgname IN ('vms_change_log', 'vms_change_log_update')")).scalars())
+    for table, pk in BASELINE_CHANGE_TABLES:
+        for name, events, condition in (
+                ("vms_change_log", "INSERT OR DELETE", ""),
+                ("vms_change_log_update", "UPDATE", "WHEN (OLD.* IS DISTINCT FROM NEW.*) ")):
+            if f"{table}/{name}" not in existing:
+                connection.execute(text(f"CREATE TRIGGER {name} AFTER {events} ON {table} FOR EACH ROW "
+                                        f"{condition}EXECUTE FUNCTION vms_log_change('{pk}')"))
+
+
+def _partition_by_month(connection):
+    from .partitions import PARTITIONED_TABLES, partition_table
+    # Now names the parent table, not the partition, in change_log
+    connection.execute(CHANGE_FUNCTION)
+    for table in PARTITIONED_TABLES:
+        partition_table(connection, table)
+    ensure_change_triggers(connection)
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "baseline", _baseline),
+    Migration(2, "partition trip and Inspection by month", _partition_by_month),
+]
+HEAD = MIGRATIONS[-1].version
+
+
+def current_version(connection) -> int:
+    if connection.execute(text("SELECT to_regclass(:table)"), {"table": VERSION_TABLE}).scalar() is None:
+        return 0
+    return connection.execute(text(f"SELECT coalesce(max(version), 0) FROM {VERSION_TABLE}")).scalar()
+
+
+def upgrade(engine, target: Optional[int] = None) -> List[Migration]:
+    """Apply the pending migrations up to ``target`` (HEAD by default); returns those applied."""
+    target = HEAD if target is None else target
+    applied = []
+    while True:
+        with engine.begin() as connection:
+            connection.execute(text("SELECT pg_advisory_xact_lock(:id)"), {"id": MIGRATION_LOCK_ID})
+            connection.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {VERSION_TABLE} (version integer PRIMARY KEY, "
+                "name text NOT NULL, applied_at timestamptz NOT NULL DEFAULT now())"))
+            version = current_version(connection)
+            pending = [m for m in MIGRATIONS if version < m.version <= target]
+            if not pending:
+                return applied
+            migration = pending[0]
+            logger.info("Applying migration %s (%s)", migration.version, migration.name)
+            migration.apply(connection)
+            connection.execute(text(f"INSERT INTO {VERSION_TABLE} (version, name) VALUES (:version, :name)"),
+                               {"version": migration.version, "name": migration.name})
+        applied.append(migration)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply or inspect the database schema migrations.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    upgrade_parser = commands.add_parser("upgrade", help="apply pending migrations")
+    upgrade_parser.add_argument("--to", type=int, help="stop at this version instead of HEAD")
+    commands.add_parser("status", help="show the applied and pending migrations")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from .database import engine
+    if args.command == "upgrade":
+        applied = upgrade(engine, args.to)
+        print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
+    with engine.connect() as connection:
+        version = current_version(connection)
+    print(f"Schema version {version}, head {HEAD}")
+    for migration in MIGRATIONS:
+        print(f"  {'applied' if migration.version <= version else 'pending'}  "
+              f"{migration.version:>4}  {migration.name}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,32 @@
 from .database import Base
-from sqlalchemy import Column, Integer, String, Date, ForeignKey, Boolean, Float, Enum as SQLEnum
+from sqlalchemy import BigInteger, Column, Integer, String, Text, Date, DateTime, ForeignKey, Boolean, Float, Index, func, literal_column, text, Enum as SQLEnum
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from enum import Enum
 from typing import Optional
 
+
+def search_document(*columns):
+    """coalesce(a, '') || ' ' || coalesce(b, '') ... for trigram search.
+
+    Built from inline literals rather than bound parameters so queries
+    repeat the index expression exactly (concat_ws is not IMMUTABLE, so
+    PostgreSQL refuses to index it).
+    """
+    empty, space = literal_column("''"), literal_column("' '")
+    expression = func.coalesce(columns[0], empty)
+    for column in columns[1:]:
+        expression = expression.op("||")(space).op("||")(func.coalesce(column, empty))
+    return expression
+
+
+def search_index(name, *columns):
+    # GiST trigram index: serves ILIKE '%term%', the %> similarity operator
+    # and nearest-neighbour ORDER BY ... <->> for ranked typeahead
+    return Index(name, search_document(*columns).label("document"),
+                 postgresql_using="gist", postgresql_ops={"document": "gist_trgm_ops"})
+
+
 # Vehicle Model
 
 
@@ -31,6 +54,10 @@ class Vehicle(Base):
     # Fixed to plural "users"
     users = relationship("User", back_populates="vehicle")
 
+    __table_args__ = (
+        search_index("ix_vehicle_search_trgm", make, model, licence_plate, vin),
+    )
+
 # Role Enum
 
 
@@ -56,6 +83,10 @@ class User(Base):
     inspections = relationship("Inspection", back_populates="user")
     vehicle = relationship("Vehicle", back_populates="users")
 
+    __table_args__ = (
+        search_index("ix_users_search_trgm", name, email),
+    )
+
 # Status Enum for Trip
 
 
@@ -65,18 +96,20 @@ class Status(str, Enum):
     pending = "pending"
 
 # Trip Model
+# Partitioned by month on trip_date (see partitions.py); the database
+# primary key is (trip_id, trip_date).
 
 
 class Trip(Base):
     __tablename__ = "trip"
 
-    trip_id = Column(Integer, primary_key=True, index=True)
+    trip_id = Column(Integer, primary_key=True)
     vehicle_id = Column(Integer, ForeignKey("vehicle.id"), index=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), index=True)
     start_location = Column(String)
     destination = Column(String)
     purpose = Column(String, nullable=True)
-    trip_date = Column(Date)
+    trip_date = Column(Date, nullable=False)
     distance = Column(Float, nullable=True)
     fuel_consumed = Column(Float, nullable=True)
     trip_status = Column(SQLEnum(Status), nullable=True, default='pending')
@@ -85,6 +118,11 @@ class Trip(Base):
     vehicle = relationship("Vehicle", back_populates="trips")
     user = relationship("User", back_populates="trips")
 
+    __table_args__ = (
+        search_index("ix_trip_search_trgm", start_location, destination, purpose),
+        Index("ix_trip_trip_date", trip_date, trip_id),
+    )
+
 # ServiceNotification Model
 
 
@@ -106,15 +144,17 @@ class InspectionType(str, Enum):
     post_trip = "post_trip"
 
 # Inspection Model
+# Partitioned by month on date (see partitions.py); the database primary
+# key is (inspection_id, date).
 
 
 class Inspection(Base):
     __tablename__ = "Inspection"
-    inspection_id = Column(Integer, primary_key=True, index=True)
+    inspection_id = Column(Integer, primary_key=True)
     vehicle_id = Column(Integer, ForeignKey("vehicle.id"), index=True)
     user_id = Column(Integer, ForeignKey("users.user_id"), index=True)
     type = Column(SQLEnum(InspectionType))
-    date = Column(Date)
+    date = Column(Date, nullable=False)
     signed_by = Column(String)
     status = Column(SQLEnum(Status))
 
@@ -122,6 +162,10 @@ class Inspection(Base):
     vehicle = relationship("Vehicle", back_populates="inspections")
     user = relationship("User", back_populates="inspections")
 
+    __table_args__ = (
+        Index("ix_Inspection_date", date, inspection_id),
+    )
+
 # ServiceHistory Model
 
 
@@ -134,3 +178,117 @@ class ServiceHistory(Base):
 
     # Relationship
     vehicle = relationship("Vehicle", back_populates="service_histories")
+
+# TripDailyRollup Model
+# Per day, vehicle and user trip aggregates maintained by the trip write
+# paths (see rollups.py). A vehicle_id/user_id of 0 collects trips whose
+# vehicle or user was deleted.
+
+
+class TripDailyRollup(Base):
+    __tablename__ = "trip_daily_rollup"
+    day = Column(Date, primary_key=True)
+    vehicle_id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, primary_key=True, index=True)
+    trip_count = Column(Integer, nullable=False, default=0)
+    distance_count = Column(Integer, nullable=False, default=0)
+    total_distance = Column(Float, nullable=False, default=0)
+    fuel_count = Column(Integer, nullable=False, default=0)
+    total_fuel = Column(Float, nullable=False, default=0)
+    completed = Column(Integer, nullable=False, default=0)
+    cancelled = Column(Integer, nullable=False, default=0)
+    pending = Column(Integer, nullable=False, default=0)
+
+# TableVersion Model
+# Per-table write counter bumped in the committing transaction (see
+# versions.py); read endpoints derive their ETag from it.
+
+
+class TableVersion(Base):
+    __tablename__ = "table_versions"
+    table_name = Column(String, primary_key=True)
+    version = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+
+# ChangeLog Model
+# One row per inserted, updated or deleted row of the synced tables, written
+# by triggers (see changes.py). txid orders entries by transaction so the
+# change feed never skips a change that commits late.
+
+
+class ChangeLog(Base):
+    __tablename__ = "change_log"
+    id = Column(BigInteger, primary_key=True)
+    txid = Column(BigInteger, nullable=False,
+                  server_default=text("(pg_current_xact_id()::text)::bigint"))
+    table_name = Column(String, nullable=False)
+    row_id = Column(Integer, nullable=False)
+    op = Column(String, nullable=False)
+    changed_at = Column(DateTime(timezone=True), nullable=False, server_default=func.clock_timestamp())
+
+    __table_args__ = (
+        Index("ix_change_log_cursor", "txid", "id"),
+    )
+
+# OutboxStatus Enum
+
+
+class OutboxStatus(str, Enum):
+    pending = "pending"
+    sending = "sending"
+    sent = "sent"
+    dead = "dead"
+
+# EmailOutbox Model
+# Mail waiting to be delivered by the outbox worker (see outbox.py)
+
+
+class EmailOutbox(Base):
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    to_email = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    attachment_path = Column(String, nullable=True)
+    status = Column(SQLEnum(OutboxStatus), nullable=False, default=OutboxStatus.pending)
+    attempts = Column(Integer, nullable=False, default=0)
+    # Earliest time of the next delivery attempt, or the lease expiry while sending
+    next_attempt_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        Index("ix_email_outbox_due", "status", "next_attempt_at"),
+    )
+
+# ReportJobStatus Enum
+
+
+class ReportJobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+# ReportJob Model
+# A batch of monthly PDF reports rendered in the background (see
+# reports.py); the counters are updated as each report finishes.
+
+
+class ReportJob(Base):
+    __tablename__ = "report_job"
+    job_id = Column(Integer, primary_key=True, index=True)
+    month = Column(Date, nullable=False)
+    kinds = Column(String, nullable=False)
+    status = Column(SQLEnum(ReportJobStatus), nullable=False, default=ReportJobStatus.queued)
+    total = Column(Integer, nullable=False, default=0)
+    done = Column(Integer, nullable=False, default=0)
+    failed = Column(Integer, nullable=False, default=0)
+    # [{"kind", "vehicle_id", "rows", "key", "bytes"}] once the job finishes
+    reports = Column(JSONB, nullable=True)
+    archive_key = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,99 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import Integer, column, select, update, values
+
+from .cache import vehicle_cache
+from .models import Status, Vehicle
+from .scheduler import SERVICE_INTERVAL_KM, request_scan
+
+# Vehicle odometers driven by trips. A trip adds its distance (rounded to
+# whole km, the unit of Vehicle.mileage) to its vehicle's mileage for as
+# long as it is completed, so completing a trip adds it, cancelling a
+# completed trip or deleting it takes it back off, and editing one moves
+# the difference. The change is applied in the trip's own transaction as
+# UPDATE ... SET mileage = mileage + :km RETURNING, which cannot lose a
+# concurrent update the way a read-modify-write of the vehicle row does. It
+# runs as the last statement before commit, so the vehicle row stays locked
+# only for the commit itself and concurrent trips on a busy vehicle queue
+# for microseconds rather than for each other's whole requests.
+#
+# Trip statuses only move forward (TRANSITIONS); setting the current status
+# again is a no-op, and callers lock the trip row before reading its old
+# values so two concurrent completions count once.
+
+TRANSITIONS = {
+    Status.pending: {Status.pending, Status.completed, Status.cancelled},
+    Status.completed: {Status.completed, Status.cancelled},
+    Status.cancelled: {Status.cancelled},
+}
+
+_MOVED_KEY = "odometer_moved"
+_DUE_KEY = "odometer_service_due"
+
+
+def check_transition(old: Status, new: Status):
+    """Raise ValueError unless a trip may go from ``old`` to ``new``."""
+    if new not in TRANSITIONS[old]:
+        raise ValueError(f"Trip status cannot change from {old.value} to {new.value}")
+
+
+def odometer_km(values: Optional[dict]) -> int:
+    """What a trip (as rollups.trip_values) contributes to its vehicle's mileage."""
+    if not values or values["trip_status"] != Status.completed or not values["vehicle_id"]:
+        return 0
+    return max(0, round(values["distance"] or 0))
+
+
+def odometer_changes(old: Optional[dict], new: Optional[dict]) -> Dict[int, int]:
+    """Mileage change per vehicle when a trip goes from ``old`` to ``new`` values."""
+    changes: Dict[int, int] = {}
+    for trip, sign in ((old, -1), (new, 1)):
+        km = odometer_km(trip)
+        if km:
+            changes[trip["vehicle_id"]] = changes.get(trip["vehicle_id"], 0) + sign * km
+    return {vehicle_id: km for vehicle_id, km in changes.items() if km}
+
+
+def merge_changes(changes: Iterable[Dict[int, int]]) -> Dict[int, int]:
+    merged: Dict[int, int] = {}
+    for change in changes:
+        for vehicle_id, km in change.items():
+            merged[vehicle_id] = merged.get(vehicle_id, 0) + km
+    return {vehicle_id: km for vehicle_id, km in merged.items() if km}
+
+
+async def apply_odometer(db, changes: Dict[int, int]) -> List[Tuple[int, int]]:
+    """Add ``changes`` to the vehicles' mileage in the caller's transaction.
+
+    Returns (vehicle_id, new mileage) for each vehicle that still exists.
+    Call it as late as possible before commit: it holds the vehicle row
+    locks until then.
+    """
+    if not changes:
+        return []
+    ordered = sorted(changes.items())
+    if len(ordered) > 1:
+        # One UPDATE ... FROM locks rows in join order; take them in id order
+        # first so concurrent batches cannot deadlock
+        await db.execute(select(Vehicle.id).where(Vehicle.id.in_(changes)).order_by(Vehicle.id).with_for_update())
+    deltas = values(column("vehicle_id", Integer), column("km", Integer), name="deltas").data(ordered)
+    rows = (await db.execute(
+        update(Vehicle).where(Vehicle.id == deltas.c.vehicle_id)
+        .values(mileage=Vehicle.mileage + deltas.c.km)
+        .returning(Vehicle.id, Vehicle.mileage, Vehicle.last_service_km, deltas.c.km)
+        .execution_options(synchronize_session="fetch"))).all()
+    db.info.setdefault(_MOVED_KEY, set()).update(row.id for row in rows)
+    if any(row.mileage - row.km - row.last_service_km < SERVICE_INTERVAL_KM <= row.mileage - row.last_service_km
+           for row in rows):
+        db.info[_DUE_KEY] = True
+    return [(row.id, row.mileage) for row in rows]
+
+
+async def odometer_committed(db):
+    """After commit: drop the vehicles whose mileage moved from the cache, and
+    start a service scan at once if one of them just passed its interval."""
+    moved = db.info.pop(_MOVED_KEY, None)
+    if moved:
+        await vehicle_cache.invalidate(*sorted(moved))
+    if db.info.pop(_DUE_KEY, False):
+        request_scan()
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+
+from .metrics import Histogram
+from .models import EmailOutbox, OutboxStatus
+
+# Durable email outbox. Handlers call enqueue_email, which only adds a row to
+# their session, so the mail is committed (or rolled back) with the rest of
+# the request. OutboxWorker drains the table concurrently over the pooled
+# SMTP sessions, retrying with exponential backoff and dead-lettering rows
+# that keep failing. Several workers can run at once: rows are claimed with
+# FOR UPDATE SKIP LOCKED and leased, so a crashed worker's rows are retried.
+
+logger = logging.getLogger(__name__)
+
+OUTBOX_WORKER_ENABLED = os.getenv("OUTBOX_WORKER_ENABLED", "true").lower() in ("1", "true", "yes")
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "50"))
+OUTBOX_POLL_SECONDS = float(os.getenv("OUTBOX_POLL_SECONDS", "2"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_BACKOFF_SECONDS", "30"))
+OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("OUTBOX_MAX_BACKOFF_SECONDS", "3600"))
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", "300"))
+EMAIL_RATE_PER_SECOND = float(os.getenv("EMAIL_RATE_PER_SECOND", "5"))
+
+SEND_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+
+class OutboxMetrics:
+    def __init__(self):
+        self.send_latency = Histogram(SEND_LATENCY_BUCKETS)
+        self.sent = 0
+        self.failed = 0
+        self.dead_lettered = 0
+
+
+outbox_metrics = OutboxMetrics()
+
+
+def enqueue_email(db, to_email, subject, message, attachment=None):
+    """Queue a message in the caller's transaction; delivered after commit."""
+    entry = EmailOutbox(to_email=to_email, subject=subject, body=message,
+                        attachment_path=attachment, status=OutboxStatus.pending)
+    db.add(entry)
+    return entry
+
+
+def backoff_delay(attempts: int) -> float:
+    """Exponential backoff with full jitter, capped at OUTBOX_MAX_BACKOFF_SECONDS."""
+    ceiling = min(OUTBOX_MAX_BACKOFF_SECONDS, OUTBOX_BACKOFF_SECONDS * 2 ** max(0, attempts - 1))
+    return random.uniform(ceiling / 2, ceiling)
+
+
+class RateLimiter:
+    """Token bucket allowing ``rate`` acquisitions per second on average."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class OutboxWorker:
+    def __init__(self, session_factory=None, pool=None, rate=EMAIL_RATE_PER_SECOND):
+        from .database import AsyncSessionLocal
+        from .emailSender import EMAIL_POOL_SIZE
+        self.session_factory = session_factory or AsyncSessionLocal
+        # The SMTP pool is only built for the first send, so the worker can
+        # start (and queued mail can wait) before EMAIL_HOST/PORT are set
+        self._pool = pool
+        self.limiter = RateLimiter(rate, burst=pool.size if pool else EMAIL_POOL_SIZE)
+
+    @property
+    def pool(self):
+        if self._pool is None:
+            from .emailSender import get_default_pool
+            self._pool = get_default_pool()
+        return self._pool
+
+    async def claim(self) -> list:
+        now = datetime.now(timezone.utc)
+        due = (
+            select(EmailOutbox.id)
+            .where(EmailOutbox.status.in_([OutboxStatus.pending, OutboxStatus.sending]),
+                   EmailOutbox.next_attempt_at <= now)
+            .order_by(EmailOutbox.next_attempt_at)
+            .limit(OUTBOX_BATCH_SIZE)
+            .with_for_update(skip_locked=True)
+        )
+        async with self.session_factory() as db:
+            rows = (await db.execute(
+                update(EmailOutbox)
+                .where(EmailOutbox.id.in_(due.scalar_subquery()))
+                .values(status=OutboxStatus.sending,
+                        attempts=EmailOutbox.attempts + 1,
+                        next_attempt_at=now + timedelta(seconds=OUTBOX_LEASE_SECONDS))
+                .returning(EmailOutbox.id, EmailOutbox.to_email, EmailOutbox.subject,
+                           EmailOutbox.body, EmailOutbox.attachment_path, EmailOutbox.attempts)
+            )).all()
+            await db.commit()
+        return rows
+
+    def _send(self, row):
+        from .emailSender import deliver
+        with self.pool.connection() as server:
+            deliver(server, row.to_email, row.subject, row.body, row.attachment_path)
+
+    async def deliver(self, row):
+        await self.limiter.acquire()
+        started = time.perf_counter()
+        try:
+            await asyncio.to_thread(self._send, row)
+            return None
+        except Exception as e:
+            return e
+        finally:
+            outbox_metrics.send_latency.observe(time.perf_counter() - started)
+
+    async def record(self, rows, results):
+        now = datetime.now(timezone.utc)
+        sent = [row.id for row, error in zip(rows, results) if error is None]
+        async with self.session_factory() as db:
+            if sent:
+                await db.execute(update(EmailOutbox).where(EmailOutbox.id.in_(sent)).values(
+                    status=OutboxStatus.sent, sent_at=now, last_error=None))
+            for row, error in zip(rows, results):
+                if error is None:
+                    continue
+                dead = row.attempts >= OUTBOX_MAX_ATTEMPTS
+                await db.execute(update(EmailOutbox).where(EmailOutbox.id == row.id).values(
+                    status=OutboxStatus.dead if dead else OutboxStatus.pending,
+                    next_attempt_at=now + timedelta(seconds=backoff_delay(row.attempts)),
+                    last_error=str(error)[:1000]))
+                if dead:
+                    outbox_metrics.dead_lettered += 1
+                    logger.error("Email %s to %s dead-lettered after %s attempts: %s",
+                                 row.id, row.to_email, row.attempts, error)
+                else:
+                    outbox_metrics.failed += 1
+            await db.commit()
+        outbox_metrics.sent += len(sent)
+
+    async def drain_once(self) -> int:
+        rows = await self.claim()
+        if rows:
+            # The pool bounds concurrent SMTP sessions; the limiter bounds the rate
+            results = await asyncio.gather(*(self.deliver(row) for row in rows))
+            await self.record(rows, results)
+        return len(rows)
+
+    async def run(self):
+        while True:
+            try:
+                if await self.drain_once():
+                    continue
+            except Exception:
+                logger.exception("Email outbox pass failed")
+            await asyncio.sleep(OUTBOX_POLL_SECONDS)
+
+
+async def outbox_snapshot(db) -> dict:
+    counts = dict((await db.execute(
+        select(EmailOutbox.status, func.count()).group_by(EmailOutbox.status))).all())
+    oldest = await db.scalar(select(func.min(EmailOutbox.created_at)).where(
+        EmailOutbox.status.in_([OutboxStatus.pending, OutboxStatus.sending])))
+    return {
+        "queue_depth": counts.get(OutboxStatus.pending, 0) + counts.get(OutboxStatus.sending, 0),
+        "by_status": {status.value: counts.get(status, 0) for status in OutboxStatus},
+        "oldest_queued_age_seconds": (
+            round((datetime.now(timezone.utc) - oldest).total_seconds(), 3) if oldest else None),
+        "sent": outbox_metrics.sent,
+        "failed_attempts": outbox_metrics.failed,
+        "dead_lettered": outbox_metrics.dead_lettered,
+        "send_latency_seconds": outbox_metrics.send_latency.snapshot(),
+    }
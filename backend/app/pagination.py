@@ -0,0 +1,157 @@
+import base64
+import json
+from datetime import date
+from typing import Any, AsyncIterator, Optional, Sequence, Type
+
+from fastapi import HTTPException
+from pydantic import BaseModel
+from sqlalchemy import and_, or_, tuple_
+
+# Keyset (cursor) pagination helpers for the get_all_* list endpoints.
+#
+# A cursor is the (sort value, primary key) pair of the last row on a page,
+# so the next page is a single index range scan instead of an OFFSET that
+# re-reads every earlier row.
+
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 500
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(sort_value: Any, pk_value: Any) -> str:
+    if isinstance(sort_value, date):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, pk_value], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> list:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != 2:
+            raise ValueError("cursor must hold two values")
+        return values
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+
+
+def _typed(value: Any, python_type: type):
+    # bool is an int to Python but never a valid key
+    if isinstance(value, bool):
+        raise ValueError(f"expected {python_type.__name__}, got {value!r}")
+    if python_type is date and isinstance(value, str):
+        return date.fromisoformat(value)
+    if isinstance(value, python_type):
+        return value
+    if python_type is float and isinstance(value, int):
+        return float(value)
+    raise ValueError(f"expected {python_type.__name__}, got {value!r}")
+
+
+def cursor_values(values: list, sort_column, pk_column) -> tuple:
+    """Check a decoded cursor against the columns it is applied to.
+
+    The values are bound as query parameters, so one of the wrong type would
+    otherwise fail in the driver and surface as a 500.
+    """
+    sort_value, pk_value = values
+    try:
+        pk_value = _typed(pk_value, pk_column.type.python_type)
+        if sort_value is not None:
+            sort_value = _typed(sort_value, sort_column.type.python_type)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid cursor: {e}")
+    return sort_value, pk_value
+
+
+def resolve_sort_column(model, sort: str, allowed: Sequence[str]):
+    if sort not in allowed:
+        raise HTTPException(
+            status_code=400, detail=f"Cannot sort by '{sort}', expected one of: {', '.join(allowed)}")
+    return getattr(model, sort)
+
+
+def apply_keyset(statement, sort_column, pk_column, after: Optional[str], descending: bool = False):
+    """Order ``statement`` by (sort_column, pk_column) and skip past the ``after`` cursor.
+
+    NULL sort values come last in ascending order and first in descending
+    order (PostgreSQL's defaults), so a cursor may carry a NULL sort value.
+    """
+    if after:
+        sort_value, pk_value = cursor_values(decode_cursor(after), sort_column, pk_column)
+        statement = statement.filter(
+            _after_filter(sort_column, pk_column, sort_value, pk_value, descending))
+    if descending:
+        return statement.order_by(sort_column.desc().nulls_first(), pk_column.desc())
+    return statement.order_by(sort_column.asc().nulls_last(), pk_column.asc())
+
+
+def _after_filter(sort_column, pk_column, sort_value, pk_value, descending: bool):
+    # A row comparison with NULL is never true, so NULL sort values need
+    # their own branch on the side of the order they sort to
+    key = tuple_(sort_column, pk_column)
+    if sort_value is None:
+        if descending:
+            return or_(and_(sort_column.is_(None), pk_column < pk_value), sort_column.is_not(None))
+        return and_(sort_column.is_(None), pk_column > pk_value)
+    if descending:
+        return key < (sort_value, pk_value)
+    if sort_column.nullable:
+        return or_(key > (sort_value, pk_value), sort_column.is_(None))
+    return key > (sort_value, pk_value)
+
+
+def next_cursor(rows: list, sort_attr: str, pk_attr: str, limit: Optional[int]) -> Optional[str]:
+    if not limit or len(rows) < limit:
+        return None
+    last = rows[-1]
+    return encode_cursor(getattr(last, sort_attr), getattr(last, pk_attr))
+
+
+def check_date_range(start_date: Optional[date], end_date: Optional[date]):
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(status_code=400, detail="start_date must not be after end_date")
+
+
+def date_range(column, start_date: Optional[date], end_date: Optional[date]) -> list:
+    """Filters keeping ``column`` between the inclusive, optional bounds.
+
+    On the partitioned tables a bounded date lets the planner skip every
+    monthly partition outside the range (see partitions.py).
+    """
+    check_date_range(start_date, end_date)
+    filters = []
+    if start_date:
+        filters.append(column >= start_date)
+    if end_date:
+        filters.append(column <= end_date)
+    return filters
+
+
+def paginate(statement, model, pk_attr: str, sort: str, allowed: Sequence[str],
+             limit: Optional[int], after: Optional[str], descending: bool):
+    """Return (statement, next_cursor_fn) for one keyset page of ``statement``.
+
+    Without ``limit`` the whole ordered result is returned, which keeps the
+    existing dashboard calls working unchanged.
+    """
+    sort_column = resolve_sort_column(model, sort, allowed)
+    statement = apply_keyset(statement, sort_column, getattr(model, pk_attr), after, descending)
+    if limit:
+        statement = statement.limit(limit)
+    return statement, lambda rows: next_cursor(rows, sort, pk_attr, limit)
+
+
+async def stream_ndjson(statement, schema: Type[BaseModel]) -> AsyncIterator[bytes]:
+    """Yield one JSON document per row, reading from a server-side cursor.
+
+    The session is owned by the generator rather than the request dependency
+    because the response body is produced after the endpoint has returned.
+    """
+    from .database import AsyncSessionLocal
+    async with AsyncSessionLocal() as db:
+        result = await db.stream_scalars(
+            statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+        async for row in result:
+            yield schema.model_validate(row).model_dump_json().encode() + b"\n"
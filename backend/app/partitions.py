@@ -0,0 +1,325 @@
+import argparse
+import asyncio
+import logging
+import os
+import re
+from datetime import date
+from typing import Iterable, List, NamedTuple, Optional
+
+from sqlalchemy import func, select, text
+from sqlalchemy.schema import AddConstraint
+
+from .models import Inspection, Trip
+from .versions import bump_statement
+
+# Monthly range partitions for the tables that grow with every working day.
+# trip and Inspection are partitioned on their date (migration 2), one
+# partition per calendar month plus a default partition, so a query bounded
+# by date only reads the months it covers and old months can be detached or
+# dropped whole instead of by a DELETE that rewrites the table and its
+# indexes.
+#
+# Upcoming months are created ahead of time (PARTITION_MONTHS_AHEAD) by the
+# maintenance pass, which every API worker runs periodically and
+# python -m app.partitions maintain runs on demand. A row outside every
+# monthly partition (a back-dated import, or a month the pass has not
+# reached yet) lands in the default partition rather than failing; the next
+# pass gives its month a partition and moves it there. New partitions are
+# built detached and then attached, which only takes a SHARE UPDATE
+# EXCLUSIVE lock on the parent, and the pass gives up after
+# PARTITION_LOCK_TIMEOUT rather than queueing writers behind a long
+# transaction.
+#
+# Retention is off unless TRIP_RETENTION_MONTHS / INSPECTION_RETENTION_MONTHS
+# is set: then partitions that end before the first day of the current month
+# minus that many months are detached (kept as plain tables, e.g. for
+# archiving) or, with PARTITION_RETENTION_MODE=drop, dropped. trip_daily_rollup
+# keeps the removed days, so analytics still cover them, and the change feed
+# does not report the rows as deleted. Changing a row's date to another
+# month moves it between partitions, which the change feed reports as a
+# delete followed by an insert of the same id.
+#
+# The database primary keys are (id, date) because a unique constraint on a
+# partitioned table has to include the partition key; the models keep the
+# id alone as their identity. A lookup by id alone probes every partition's
+# index, so list queries should carry a date range.
+
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "3"))
+TRIP_RETENTION_MONTHS = int(os.getenv("TRIP_RETENTION_MONTHS", "0"))
+INSPECTION_RETENTION_MONTHS = int(os.getenv("INSPECTION_RETENTION_MONTHS", "0"))
+PARTITION_RETENTION_MODE = os.getenv("PARTITION_RETENTION_MODE", "detach").lower()
+PARTITION_LOCK_TIMEOUT = os.getenv("PARTITION_LOCK_TIMEOUT", "5s")
+PARTITION_MAINTENANCE_ENABLED = os.getenv("PARTITION_MAINTENANCE_ENABLED", "true").lower() in ("1", "true", "yes")
+PARTITION_MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("PARTITION_MAINTENANCE_INTERVAL_SECONDS", "21600"))
+
+# pg_try_advisory_xact_lock key, so only one process maintains partitions at a time
+PARTITION_LOCK_KEY = 0x9A4710
+
+RETENTION_MODES = ("detach", "drop")
+
+logger = logging.getLogger(__name__)
+
+
+class PartitionedTable(NamedTuple):
+    model: type
+    key: str
+    retention_months: int
+
+    @property
+    def name(self) -> str:
+        return self.model.__table__.name
+
+    @property
+    def pk(self) -> str:
+        return self.model.__table__.primary_key.columns.values()[0].name
+
+
+PARTITIONED_TABLES = (
+    PartitionedTable(Trip, "trip_date", TRIP_RETENTION_MONTHS),
+    PartitionedTable(Inspection, "date", INSPECTION_RETENTION_MONTHS),
+)
+
+
+class Partition(NamedTuple):
+    name: str
+    # None for the default partition
+    lower: Optional[date]
+    upper: Optional[date]
+
+
+_BOUND = re.compile(r"FROM \('([\d-]+)'\) TO \('([\d-]+)'\)")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(table: str, month: date) -> str:
+    return f"{table}_p{month:%Y_%m}"
+
+
+def default_partition(table: str) -> str:
+    return f"{table}_default"
+
+
+def retention_cutoff(months: int, today: Optional[date] = None) -> Optional[date]:
+    """First day kept under a retention of ``months``; None when retention is off."""
+    if months <= 0:
+        return None
+    return add_months(month_start(today or date.today()), -months)
+
+
+def _quote(connection, name: str) -> str:
+    return connection.dialect.identifier_preparer.quote(name)
+
+
+def is_partitioned(connection, table: str) -> bool:
+    return bool(connection.execute(
+        text("SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"),
+        {"table": _quote(connection, table)}).scalar())
+
+
+def partitions(connection, table: str) -> List[Partition]:
+    """The partitions attached to ``table``, oldest first, the default partition last."""
+    rows = connection.execute(text(
+        "SELECT c.relname, pg_get_expr(c.relpartbound, c.oid) FROM pg_inherits i "
+        "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table)"),
+        {"table": _quote(connection, table)}).all()
+    result = []
+    for name, bound in rows:
+        match = _BOUND.search(bound)
+        if match:
+            result.append(Partition(name, date.fromisoformat(match[1]), date.fromisoformat(match[2])))
+        else:
+            result.append(Partition(name, None, None))
+    return sorted(result, key=lambda partition: (partition.lower is None, partition.lower or date.min))
+
+
+def create_partition(connection, table: PartitionedTable, month: date) -> str:
+    """Create and attach the partition for ``month``, moving its rows out of the default partition."""
+    name = partition_name(table.name, month)
+    partition, parent = _quote(connection, name), _quote(connection, table.name)
+    default, key = _quote(connection, default_partition(table.name)), _quote(connection, table.key)
+    check = _quote(connection, f"{name}_bound")
+    bounds = {"lower": month, "upper": add_months(month, 1)}
+    # The CHECK matching the bound lets ATTACH skip validating the new table
+    connection.execute(text(
+        f"CREATE TABLE {partition} (LIKE {parent} INCLUDING DEFAULTS INCLUDING CONSTRAINTS, "
+        f"CONSTRAINT {check} CHECK ({key} >= '{bounds['lower']}' AND {key} < '{bounds['upper']}'))"))
+    in_month = f"{key} >= :lower AND {key} < :upper"
+    if connection.execute(text(f"SELECT EXISTS (SELECT 1 FROM {default} WHERE {in_month})"), bounds).scalar():
+        # Moving a row is not a change: keep it out of the change log
+        connection.execute(text(f"ALTER TABLE {default} DISABLE TRIGGER USER"))
+        connection.execute(text(
+            f"WITH moved AS (DELETE FROM {default} WHERE {in_month} RETURNING *) "
+            f"INSERT INTO {partition} SELECT * FROM moved"), bounds)
+        connection.execute(text(f"ALTER TABLE {default} ENABLE TRIGGER USER"))
+    connection.execute(text(
+        f"ALTER TABLE {parent} ATTACH PARTITION {partition} "
+        f"FOR VALUES FROM ('{bounds['lower']}') TO ('{bounds['upper']}')"))
+    connection.execute(text(f"ALTER TABLE {partition} DROP CONSTRAINT {check}"))
+    return name
+
+
+def ensure_partitions(connection, table: PartitionedTable, today: Optional[date] = None,
+                      months: Iterable[date] = (), months_ahead: int = PARTITION_MONTHS_AHEAD) -> List[str]:
+    """Create the partitions for ``months``, for the current month and
+    ``months_ahead`` after it, and for any month with rows in the default
+    partition; returns the names of those created."""
+    if not is_partitioned(connection, table.name):
+        raise RuntimeError(f"{table.name} is not partitioned; run python -m app.migrations upgrade")
+    current = month_start(today or date.today())
+    wanted = {month_start(month) for month in months}
+    wanted.update(add_months(current, offset) for offset in range(months_ahead + 1))
+    default, key = _quote(connection, default_partition(table.name)), _quote(connection, table.key)
+    wanted.update(connection.execute(text(
+        f"SELECT DISTINCT date_trunc('month', {key})::date FROM {default}")).scalars())
+    existing = {partition.lower for partition in partitions(connection, table.name)}
+    return [create_partition(connection, table, month) for month in sorted(wanted - existing)]
+
+
+def apply_retention(connection, table: PartitionedTable, today: Optional[date] = None,
+                    months: Optional[int] = None, mode: str = PARTITION_RETENTION_MODE) -> List[str]:
+    """Detach or drop the partitions older than the retention; returns their names."""
+    if mode not in RETENTION_MODES:
+        raise ValueError(f"Unknown retention mode {mode!r}, expected one of: {', '.join(RETENTION_MODES)}")
+    cutoff = retention_cutoff(table.retention_months if months is None else months, today)
+    if cutoff is None:
+        return []
+    expired = [partition for partition in partitions(connection, table.name)
+               if partition.upper is not None and partition.upper <= cutoff]
+    parent = _quote(connection, table.name)
+    for partition in expired:
+        if mode == "drop":
+            connection.execute(text(f"DROP TABLE {_quote(connection, partition.name)}"))
+        else:
+            connection.execute(text(f"ALTER TABLE {parent} DETACH PARTITION {_quote(connection, partition.name)}"))
+    if expired:
+        # List responses lose rows: new ETags
+        connection.execute(bump_statement([table.name]))
+    return [partition.name for partition in expired]
+
+
+def detached_partitions(connection, table: str) -> List[str]:
+    """Monthly partitions of ``table`` that retention detached and nobody has dropped yet."""
+    return connection.execute(text(
+        "SELECT relname FROM pg_class WHERE relkind = 'r' AND NOT relispartition "
+        "AND relname ~ :pattern ORDER BY relname"),
+        {"pattern": "^" + re.escape(table) + r"_p\d{4}_\d{2}$"}).scalars().all()
+
+
+def partition_table(connection, table: PartitionedTable, today: Optional[date] = None):
+    """Rebuild ``table`` as a table partitioned by month, keeping its rows,
+    sequence, keys, indexes and change log triggers (migration 2)."""
+    if is_partitioned(connection, table.name):
+        ensure_partitions(connection, table, today)
+        return
+    parent, key, pk = (_quote(connection, table.name), _quote(connection, table.key),
+                       _quote(connection, table.pk))
+    old = _quote(connection, f"{table.name}_unpartitioned")
+    missing = connection.execute(text(f"SELECT count(*) FROM {parent} WHERE {key} IS NULL")).scalar()
+    if missing:
+        raise RuntimeError(f"{missing} rows of {table.name} have no {table.key}; "
+                           "set one before partitioning")
+    connection.execute(text(f"LOCK TABLE {parent} IN ACCESS EXCLUSIVE MODE"))
+    sequence = connection.execute(text("SELECT pg_get_serial_sequence(:table, :column)"),
+                                  {"table": parent, "column": table.pk}).scalar()
+    connection.execute(text(f"ALTER TABLE {parent} RENAME TO {old}"))
+    if sequence:
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY NONE"))
+    connection.execute(text(f"CREATE TABLE {parent} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE ({key})"))
+    connection.execute(text(f"ALTER TABLE {parent} ALTER COLUMN {key} SET NOT NULL"))
+    connection.execute(text(
+        f"CREATE TABLE {_quote(connection, default_partition(table.name))} PARTITION OF {parent} DEFAULT"))
+    months = connection.execute(text(f"SELECT DISTINCT date_trunc('month', {key})::date FROM {old}")).scalars().all()
+    ensure_partitions(connection, table, today, months)
+    # Indexes, keys and triggers are added after the copy: building them
+    # once is cheaper than maintaining them row by row
+    connection.execute(text(f"INSERT INTO {parent} SELECT * FROM {old}"))
+    connection.execute(text(f"DROP TABLE {old}"))
+    if sequence:
+        connection.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {parent}.{pk}"))
+    connection.execute(text(f"ALTER TABLE {parent} ADD CONSTRAINT {_quote(connection, table.name + '_pkey')} "
+                            f"PRIMARY KEY ({pk}, {key})"))
+    for constraint in table.model.__table__.foreign_key_constraints:
+        connection.execute(AddConstraint(constraint))
+    for index in table.model.__table__.indexes:
+        index.create(connection)
+    connection.execute(text(f"ANALYZE {parent}"))
+
+
+def maintain(engine, today: Optional[date] = None) -> dict:
+    """One maintenance pass: upcoming partitions, then retention, one transaction per table."""
+    report = {}
+    for table in PARTITIONED_TABLES:
+        with engine.begin() as connection:
+            if not connection.execute(select(func.pg_try_advisory_xact_lock(PARTITION_LOCK_KEY))).scalar():
+                return {"skipped": True}
+            connection.execute(text("SELECT set_config('lock_timeout', :timeout, true)"),
+                               {"timeout": PARTITION_LOCK_TIMEOUT})
+            report[table.name] = {"created": ensure_partitions(connection, table, today),
+                                  "removed": apply_retention(connection, table, today)}
+    return report
+
+
+async def run_partition_maintenance(interval: float = PARTITION_MAINTENANCE_INTERVAL_SECONDS):
+    from .database import engine
+    while True:
+        try:
+            result = await asyncio.to_thread(maintain, engine)
+            logger.info("Partition maintenance pass: %s", result)
+        except Exception:
+            logger.exception("Partition maintenance pass failed")
+        await asyncio.sleep(interval)
+
+
+def status(connection) -> dict:
+    """Per table: attached partitions with estimated rows and size, and detached ones."""
+    result = {}
+    for table in PARTITIONED_TABLES:
+        sizes = dict(
+            (row.relname, (int(max(row.reltuples, 0)), row.bytes)) for row in connection.execute(text(
+                "SELECT c.relname, c.reltuples, pg_total_relation_size(c.oid) AS bytes FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid WHERE i.inhparent = to_regclass(:table)"),
+                {"table": _quote(connection, table.name)}))
+        result[table.name] = {
+            "partitions": [{"name": partition.name, "from": partition.lower, "to": partition.upper,
+                            "rows": sizes[partition.name][0], "bytes": sizes[partition.name][1]}
+                           for partition in partitions(connection, table.name)],
+            "detached": detached_partitions(connection, table.name),
+            "retention_months": table.retention_months,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the monthly trip and inspection partitions.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("status", help="list the partitions")
+    commands.add_parser("maintain", help="create upcoming partitions and apply the retention")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from .database import engine
+    if args.command == "maintain":
+        for name, result in maintain(engine).items():
+            print(f"{name}: {result}")
+    with engine.connect() as connection:
+        for name, table in status(connection).items():
+            retention = f"{table['retention_months']} months" if table["retention_months"] else "off"
+            print(f"{name} (retention {retention})")
+            for partition in table["partitions"]:
+                bounds = f"{partition['from']} .. {partition['to']}" if partition["from"] else "default"
+                print(f"  {partition['name']:<28} {bounds:<24} ~{partition['rows']:>10} rows "
+                      f"{partition['bytes'] / 2 ** 20:>9.1f} MiB")
+            for detached in table["detached"]:
+                print(f"  {detached:<28} detached")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, List, Optional
+
+from sqlalchemy import event
+
+# Per-request SQL statement counting. The active counters live in a
+# ContextVar, which SQLAlchemy's asyncio greenlets share with the calling
+# task, so engine events fired while awaiting the session land on them.
+# Counters nest: the request metrics (instrumentation.py) count the whole
+# request and a query budget counts its handler, and one pair of engine
+# hooks times each statement, adds it to every active counter and then
+# passes it to the registered observers, such as the slow query log.
+
+logger = logging.getLogger(__name__)
+
+# "off", "warn" (log over-budget requests) or "strict" (raise, for test runs)
+QUERY_BUDGET_MODE = os.getenv("QUERY_BUDGET_MODE", "warn")
+
+_active_counters: ContextVar[tuple] = ContextVar("statement_counters", default=())
+# Called as observer(statement, parameters, context, executemany, elapsed)
+_observers: List[Callable] = []
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class StatementCounter:
+    __slots__ = ("count", "db_time")
+
+    def __init__(self):
+        self.count = 0
+        self.db_time = 0.0
+
+
+def active_counters() -> tuple:
+    return _active_counters.get()
+
+
+@contextmanager
+def counting(counter: StatementCounter):
+    """Add the statements executed in this context to ``counter``."""
+    token = _active_counters.set(_active_counters.get() + (counter,))
+    try:
+        yield counter
+    finally:
+        _active_counters.reset(token)
+
+
+def observe_statements(observer: Callable):
+    if observer not in _observers:
+        _observers.append(observer)
+    return observer
+
+
+def install_statement_counter(engine):
+    """Count and time each statement on ``engine`` (a sync Engine)."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_timer(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._vms_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        started = getattr(context, "_vms_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        for counter in _active_counters.get():
+            counter.count += 1
+            counter.db_time += elapsed
+        for observer in _observers:
+            observer(statement, parameters, context, executemany, elapsed)
+
+
+def query_budget(limit: int, name: Optional[str] = None):
+    """Route dependency asserting a request issues at most ``limit`` statements."""
+
+    async def check_query_budget():
+        if QUERY_BUDGET_MODE == "off":
+            yield None
+            return
+        counter = StatementCounter()
+        with counting(counter):
+            yield counter
+        if counter.count > limit:
+            message = f"{name or 'endpoint'} issued {counter.count} SQL statements, budget is {limit}"
+            if QUERY_BUDGET_MODE == "strict":
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+
+    return check_query_budget
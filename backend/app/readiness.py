@@ -0,0 +1,106 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Optional
+
+from sqlalchemy import text
+
+from .migrations import HEAD, current_version, upgrade
+
+# Liveness and readiness. The app starts serving as soon as it is imported:
+# a worker answers /healthz at once, and wait_until_ready checks in the
+# background, with exponential backoff and without blocking the event
+# loop, that the database is reachable and its schema is at HEAD. Until
+# then /readyz answers 503, so a load balancer or orchestrator only routes
+# traffic to workers that can serve it, and a rolling deploy waits for the
+# migration job instead of crashing workers that boot before it finishes.
+# MIGRATE_ON_STARTUP=true applies pending migrations from the worker
+# instead, which is convenient for a single local instance.
+
+DB_RETRY_INITIAL_SECONDS = float(os.getenv("DB_RETRY_INITIAL_SECONDS", "0.25"))
+DB_RETRY_MAX_SECONDS = float(os.getenv("DB_RETRY_MAX_SECONDS", "10"))
+READINESS_CHECK_TIMEOUT = float(os.getenv("READINESS_CHECK_TIMEOUT", "2"))
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "false").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+
+class Readiness:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ready = False
+        self.attempts = 0
+        self.schema_version: Optional[int] = None
+        self.ready_after: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def snapshot(self) -> dict:
+        return {
+            "ready": self.ready,
+            "schema_version": self.schema_version,
+            "schema_head": HEAD,
+            "attempts": self.attempts,
+            "ready_after_ms": round(self.ready_after * 1000, 1) if self.ready_after is not None else None,
+            "error": self.error,
+        }
+
+
+def retry_delay(attempt: int) -> float:
+    """Exponential backoff with full jitter, capped at DB_RETRY_MAX_SECONDS."""
+    ceiling = min(DB_RETRY_MAX_SECONDS, DB_RETRY_INITIAL_SECONDS * 2 ** attempt)
+    return random.uniform(ceiling / 2, ceiling)
+
+
+async def _schema_version() -> int:
+    from .database import async_engine
+    async with async_engine.connect() as connection:
+        return await connection.run_sync(current_version)
+
+
+async def wait_until_ready(readiness: Readiness):
+    """Return once the database answers at schema HEAD, retrying with backoff."""
+    while True:
+        try:
+            version = await asyncio.wait_for(_schema_version(), READINESS_CHECK_TIMEOUT)
+            if version < HEAD and MIGRATE_ON_STARTUP:
+                from .database import engine
+                await asyncio.to_thread(upgrade, engine)
+                version = await _schema_version()
+            readiness.schema_version = version
+            if version < HEAD:
+                raise RuntimeError(f"schema is at version {version}, expected {HEAD}; "
+                                   "run python -m app.migrations upgrade")
+            readiness.ready, readiness.error = True, None
+            readiness.ready_after = time.perf_counter() - readiness.started
+            logger.info("Ready after %.0f ms", readiness.ready_after * 1000)
+            return
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = RuntimeError(f"database check timed out after {READINESS_CHECK_TIMEOUT}s")
+            delay = retry_delay(readiness.attempts)
+            readiness.attempts += 1
+            readiness.error = str(e).splitlines()[0] if str(e) else type(e).__name__
+            logger.warning("Database not ready (attempt %s): %s; retrying in %.1fs",
+                           readiness.attempts, readiness.error, delay)
+            await asyncio.sleep(delay)
+
+
+async def database_reachable() -> Optional[str]:
+    """None if a trivial query succeeds within READINESS_CHECK_TIMEOUT, else the reason it did not."""
+    from .database import async_engine
+
+    async def check():
+        async with async_engine.connect() as connection:
+            await connection.execute(text("SELECT 1"))
+
+    try:
+        await asyncio.wait_for(check(), READINESS_CHECK_TIMEOUT)
+        return None
+    except asyncio.TimeoutError:
+        return f"database check timed out after {READINESS_CHECK_TIMEOUT}s"
+    except Exception as e:
+        return str(e).splitlines()[0] if str(e) else type(e).__name__
@@ -0,0 +1,100 @@
+import os
+
+from fpdf import FPDF
+
+# PDF rendering for reports.py. This module runs inside the report process
+# pool, so it imports nothing from the app: a report arrives as plain data
+# (title, header lines, columns, rows of display strings, totals) and is
+# written to disk. Bump reports.RENDERER_VERSION when the layout changes, so
+# cached files rendered by the old layout are not served.
+
+FONT = "Helvetica"
+ROW_HEIGHT = 6
+HEADER_FILL = (225, 230, 240)
+STRIPE_FILL = (246, 247, 250)
+
+
+def _latin1(value) -> str:
+    # The core PDF fonts only cover Latin-1
+    return str(value).encode("latin-1", "replace").decode("latin-1")
+
+
+class ReportPDF(FPDF):
+    def __init__(self, report: dict):
+        super().__init__(orientation=report.get("orientation", "P"), unit="mm", format="A4")
+        self.report = report
+        self.set_title(_latin1(report["title"]))
+        self.set_creator("Vehicle Management System")
+        self.set_auto_page_break(auto=False)
+        self.alias_nb_pages()
+        usable = self.w - self.l_margin - self.r_margin
+        total = sum(column["width"] for column in report["columns"])
+        self.widths = [column["width"] * usable / total for column in report["columns"]]
+        # Locations, plates and statuses repeat a lot; measuring text is a
+        # large share of the render time
+        self._fitted = {}
+
+    def footer(self):
+        self.set_y(-12)
+        self.set_font(FONT, size=8)
+        self.cell(0, 6, _latin1(f"{self.report['title']}  -  page {self.page_no()}/{{nb}}"), align="C")
+
+    def table_header(self):
+        self.set_font(FONT, style="B", size=9)
+        self.set_fill_color(*HEADER_FILL)
+        for column, width in zip(self.report["columns"], self.widths):
+            self.cell(width, ROW_HEIGHT + 1, _latin1(column["title"]), border="B", align=column.get("align", "L"),
+                      fill=True)
+        self.ln()
+        self.set_font(FONT, size=8)
+        self.set_fill_color(*STRIPE_FILL)
+
+    def fit(self, text: str, width: float) -> str:
+        fitted = self._fitted.get((text, width))
+        if fitted is None:
+            fitted = text
+            if self.get_string_width(text) > width - 2:
+                while fitted and self.get_string_width(fitted + "...") > width - 2:
+                    fitted = fitted[:int(len(fitted) * 0.9)] if len(fitted) > 20 else fitted[:-1]
+                fitted += "..."
+            self._fitted[(text, width)] = fitted
+        return fitted
+
+
+def render(report: dict, path: str) -> int:
+    """Write ``report`` to ``path`` as a PDF; returns the file size."""
+    pdf = ReportPDF(report)
+    pdf.add_page()
+    pdf.set_font(FONT, style="B", size=14)
+    pdf.cell(0, 10, _latin1(report["title"]), align="C", new_x="LMARGIN", new_y="NEXT")
+    pdf.set_font(FONT, size=10)
+    for line in report.get("lines", ()):
+        pdf.cell(0, 6, _latin1(line), new_x="LMARGIN", new_y="NEXT")
+    pdf.ln(3)
+
+    bottom = pdf.h - 16
+    aligns = [column.get("align", "L") for column in report["columns"]]
+    pdf.table_header()
+    for index, row in enumerate(report["rows"]):
+        if pdf.get_y() + ROW_HEIGHT > bottom:
+            pdf.add_page()
+            pdf.table_header()
+        for value, width, align in zip(row, pdf.widths, aligns):
+            pdf.cell(width, ROW_HEIGHT, pdf.fit(_latin1(value), width), align=align, fill=index % 2 == 1)
+        pdf.ln()
+    if not report["rows"]:
+        pdf.cell(0, ROW_HEIGHT * 2, "No records in this period.", new_x="LMARGIN", new_y="NEXT")
+
+    if report.get("totals"):
+        if pdf.get_y() + ROW_HEIGHT * (len(report["totals"]) + 2) > bottom:
+            pdf.add_page()
+        pdf.ln(4)
+        pdf.set_font(FONT, style="B", size=10)
+        for line in report["totals"]:
+            pdf.cell(0, 6, _latin1(line), new_x="LMARGIN", new_y="NEXT")
+
+    # Written next to the target and renamed, so readers never see half a file
+    partial = f"{path}.{os.getpid()}.tmp"
+    pdf.output(partial)
+    os.replace(partial, path)
+    return os.path.getsize(path)
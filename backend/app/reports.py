@@ -0,0 +1,455 @@
+import asyncio
+import hashlib
+import json
+import logging
+import multiprocessing
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from fastapi.responses import FileResponse, Response
+from sqlalchemy import literal, select, union, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .archive import ARCHIVED_TABLES, archived_files, scan
+from .models import Inspection, ReportJob, ReportJobStatus, Trip, User, Vehicle
+
+# Inspection and trip-log PDFs. A report is first built from the database
+# as plain data (the exact strings that will be printed), which is hashed
+# to name the cached file: the same data always maps to the same file, and
+# any change to the underlying rows produces a new one. Misses are rendered
+# in a process pool, so the CPU-heavy layout work never runs on an API
+# worker, and concurrent requests for one report share a single render.
+# Files are served with FileResponse, which streams them in chunks and
+# answers Range requests. Monthly batches run as background jobs whose
+# progress lives in the report_job table, so any worker can report it.
+# Months moved to the Parquet archive (archive.py) are read from there and
+# merged with the database rows, so a report covers the whole range.
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPORTS_DIR = os.getenv("REPORTS_DIR", os.path.join(BACKEND_DIR, "reports"))
+REPORT_WORKERS = int(os.getenv("REPORT_WORKERS", "2"))
+REPORT_MAX_ROWS = int(os.getenv("REPORT_MAX_ROWS", "20000"))
+REPORT_CACHE_MAX_MB = int(os.getenv("REPORT_CACHE_MAX_MB", "1024"))
+
+# Part of every cache key; bump it when reportrender's layout changes, so
+# files rendered by the old layout are not served
+RENDERER_VERSION = 1
+
+REPORT_KINDS = ("inspections", "trips")
+PDF_MEDIA_TYPE = "application/pdf"
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_rendering: Dict[str, asyncio.Future] = {}
+_jobs: set = set()
+
+
+def _executor() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn, not fork: the API process has an event loop, threads and
+        # open connections that a forked child must not inherit
+        _pool = ProcessPoolExecutor(REPORT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def shutdown_pool():
+    global _pool
+    for task in list(_jobs):
+        task.cancel()
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+
+def _render(report: dict, path: str) -> int:
+    # Runs in the pool; importing fpdf only there keeps it out of API start-up
+    from .reportrender import render
+    return render(report, path)
+
+
+def report_key(report: dict) -> str:
+    payload = json.dumps([RENDERER_VERSION, report], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_path(key: str, suffix: str = ".pdf") -> str:
+    return os.path.join(REPORTS_DIR, key + suffix)
+
+
+async def ensure_rendered(report: dict, prune: bool = True) -> Tuple[str, str]:
+    """Key and path of the rendered report, rendering it on a cache miss.
+
+    ``prune`` checks the cache size after a new render; batch jobs pass
+    False and prune once at the end.
+    """
+    global _pool
+    key = report_key(report)
+    path = cache_path(key)
+    if os.path.exists(path):
+        # mtime doubles as last use for pruning
+        os.utime(path)
+        return key, path
+    future = _rendering.get(key)
+    rendered_here = future is None
+    if rendered_here:
+        os.makedirs(REPORTS_DIR, exist_ok=True)
+        future = asyncio.get_running_loop().run_in_executor(_executor(), _render, report, path)
+        _rendering[key] = future
+        future.add_done_callback(lambda _: _rendering.pop(key, None))
+    try:
+        # Shielded so a client that disconnects does not cancel a render others wait for
+        await asyncio.shield(future)
+    except BrokenProcessPool:
+        _pool = None
+        raise
+    if rendered_here and prune:
+        asyncio.get_running_loop().run_in_executor(None, prune_cache)
+    return key, path
+
+
+def prune_cache(max_bytes: int = REPORT_CACHE_MAX_MB * 1024 * 1024) -> int:
+    """Delete the least recently used files once the cache is over budget; returns how many."""
+    try:
+        entries = [(entry.stat().st_mtime, entry.stat().st_size, entry.path) for entry in os.scandir(REPORTS_DIR)
+                   if entry.is_file() and not entry.name.endswith(".tmp")]
+    except FileNotFoundError:
+        return 0
+    total = sum(size for _, size, _ in entries)
+    if total <= max_bytes:
+        return 0
+    removed = 0
+    for _mtime, size, path in sorted(entries):
+        if total <= max_bytes * 0.9:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
+
+
+def file_response(headers, key: str, path: str, filename: str, media_type: str = PDF_MEDIA_TYPE) -> Response:
+    etag = f'"{key}"'
+    if etag in [tag.strip() for tag in headers.get("if-none-match", "").split(",")]:
+        return Response(status_code=304, headers={"ETag": etag})
+    return FileResponse(path, media_type=media_type, filename=filename,
+                        headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+
+
+def _period(start_date: Optional[date], end_date: Optional[date]) -> str:
+    if start_date and end_date:
+        return f"{start_date.isoformat()} to {end_date.isoformat()}"
+    if start_date:
+        return f"from {start_date.isoformat()}"
+    if end_date:
+        return f"up to {end_date.isoformat()}"
+    return "all dates"
+
+
+def _number(value, digits: int = 1) -> str:
+    return "" if value is None else f"{value:,.{digits}f}"
+
+
+def _label(value) -> str:
+    value = getattr(value, "value", value)
+    return "" if value is None else str(value).replace("_", "-").capitalize()
+
+
+async def _subject_lines(db: AsyncSession, vehicle_id: Optional[int], user_id: Optional[int] = None) -> List[str]:
+    lines = []
+    if vehicle_id is not None:
+        vehicle = await db.get(Vehicle, vehicle_id)
+        if vehicle is None:
+            raise LookupError(f"Vehicle with ID {vehicle_id} not found")
+        lines.append(f"Vehicle: {vehicle.licence_plate} - {vehicle.make} {vehicle.model} ({vehicle.year}), "
+                     f"VIN {vehicle.vin}")
+    if user_id is not None:
+        user = await db.get(User, user_id)
+        if user is None:
+            raise LookupError(f"User with ID {user_id} not found")
+        lines.append(f"Driver: {user.name} <{user.email}>")
+    return lines or ["All vehicles"]
+
+
+def _check_size(rows):
+    if len(rows) > REPORT_MAX_ROWS:
+        raise ValueError(f"Report would have more than {REPORT_MAX_ROWS} rows; narrow the vehicle or date range")
+
+
+async def _with_archived(db: AsyncSession, kind: str, rows, columns: List[str], start_date: Optional[date],
+                         end_date: Optional[date], equals: dict) -> list:
+    """``rows`` from the database merged with the archived rows in range, in (date, id) order.
+
+    Archived rows carry the ids only, so the vehicle's licence plate and the
+    user's name are looked up like the database query's joins.
+    """
+    table = ARCHIVED_TABLES[kind]
+    rows = [dict(row._mapping) for row in rows]
+    if not archived_files(table, start_date, end_date):
+        return rows
+    archived = await asyncio.to_thread(scan, table, [*columns, "vehicle_id", "user_id"], start_date, end_date,
+                                       equals, None, REPORT_MAX_ROWS + 1)
+    vehicle_ids = {row["vehicle_id"] for row in archived if row["vehicle_id"] is not None}
+    user_ids = {row["user_id"] for row in archived if row["user_id"] is not None}
+    plates = dict((await db.execute(
+        select(Vehicle.id, Vehicle.licence_plate).where(Vehicle.id.in_(vehicle_ids)))).all()) if vehicle_ids else {}
+    names = dict((await db.execute(
+        select(User.user_id, User.name).where(User.user_id.in_(user_ids)))).all()) if user_ids else {}
+    for row in archived:
+        row["licence_plate"] = plates.get(row["vehicle_id"])
+        row["name"] = names.get(row["user_id"])
+    return sorted(rows + archived, key=lambda row: (row[table.date], row[table.pk]))[:REPORT_MAX_ROWS + 1]
+
+
+async def inspection_report(db: AsyncSession, vehicle_id: Optional[int] = None,
+                            start_date: Optional[date] = None, end_date: Optional[date] = None) -> dict:
+    filters, equals = [], {}
+    if vehicle_id is not None:
+        filters.append(Inspection.vehicle_id == vehicle_id)
+        equals["vehicle_id"] = vehicle_id
+    if start_date:
+        filters.append(Inspection.date >= start_date)
+    if end_date:
+        filters.append(Inspection.date <= end_date)
+    lines = await _subject_lines(db, vehicle_id)
+    rows = (await db.execute(
+        select(Inspection.inspection_id, Inspection.date, Inspection.type, Vehicle.licence_plate, User.name,
+               Inspection.signed_by, Inspection.status)
+        .select_from(Inspection)
+        .outerjoin(Vehicle, Vehicle.id == Inspection.vehicle_id)
+        .outerjoin(User, User.user_id == Inspection.user_id)
+        .where(*filters)
+        .order_by(Inspection.date, Inspection.inspection_id)
+        .limit(REPORT_MAX_ROWS + 1))).all()
+    rows = await _with_archived(db, "inspections", rows, ["type", "signed_by", "status"],
+                                start_date, end_date, equals)
+    _check_size(rows)
+    statuses: Dict[str, int] = {}
+    for row in rows:
+        statuses[_label(row["status"])] = statuses.get(_label(row["status"]), 0) + 1
+    return {
+        "title": "Vehicle Inspection Report",
+        "lines": lines + [f"Period: {_period(start_date, end_date)}"],
+        "columns": [
+            {"title": "Date", "width": 22}, {"title": "Type", "width": 20}, {"title": "Vehicle", "width": 28},
+            {"title": "Inspector", "width": 40}, {"title": "Signed by", "width": 40},
+            {"title": "Status", "width": 22},
+        ],
+        "rows": [[row["date"].isoformat() if row["date"] else "", _label(row["type"]), row["licence_plate"] or "",
+                  row["name"] or "", row["signed_by"] or "", _label(row["status"])] for row in rows],
+        "totals": [f"{len(rows)} inspections" + "".join(
+            f", {count} {status.lower()}" for status, count in sorted(statuses.items()))],
+    }
+
+
+async def trip_report(db: AsyncSession, vehicle_id: Optional[int] = None, user_id: Optional[int] = None,
+                      start_date: Optional[date] = None, end_date: Optional[date] = None) -> dict:
+    filters, equals = [], {}
+    if vehicle_id is not None:
+        filters.append(Trip.vehicle_id == vehicle_id)
+        equals["vehicle_id"] = vehicle_id
+    if user_id is not None:
+        filters.append(Trip.user_id == user_id)
+        equals["user_id"] = user_id
+    if start_date:
+        filters.append(Trip.trip_date >= start_date)
+    if end_date:
+        filters.append(Trip.trip_date <= end_date)
+    lines = await _subject_lines(db, vehicle_id, user_id)
+    rows = (await db.execute(
+        select(Trip.trip_id, Trip.trip_date, Vehicle.licence_plate, User.name, Trip.start_location,
+               Trip.destination, Trip.purpose, Trip.distance, Trip.fuel_consumed, Trip.trip_status)
+        .select_from(Trip)
+        .outerjoin(Vehicle, Vehicle.id == Trip.vehicle_id)
+        .outerjoin(User, User.user_id == Trip.user_id)
+        .where(*filters)
+        .order_by(Trip.trip_date, Trip.trip_id)
+        .limit(REPORT_MAX_ROWS + 1))).all()
+    rows = await _with_archived(
+        db, "trips", rows, ["start_location", "destination", "purpose", "distance", "fuel_consumed", "trip_status"],
+        start_date, end_date, equals)
+    _check_size(rows)
+    distance = sum(row["distance"] or 0 for row in rows)
+    fuel = sum(row["fuel_consumed"] or 0 for row in rows)
+    statuses: Dict[str, int] = {}
+    for row in rows:
+        statuses[_label(row["trip_status"])] = statuses.get(_label(row["trip_status"]), 0) + 1
+    return {
+        "title": "Trip Log",
+        "orientation": "L",
+        "lines": lines + [f"Period: {_period(start_date, end_date)}"],
+        "columns": [
+            {"title": "Date", "width": 22}, {"title": "Vehicle", "width": 24}, {"title": "Driver", "width": 34},
+            {"title": "From", "width": 32}, {"title": "To", "width": 32}, {"title": "Purpose", "width": 40},
+            {"title": "km", "width": 18, "align": "R"}, {"title": "Fuel (L)", "width": 18, "align": "R"},
+            {"title": "Status", "width": 20},
+        ],
+        "rows": [[row["trip_date"].isoformat() if row["trip_date"] else "", row["licence_plate"] or "",
+                  row["name"] or "", row["start_location"] or "", row["destination"] or "", row["purpose"] or "",
+                  _number(row["distance"]), _number(row["fuel_consumed"], 2), _label(row["trip_status"])]
+                 for row in rows],
+        "totals": [
+            f"{len(rows)} trips" + "".join(f", {count} {status.lower()}" for status, count in sorted(statuses.items())),
+            f"Distance {_number(distance)} km, fuel {_number(fuel, 2)} L"
+            + (f", {distance / fuel:.2f} km/L" if fuel else ""),
+        ],
+    }
+
+
+def report_filename(kind: str, vehicle_id: Optional[int] = None, user_id: Optional[int] = None,
+                    start_date: Optional[date] = None, end_date: Optional[date] = None) -> str:
+    parts = [kind.rstrip("s")]
+    if vehicle_id is not None:
+        parts.append(f"vehicle{vehicle_id}")
+    if user_id is not None:
+        parts.append(f"user{user_id}")
+    parts.extend(day.isoformat() for day in (start_date, end_date) if day)
+    return "_".join(parts) + ".pdf"
+
+
+def report_url(kind: str, vehicle_id: int, start_date: date, end_date: date) -> str:
+    return f"/api/reports/{kind}?vehicle_id={vehicle_id}&start_date={start_date}&end_date={end_date}"
+
+
+# Monthly batch jobs
+
+
+def parse_month(value: str) -> date:
+    try:
+        return datetime.strptime(value, "%Y-%m").date()
+    except ValueError:
+        raise ValueError(f"Invalid month '{value}', expected YYYY-MM")
+
+
+def month_range(month: date) -> Tuple[date, date]:
+    following = (month.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return month, following - timedelta(days=1)
+
+
+def parse_kinds(kinds: Optional[str]) -> List[str]:
+    if not kinds:
+        return list(REPORT_KINDS)
+    selected = [kind.strip() for kind in kinds.split(",") if kind.strip()]
+    unknown = [kind for kind in selected if kind not in REPORT_KINDS]
+    if unknown or not selected:
+        raise ValueError(f"Unknown report kinds: {', '.join(unknown) or kinds}; "
+                         f"expected a subset of {', '.join(REPORT_KINDS)}")
+    return selected
+
+
+def job_response(job: ReportJob) -> dict:
+    first, last = month_range(job.month)
+    reports = None
+    if job.reports is not None:
+        reports = [{**item, "url": report_url(item["kind"], item["vehicle_id"], first, last)}
+                   for item in job.reports]
+    return {
+        "job_id": job.job_id, "month": job.month, "kinds": job.kinds.split(","),
+        "status": getattr(job.status, "value", job.status), "total": job.total, "done": job.done,
+        "failed": job.failed, "error": job.error, "created_at": job.created_at,
+        "started_at": job.started_at, "finished_at": job.finished_at, "reports": reports,
+        "archive_url": f"/api/reports/jobs/{job.job_id}/archive" if job.archive_key else None,
+    }
+
+
+async def start_job(db: AsyncSession, month: date, kinds: List[str]) -> ReportJob:
+    job = ReportJob(month=month, kinds=",".join(kinds), status=ReportJobStatus.queued)
+    db.add(job)
+    await db.commit()
+    await db.refresh(job)
+    task = asyncio.create_task(run_job(job.job_id))
+    _jobs.add(task)
+    task.add_done_callback(_jobs.discard)
+    return job
+
+
+async def _update_job(session_factory, job_id: int, **values):
+    async with session_factory() as db:
+        await db.execute(update(ReportJob).where(ReportJob.job_id == job_id).values(**values))
+        await db.commit()
+
+
+def _write_archive(path: str, members: List[Tuple[str, str]]):
+    partial = f"{path}.{os.getpid()}.tmp"
+    # PDFs are already deflated; storing them keeps the archive cheap to build
+    with zipfile.ZipFile(partial, "w", compression=zipfile.ZIP_STORED) as archive:
+        for name, source in members:
+            archive.write(source, name)
+    os.replace(partial, path)
+
+
+async def run_job(job_id: int, session_factory=None):
+    """Render every vehicle's reports for the job's month, recording progress as it goes."""
+    if session_factory is None:
+        from .database import AsyncSessionLocal
+        session_factory = AsyncSessionLocal
+    try:
+        async with session_factory() as db:
+            job = await db.get(ReportJob, job_id)
+            month, kinds = job.month, job.kinds.split(",")
+            first, last = month_range(month)
+            sources = []
+            if "inspections" in kinds:
+                sources.append(select(Inspection.vehicle_id.label("vehicle_id"), literal("inspections").label("kind"))
+                               .where(Inspection.date.between(first, last), Inspection.vehicle_id.isnot(None))
+                               .distinct())
+            if "trips" in kinds:
+                sources.append(select(Trip.vehicle_id.label("vehicle_id"), literal("trips").label("kind"))
+                               .where(Trip.trip_date.between(first, last), Trip.vehicle_id.isnot(None))
+                               .distinct())
+            # A union of one select adds no DISTINCT of its own
+            work = (await db.execute(union(*sources).order_by("vehicle_id", "kind"))).all()
+        await _update_job(session_factory, job_id, status=ReportJobStatus.running, total=len(work),
+                          started_at=datetime.now(timezone.utc))
+
+        results: list = []
+        # One report in flight per pool process keeps the pool busy without
+        # holding more database connections than that
+        limit = asyncio.Semaphore(REPORT_WORKERS)
+
+        async def one(vehicle_id: int, kind: str):
+            async with limit:
+                try:
+                    async with session_factory() as db:
+                        if kind == "inspections":
+                            report = await inspection_report(db, vehicle_id, first, last)
+                        else:
+                            report = await trip_report(db, vehicle_id, None, first, last)
+                    key, path = await ensure_rendered(report, prune=False)
+                    results.append({"kind": kind, "vehicle_id": vehicle_id, "rows": len(report["rows"]),
+                                    "key": key, "bytes": os.path.getsize(path)})
+                    await _update_job(session_factory, job_id, done=ReportJob.done + 1)
+                except Exception as e:
+                    logger.warning("Report job %s: %s for vehicle %s failed: %s", job_id, kind, vehicle_id, e)
+                    await _update_job(session_factory, job_id, failed=ReportJob.failed + 1)
+
+        await asyncio.gather(*(one(vehicle_id, kind) for vehicle_id, kind in work))
+        results.sort(key=lambda item: (item["vehicle_id"], item["kind"]))
+
+        archive_key = None
+        if results:
+            archive_key = hashlib.sha256("".join(item["key"] for item in results).encode()).hexdigest()
+            archive = cache_path(archive_key, ".zip")
+            if not os.path.exists(archive):
+                members = [(report_filename(item["kind"], item["vehicle_id"], None, first, last),
+                            cache_path(item["key"])) for item in results]
+                await asyncio.get_running_loop().run_in_executor(None, _write_archive, archive, members)
+        await _update_job(session_factory, job_id, status=ReportJobStatus.done, reports=results,
+                          archive_key=archive_key, finished_at=datetime.now(timezone.utc))
+        await asyncio.get_running_loop().run_in_executor(None, prune_cache)
+    except asyncio.CancelledError:
+        await asyncio.shield(_update_job(session_factory, job_id, status=ReportJobStatus.failed,
+                                         error="Interrupted by shutdown", finished_at=datetime.now(timezone.utc)))
+        raise
+    except Exception as e:
+        logger.exception("Report job %s failed", job_id)
+        await _update_job(session_factory, job_id, status=ReportJobStatus.failed, error=str(e),
+                          finished_at=datetime.now(timezone.utc))
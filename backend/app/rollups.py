@@ -0,0 +1,201 @@
+"""Daily trip rollups.
+
+``trip_daily_rollup`` holds per (day, vehicle, user) sums so analytics read a
+few rows per day instead of every trip. It is kept exact by applying deltas
+in the same transaction as each trip write; ``rebuild`` recomputes it from
+scratch and ``check`` compares it with the raw trip table:
+
+    python -m app.rollups rebuild
+    python -m app.rollups check
+
+Under a trip retention (TRIP_RETENTION_MONTHS, see partitions.py) both
+leave the days before the retained months alone: their trips are gone but
+their rollups stay. The same goes for months moved to the archive (see
+archive.py).
+"""
+import argparse
+import sys
+from datetime import date
+from typing import Iterable, List, Optional
+
+from sqlalchemy import and_, func, literal, or_, select, text
+from sqlalchemy.dialects.postgresql import insert
+
+from .models import Status, Trip, TripDailyRollup
+from .partitions import TRIP_RETENTION_MONTHS, retention_cutoff
+
+# Key used for trips whose vehicle or user no longer exists
+ORPHAN_ID = 0
+
+SUM_COLUMNS = ("trip_count", "distance_count", "total_distance", "fuel_count",
+               "total_fuel", "completed", "cancelled", "pending")
+
+
+def trip_values(trip) -> dict:
+    """The columns of a Trip (ORM object or dict) that feed the rollup."""
+    get = trip.get if isinstance(trip, dict) else lambda name: getattr(trip, name)
+    status = get("trip_status")
+    return {
+        "trip_date": get("trip_date"),
+        "vehicle_id": get("vehicle_id"),
+        "user_id": get("user_id"),
+        "distance": get("distance"),
+        "fuel_consumed": get("fuel_consumed"),
+        # Mirrors the column default applied when a trip is saved without a status
+        "trip_status": Status(status) if status is not None else Status.pending,
+    }
+
+
+def trip_delta(values: dict, sign: int) -> Optional[dict]:
+    if values["trip_date"] is None:
+        return None
+    distance, fuel = values["distance"], values["fuel_consumed"]
+    status = values["trip_status"]
+    return {
+        "day": values["trip_date"],
+        "vehicle_id": values["vehicle_id"] or ORPHAN_ID,
+        "user_id": values["user_id"] or ORPHAN_ID,
+        "trip_count": sign,
+        "distance_count": sign if distance is not None else 0,
+        "total_distance": sign * (distance or 0.0),
+        "fuel_count": sign if fuel is not None else 0,
+        "total_fuel": sign * (fuel or 0.0),
+        "completed": sign if status == Status.completed else 0,
+        "cancelled": sign if status == Status.cancelled else 0,
+        "pending": sign if status == Status.pending else 0,
+    }
+
+
+def _merge(deltas: Iterable[Optional[dict]]) -> List[dict]:
+    # One statement cannot upsert the same row twice, and a stable key order
+    # keeps concurrent writers from deadlocking on each other's rows.
+    merged = {}
+    for delta in deltas:
+        if delta is None:
+            continue
+        key = (delta["day"], delta["vehicle_id"], delta["user_id"])
+        if key in merged:
+            for column in SUM_COLUMNS:
+                merged[key][column] += delta[column]
+        else:
+            merged[key] = dict(delta)
+    return [merged[key] for key in sorted(merged)]
+
+
+def _upsert(rows: List[dict]):
+    statement = insert(TripDailyRollup).values(rows)
+    return statement.on_conflict_do_update(
+        index_elements=["day", "vehicle_id", "user_id"],
+        set_={column: getattr(TripDailyRollup, column) + getattr(statement.excluded, column)
+              for column in SUM_COLUMNS})
+
+
+async def apply_trip_deltas(db, deltas: Iterable[Optional[dict]]):
+    """Add trip deltas to the rollup inside the caller's transaction."""
+    rows = _merge(deltas)
+    if rows:
+        await db.execute(_upsert(rows))
+
+
+async def record_trip_change(db, old: Optional[dict], new: Optional[dict]):
+    """Move a trip's contribution from ``old`` values to ``new`` values."""
+    await apply_trip_deltas(db, [
+        trip_delta(old, -1) if old else None,
+        trip_delta(new, 1) if new else None,
+    ])
+
+
+async def orphan_rollups(db, column: str, key: int):
+    """Fold a deleted vehicle's or user's rows into the orphan key.
+
+    Deleting a vehicle or user nulls the reference on its trips, so their
+    totals move to ORPHAN_ID rather than disappearing from fleet totals.
+    """
+    key_column = getattr(TripDailyRollup, column)
+    moved = select(*(literal(ORPHAN_ID).label(column) if name == column else getattr(TripDailyRollup, name)
+                     for name in ("day", "vehicle_id", "user_id") + SUM_COLUMNS)).where(key_column == key)
+    statement = insert(TripDailyRollup).from_select(
+        ["day", "vehicle_id", "user_id", *SUM_COLUMNS], moved)
+    await db.execute(statement.on_conflict_do_update(
+        index_elements=["day", "vehicle_id", "user_id"],
+        set_={name: getattr(TripDailyRollup, name) + getattr(statement.excluded, name)
+              for name in SUM_COLUMNS}))
+    await db.execute(TripDailyRollup.__table__.delete().where(key_column == key))
+
+
+def raw_daily_aggregates(since: Optional[date] = None):
+    """The rollup contents recomputed from the trip table, from ``since`` on if given."""
+    statement = select(
+        Trip.trip_date.label("day"),
+        func.coalesce(Trip.vehicle_id, ORPHAN_ID).label("vehicle_id"),
+        func.coalesce(Trip.user_id, ORPHAN_ID).label("user_id"),
+        func.count().label("trip_count"),
+        func.count(Trip.distance).label("distance_count"),
+        func.coalesce(func.sum(Trip.distance), 0).label("total_distance"),
+        func.count(Trip.fuel_consumed).label("fuel_count"),
+        func.coalesce(func.sum(Trip.fuel_consumed), 0).label("total_fuel"),
+        func.count().filter(Trip.trip_status == Status.completed).label("completed"),
+        func.count().filter(Trip.trip_status == Status.cancelled).label("cancelled"),
+        func.count().filter(or_(Trip.trip_status == Status.pending,
+                                Trip.trip_status.is_(None))).label("pending"),
+    ).where(Trip.trip_date.isnot(None)).group_by(
+        Trip.trip_date, func.coalesce(Trip.vehicle_id, ORPHAN_ID), func.coalesce(Trip.user_id, ORPHAN_ID))
+    return statement.where(Trip.trip_date >= since) if since else statement
+
+
+def rebuild(connection, since: Optional[date] = None):
+    """Recompute the rollup, from ``since`` on if given. Trip writes wait until it commits."""
+    connection.execute(text(f"LOCK TABLE {Trip.__tablename__} IN SHARE MODE"))
+    delete = TripDailyRollup.__table__.delete()
+    connection.execute(delete.where(TripDailyRollup.day >= since) if since else delete)
+    connection.execute(insert(TripDailyRollup).from_select(
+        ["day", "vehicle_id", "user_id", *SUM_COLUMNS], raw_daily_aggregates(since)))
+
+
+def check(connection, tolerance: float = 1e-6, since: Optional[date] = None) -> list:
+    """Return (day, vehicle_id, user_id, rollup, raw) for every mismatching key from ``since`` on."""
+    raw = raw_daily_aggregates(since).subquery("raw")
+    rollup = select(TripDailyRollup).where(TripDailyRollup.trip_count != 0)
+    if since:
+        rollup = rollup.where(TripDailyRollup.day >= since)
+    rollup = rollup.subquery("rollup")
+    joined = raw.join(rollup, and_(raw.c.day == rollup.c.day,
+                                   raw.c.vehicle_id == rollup.c.vehicle_id,
+                                   raw.c.user_id == rollup.c.user_id), full=True)
+    differs = [func.abs(func.coalesce(raw.c[name], 0) - func.coalesce(rollup.c[name], 0)) > tolerance
+               for name in SUM_COLUMNS]
+    query = select(
+        func.coalesce(raw.c.day, rollup.c.day).label("day"),
+        func.coalesce(raw.c.vehicle_id, rollup.c.vehicle_id).label("vehicle_id"),
+        func.coalesce(raw.c.user_id, rollup.c.user_id).label("user_id"),
+        *(rollup.c[name].label(f"rollup_{name}") for name in SUM_COLUMNS),
+        *(raw.c[name].label(f"raw_{name}") for name in SUM_COLUMNS),
+    ).select_from(joined).where(or_(*differs)).order_by("day", "vehicle_id", "user_id")
+    return connection.execute(query).all()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Maintain the trip_daily_rollup table")
+    parser.add_argument("command", choices=["rebuild", "check"])
+    args = parser.parse_args(argv)
+
+    from .database import engine
+    from .archive import ARCHIVED_TABLES, hot_since
+    since = max(filter(None, (retention_cutoff(TRIP_RETENTION_MONTHS), hot_since(ARCHIVED_TABLES["trips"]))),
+                default=None)
+    if args.command == "rebuild":
+        with engine.begin() as connection:
+            rebuild(connection, since)
+        print("trip_daily_rollup rebuilt" + (f" from {since}" if since else ""))
+        return 0
+
+    with engine.connect() as connection:
+        mismatches = check(connection, since=since)
+    for row in mismatches:
+        print(dict(row._mapping))
+    print(f"{len(mismatches)} mismatching rollup keys")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
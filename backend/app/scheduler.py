@@ -0,0 +1,131 @@
+import asyncio
+import logging
+import os
+from datetime import date, timedelta
+from typing import Optional
+
+from sqlalchemy import exists, func, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import insert
+
+from .events import queue_event
+from .models import Role, ServiceNotification, User, Vehicle
+from .schemas import ServiceNotificationResponse
+
+# Background scan for vehicles due for a service. Each pass creates the
+# missing ServiceNotification rows with one INSERT ... SELECT, queues an
+# email to the admins for each unsent one in the outbox and marks them
+# notified in a single UPDATE, all in the same transaction. A trip that
+# takes a vehicle past its km interval wakes the scan early (request_scan),
+# so the notification does not wait for the next interval.
+
+logger = logging.getLogger(__name__)
+
+SERVICE_INTERVAL_KM = int(os.getenv("SERVICE_INTERVAL_KM", "15000"))
+SERVICE_INTERVAL_DAYS = int(os.getenv("SERVICE_INTERVAL_DAYS", "365"))
+SERVICE_SCAN_INTERVAL_SECONDS = float(os.getenv("SERVICE_SCAN_INTERVAL_SECONDS", "3600"))
+SERVICE_SCHEDULER_ENABLED = os.getenv("SERVICE_SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+NOTIFICATION_BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", "500"))
+
+# pg_try_advisory_xact_lock key, so only one worker process scans at a time
+SCHEDULER_LOCK_KEY = 0x5E41CE
+
+
+def due_vehicles(today: date):
+    """Vehicles past their km or time interval without a notification since their last service."""
+    already_notified = exists().where(
+        ServiceNotification.vehicle_id == Vehicle.id,
+        ServiceNotification.service_date >= Vehicle.last_service_date)
+    return select(Vehicle.id, literal(today), literal(False)).where(
+        or_(Vehicle.mileage - Vehicle.last_service_km >= SERVICE_INTERVAL_KM,
+            Vehicle.last_service_date <= today - timedelta(days=SERVICE_INTERVAL_DAYS)),
+        ~already_notified)
+
+
+def create_due_notifications(db, today: date) -> list:
+    statement = insert(ServiceNotification).from_select(
+        ["vehicle_id", "service_date", "notified"], due_vehicles(today)
+    ).returning(ServiceNotification.notification_id, ServiceNotification.vehicle_id,
+                ServiceNotification.service_date)
+    return db.execute(statement).all()
+
+
+def announce_created(db, created, notified_ids=()):
+    # The INSERT ... SELECT bypasses the unit of work, so queue the push events here
+    for row in created:
+        data = ServiceNotificationResponse(
+            notification_id=row.notification_id, vehicle_id=row.vehicle_id,
+            service_date=row.service_date, notified=row.notification_id in notified_ids)
+        queue_event(db, "service_notification", "created", data.model_dump(mode="json"), row.vehicle_id)
+
+
+def notification_message(row):
+    km_since_service = row.mileage - row.last_service_km
+    body = (
+        f"Vehicle {row.make} {row.model} ({row.licence_plate}) is due for a service.\n\n"
+        f"Current mileage: {row.mileage} km ({km_since_service} km since last service)\n"
+        f"Last service date: {row.last_service_date}\n"
+        f"Notification date: {row.service_date}\n"
+    )
+    return f"Service due: {row.licence_plate}", body
+
+
+def run_once(today=None) -> dict:
+    """One scheduler pass; blocking, so callers on the event loop use a thread."""
+    from .database import SessionLocal
+    from .outbox import enqueue_email
+    today = today or date.today()
+    with SessionLocal() as db, db.begin():
+        if not db.scalar(select(func.pg_try_advisory_xact_lock(SCHEDULER_LOCK_KEY))):
+            return {"skipped": True}
+        created = create_due_notifications(db, today)
+
+        pending = db.execute(
+            select(ServiceNotification.notification_id, ServiceNotification.service_date,
+                   Vehicle.make, Vehicle.model, Vehicle.licence_plate, Vehicle.mileage,
+                   Vehicle.last_service_km, Vehicle.last_service_date)
+            .join(Vehicle, Vehicle.id == ServiceNotification.vehicle_id)
+            .where(ServiceNotification.notified.isnot(True))
+            .order_by(ServiceNotification.notification_id)
+            .limit(NOTIFICATION_BATCH_SIZE)
+            .with_for_update(of=ServiceNotification, skip_locked=True)
+        ).all()
+        recipients = db.scalars(select(User.email).where(
+            User.role == Role.admin, User.email.isnot(None))).all()
+        if not pending or not recipients:
+            announce_created(db, created)
+            return {"created": len(created), "pending": len(pending), "queued": 0}
+
+        to_email = ", ".join(recipients)
+        for row in pending:
+            subject, body = notification_message(row)
+            enqueue_email(db, to_email, subject, body)
+        db.execute(update(ServiceNotification)
+                   .where(ServiceNotification.notification_id.in_([row.notification_id for row in pending]))
+                   .values(notified=True))
+        announce_created(db, created, {row.notification_id for row in pending})
+        return {"created": len(created), "pending": len(pending), "queued": len(pending)}
+
+
+_wakeup: Optional[asyncio.Event] = None
+
+
+def request_scan():
+    """Run the next scheduler pass now instead of at the end of the interval."""
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def run_scheduler(interval: float = SERVICE_SCAN_INTERVAL_SECONDS):
+    global _wakeup
+    _wakeup = asyncio.Event()
+    while True:
+        try:
+            result = await asyncio.to_thread(run_once)
+            logger.info("Service scheduler pass: %s", result)
+        except Exception:
+            logger.exception("Service scheduler pass failed")
+        try:
+            await asyncio.wait_for(_wakeup.wait(), interval)
+        except asyncio.TimeoutError:
+            pass
+        _wakeup.clear()
@@ -1,7 +1,7 @@
 from pydantic import BaseModel, EmailStr
 from enum import Enum
-from typing import Optional, List
-from datetime import date
+from typing import Any, Optional, List
+from datetime import date, datetime
 
 # Role Enum
 
@@ -61,7 +61,7 @@ class UserBase(BaseModel):
 
 
 class UserCreate(UserBase):
-    password: str  # Note: We're using plain text passwords as per your request
+    password: str  # hashed before it is stored
 
 
 class UserResponse(UserBase):
@@ -159,6 +159,117 @@ class ServiceHistoryResponse(ServiceHistoryBase):
     class Config:
         from_attributes = True
 
+# Analytics Schemas
+
+
+class TripStats(BaseModel):
+    trip_count: int
+    total_distance: float
+    total_fuel: float
+    avg_distance: Optional[float] = None
+    avg_fuel_consumed: Optional[float] = None
+    km_per_litre: Optional[float] = None
+    completed: int
+    cancelled: int
+    pending: int
+
+
+class VehicleTripStats(TripStats):
+    vehicle_id: int
+
+
+class UserTripStats(TripStats):
+    user_id: int
+
+
+class MonthlyTripStats(TripStats):
+    month: date
+
+
+class FleetAnalyticsResponse(BaseModel):
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    totals: TripStats
+    by_vehicle: List[VehicleTripStats]
+    by_user: List[UserTripStats]
+    monthly: List[MonthlyTripStats]
+
+
+class VehicleAnalyticsResponse(BaseModel):
+    vehicle_id: int
+    start_date: Optional[date] = None
+    end_date: Optional[date] = None
+    totals: TripStats
+    by_user: List[UserTripStats]
+    monthly: List[MonthlyTripStats]
+
+# Bulk ingestion Schemas
+
+
+class BulkRowError(BaseModel):
+    row: int
+    detail: Any
+
+
+class BulkResult(BaseModel):
+    received: int
+    inserted: int
+    failed: int
+    ids: List[int]
+    errors: List[BulkRowError]
+
+# Schema for search results
+
+
+class SearchHit(BaseModel):
+    type: str
+    id: int
+    title: Optional[str] = None
+    subtitle: Optional[str] = None
+    score: float
+
+# Schemas for the change feed
+
+
+class ChangeEntry(BaseModel):
+    table: str
+    id: int
+    op: str
+    changed_at: datetime
+    data: Optional[dict] = None
+
+
+class ChangeFeed(BaseModel):
+    changes: List[ChangeEntry]
+    next_cursor: str
+    has_more: bool
+
+# Schemas for batch report jobs
+
+
+class ReportItem(BaseModel):
+    kind: str
+    vehicle_id: int
+    rows: int
+    bytes: int
+    url: str
+
+
+class ReportJobResponse(BaseModel):
+    job_id: int
+    month: date
+    kinds: List[str]
+    status: str
+    total: int
+    done: int
+    failed: int
+    error: Optional[str] = None
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    reports: Optional[List[ReportItem]] = None
+    archive_url: Optional[str] = None
+
 # Schema for login
 
 
@@ -0,0 +1,91 @@
+from sqlalchemy import Float, Numeric, and_, cast, func, literal, select, text, union_all
+
+from .models import Trip, User, Vehicle, search_document
+
+# Typeahead search over vehicles, users and trips. Each entity is matched
+# against one concatenated document expression backed by a pg_trgm GiST index
+# (see models.search_index). The index answers substring ILIKE, leading
+# wildcards included, and returns the rows nearest to the query in
+# word-similarity order, so ranked top-k search reads only k rows instead of
+# scoring and sorting every match.
+
+SEARCH_MAX_LIMIT = 50
+SEARCH_TYPES = ("vehicle", "user", "trip")
+
+# type -> (model, primary key, indexed columns in index order, title, subtitle)
+SEARCH_TARGETS = {
+    "vehicle": (Vehicle, Vehicle.id, (Vehicle.make, Vehicle.model, Vehicle.licence_plate, Vehicle.vin),
+                func.concat_ws(" ", Vehicle.make, Vehicle.model), Vehicle.licence_plate),
+    "user": (User, User.user_id, (User.name, User.email), User.name, User.email),
+    "trip": (Trip, Trip.trip_id, (Trip.start_location, Trip.destination, Trip.purpose),
+             func.concat_ws(" - ", Trip.start_location, Trip.destination), Trip.purpose),
+}
+
+
+def ensure_search_extension(connection):
+    # Needed before create_all, which creates the indexes with new tables
+    connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+
+
+def ensure_search_indexes(connection):
+    # create_all skips existing tables, so add the indexes to older databases
+    for model, *_ in SEARCH_TARGETS.values():
+        for index in model.__table__.indexes:
+            if index.name.endswith("_search_trgm"):
+                index.create(connection, checkfirst=True)
+
+
+def escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def parse_types(types):
+    """Comma separated type names, or all of them; raises ValueError on unknown names."""
+    if not types:
+        return SEARCH_TYPES
+    requested = tuple(dict.fromkeys(name.strip() for name in types.split(",") if name.strip()))
+    unknown = [name for name in requested if name not in SEARCH_TYPES]
+    if unknown or not requested:
+        raise ValueError(f"Unknown search types: {', '.join(unknown)}; expected {', '.join(SEARCH_TYPES)}")
+    return requested
+
+
+def vehicle_contains(column, value: str):
+    """``column ILIKE '%value%'``, pre-filtered through the vehicle search index.
+
+    The document contains every indexed column, so matching it is a
+    necessary condition that the GiST trigram index (GiST rather than GIN,
+    for the KNN ordering) can answer; the column check then keeps the exact
+    per-field semantics.
+    """
+    pattern = f"%{escape_like(value)}%"
+    _model, _pk, columns, *_ = SEARCH_TARGETS["vehicle"]
+    return and_(search_document(*columns).ilike(pattern, escape="\\"),
+                column.ilike(pattern, escape="\\"))
+
+
+def search_statement(q: str, types=SEARCH_TYPES, limit: int = 10):
+    """One UNION ALL query returning the best ``limit`` hits across ``types``.
+
+    Rows match when the query is word-similar to their document (above
+    pg_trgm.word_similarity_threshold, 0.6 by default), which covers prefixes
+    and tolerates typos; score is the word similarity, 1.0 for an exact
+    word or prefix.
+    """
+    query = " ".join(q.split())
+    branches = []
+    for kind in types:
+        _model, pk, columns, title, subtitle = SEARCH_TARGETS[kind]
+        document = search_document(*columns)
+        distance = document.op("<->>", return_type=Float)(query)
+        branches.append(
+            select(literal(kind).label("type"), pk.label("id"), title.label("title"),
+                   subtitle.label("subtitle"), func.round(cast(1 - distance, Numeric), 4).label("score"))
+            .where(document.op("%>")(query))
+            # No tiebreaker here: one would force a sort of every equally
+            # similar row, where the bare distance lets the index stop at k
+            .order_by(distance)
+            .limit(limit)
+        )
+    hits = union_all(*branches).subquery()
+    return select(hits).order_by(hits.c.score.desc(), hits.c.type, hits.c.id).limit(limit)
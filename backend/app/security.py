@@ -1,23 +1,201 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import hmac
+import json
+import os
+import secrets
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import NamedTuple, Optional
+
 from fastapi import Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+
+# Passwords and bearer tokens. Passwords are stored as scrypt hashes with
+# their cost parameters, so the cost can be raised later and older hashes
+# are upgraded on the next successful login. Hashing runs on a small
+# dedicated thread pool (hashlib releases the GIL) and at most
+# PASSWORD_HASH_QUEUE logins wait for it; beyond that a burst is answered
+# with 503 instead of queueing behind itself. Logins return an HS256 JWT
+# that is checked with the cached key alone, so authenticated requests
+# need no database round trip. A token keeps the role it was issued with
+# until it expires.
+
+PASSWORD_SCRYPT_N = int(os.getenv("PASSWORD_SCRYPT_N", str(2 ** 14)))
+PASSWORD_SCRYPT_R = int(os.getenv("PASSWORD_SCRYPT_R", "8"))
+PASSWORD_SCRYPT_P = int(os.getenv("PASSWORD_SCRYPT_P", "1"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1))))
+PASSWORD_HASH_QUEUE = int(os.getenv("PASSWORD_HASH_QUEUE", "64"))
+JWT_SECRET = os.getenv("JWT_SECRET")
+# Values shipped in examples, never accepted as the signing key
+PLACEHOLDER_JWT_SECRETS = ("change-me-in-production",)
+JWT_TTL_SECONDS = int(os.getenv("JWT_TTL_SECONDS", str(12 * 3600)))
+
+HASH_SCHEME = "scrypt"
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(data: str) -> bytes:
+    return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4))
+
+
+def _scrypt(password: str, salt: bytes, n: int, r: int, p: int) -> bytes:
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p + (1 << 20), dklen=32)
+
+
+def hash_password_sync(password: str) -> str:
+    salt = secrets.token_bytes(16)
+    digest = _scrypt(password, salt, PASSWORD_SCRYPT_N, PASSWORD_SCRYPT_R, PASSWORD_SCRYPT_P)
+    return (f"{HASH_SCHEME}${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}$"
+            f"{_b64encode(salt)}${_b64encode(digest)}")
+
+
+@lru_cache(maxsize=1)
+def _dummy_hash() -> str:
+    return hash_password_sync(secrets.token_urlsafe(16))
+
+
+def verify_password_sync(password: str, stored: Optional[str]) -> bool:
+    if stored is None:
+        # Unknown users still cost one hash, so timing does not reveal which emails exist
+        verify_password_sync(password, _dummy_hash())
+        return False
+    if not stored.startswith(HASH_SCHEME + "$"):
+        # Rows from before hashing hold the plain password
+        return hmac.compare_digest(password.encode(), stored.encode())
+    try:
+        _scheme, n, r, p, salt, digest = stored.split("$")
+        expected = _b64decode(digest)
+        actual = _scrypt(password, _b64decode(salt), int(n), int(r), int(p))
+    except (ValueError, OverflowError, binascii.Error):
+        # A truncated or corrupted hash matches no password
+        return False
+    return hmac.compare_digest(actual, expected)
+
+
+def needs_rehash(stored: str) -> bool:
+    return not stored.startswith(
+        f"{HASH_SCHEME}${PASSWORD_SCRYPT_N}${PASSWORD_SCRYPT_R}${PASSWORD_SCRYPT_P}$")
+
+
+_executor: Optional[ThreadPoolExecutor] = None
+_pending = 0
+
+
+async def _run_kdf(fn, *args):
+    global _executor, _pending
+    if _pending >= PASSWORD_HASH_QUEUE:
+        raise HTTPException(status_code=503, detail="Too many logins in progress, please retry",
+                            headers={"Retry-After": "1"})
+    if _executor is None:
+        _executor = ThreadPoolExecutor(PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+    _pending += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_executor, fn, *args)
+    finally:
+        _pending -= 1
+
 
-from backend.app.main import get_db
-from . import models
+async def hash_password(password: str) -> str:
+    return await _run_kdf(hash_password_sync, password)
 
-def get_current_user(db: Session = Depends(get_db)):
-    # Function to fetch the current user (you'll need to implement this in your authentication system)
-    pass
 
-def require_admin(current_user: models.User = Depends(get_current_user)):
+async def verify_password(password: str, stored: Optional[str]) -> bool:
+    return await _run_kdf(verify_password_sync, password, stored)
+
+
+def password_hash_snapshot() -> dict:
+    return {"workers": PASSWORD_HASH_WORKERS, "pending": _pending, "queue_limit": PASSWORD_HASH_QUEUE,
+            "scrypt": {"n": PASSWORD_SCRYPT_N, "r": PASSWORD_SCRYPT_R, "p": PASSWORD_SCRYPT_P}}
+
+
+class CurrentUser(NamedTuple):
+    user_id: int
+    email: str
+    role: str
+
+
+_TOKEN_HEADER = _b64encode(json.dumps({"alg": "HS256", "typ": "JWT"}, separators=(",", ":")).encode())
+
+
+def check_jwt_secret():
+    """Raise unless JWT_SECRET is set to a real key; the app refuses to start without one."""
+    if not JWT_SECRET or JWT_SECRET.strip() in PLACEHOLDER_JWT_SECRETS:
+        raise RuntimeError(
+            "JWT_SECRET must be set to a private random value shared by every worker, e.g. "
+            "python -c 'import secrets; print(secrets.token_urlsafe(32))'")
+
+
+@lru_cache(maxsize=1)
+def _signing_key() -> bytes:
+    check_jwt_secret()
+    return JWT_SECRET.encode()
+
+
+def _sign(message: str) -> str:
+    return _b64encode(hmac.new(_signing_key(), message.encode("ascii"), hashlib.sha256).digest())
+
+
+def create_token(user_id: int, email: str, role: str, ttl: int = JWT_TTL_SECONDS) -> str:
+    now = int(time.time())
+    claims = {"sub": str(user_id), "email": email, "role": role, "iat": now, "exp": now + ttl}
+    message = f"{_TOKEN_HEADER}.{_b64encode(json.dumps(claims, separators=(',', ':')).encode())}"
+    return f"{message}.{_sign(message)}"
+
+
+def decode_token(token: str) -> CurrentUser:
+    """Claims of a token this service issued; ValueError if it is malformed, forged or expired."""
+    header, _, rest = token.partition(".")
+    payload, _, signature = rest.partition(".")
+    # Only the exact header we issue is accepted, which rules out alg=none and key confusion
+    if header != _TOKEN_HEADER or not hmac.compare_digest(signature, _sign(f"{header}.{payload}")):
+        raise ValueError("invalid token")
+    try:
+        claims = json.loads(_b64decode(payload))
+        user = CurrentUser(int(claims["sub"]), claims["email"], claims["role"])
+        expires = claims["exp"]
+    except (KeyError, TypeError, ValueError):
+        raise ValueError("invalid token claims")
+    if expires <= time.time():
+        raise ValueError("token expired")
+    return user
+
+
+bearer_scheme = HTTPBearer(auto_error=False)
+
+
+async def get_current_user(
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(bearer_scheme)) -> CurrentUser:
+    if credentials is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return decode_token(credentials.credentials)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=f"Invalid token: {e}",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+
+async def require_admin(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
     if current_user.role != "admin":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Admin rights required"
         )
+    return current_user
+
 
-def require_employee(current_user: models.User = Depends(get_current_user)):
+async def require_employee(current_user: CurrentUser = Depends(get_current_user)) -> CurrentUser:
     if current_user.role != "employee":
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
             detail="Employee rights required"
         )
+    return current_user
@@ -0,0 +1,82 @@
+import os
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple, Type
+
+import orjson
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy import inspect, select
+from sqlalchemy.orm import aliased
+
+from .loading import nested_schema
+
+# Fast path for the hot list endpoints. Instead of loading ORM objects and
+# validating each one through the response model, select exactly the
+# columns the schema serializes (joining many-to-one relationships it
+# nests), turn the rows into dicts of the same shape and encode them with
+# orjson. The output matches the response_model path for any row the
+# database constraints allow; FAST_SERIALIZATION=false switches back.
+
+FAST_SERIALIZATION = os.getenv("FAST_SERIALIZATION", "true").lower() in ("1", "true", "yes")
+
+
+class FastJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+class RowPlan(NamedTuple):
+    columns: tuple
+    joins: tuple
+    # (field name, first column index, nested field names or None)
+    layout: Tuple[Tuple[str, int, Optional[tuple]], ...]
+
+
+@lru_cache(maxsize=None)
+def row_plan(model, schema: Type[BaseModel]) -> RowPlan:
+    """Columns to select for ``schema`` and where each field's values sit in a row."""
+    relationships = inspect(model).relationships
+    columns, joins, layout = [], [], []
+    for name, field in schema.model_fields.items():
+        if name not in relationships:
+            layout.append((name, len(columns), None))
+            columns.append(getattr(model, name).label(name))
+            continue
+        relationship = relationships[name]
+        nested = nested_schema(field.annotation)
+        if relationship.uselist or nested is None:
+            raise ValueError(f"{schema.__name__}.{name}: only many-to-one relationships are supported")
+        target = aliased(relationship.mapper.class_)
+        joins.append((target, getattr(model, name).of_type(target)))
+        fields = tuple(nested.model_fields)
+        layout.append((name, len(columns), fields))
+        columns.extend(getattr(target, field_name).label(f"{name}__{field_name}") for field_name in fields)
+    return RowPlan(tuple(columns), tuple(joins), tuple(layout))
+
+
+def select_rows(model, schema: Type[BaseModel]):
+    """select() of the columns ``schema`` needs, as plain rows."""
+    plan = row_plan(model, schema)
+    statement = select(*plan.columns).select_from(model)
+    for target, onclause in plan.joins:
+        statement = statement.outerjoin(target, onclause)
+    return statement
+
+
+def rows_to_dicts(rows, model, schema: Type[BaseModel]) -> list:
+    plan = row_plan(model, schema)
+    if not plan.joins:
+        names = tuple(name for name, _start, _nested in plan.layout)
+        return [dict(zip(names, row)) for row in rows]
+    items = []
+    for row in rows:
+        item = {}
+        for name, start, nested in plan.layout:
+            if nested is None:
+                item[name] = row[start]
+                continue
+            values = row[start:start + len(nested)]
+            # An outer join without a match leaves every column null
+            item[name] = dict(zip(nested, values)) if any(value is not None for value in values) else None
+        items.append(item)
+    return items
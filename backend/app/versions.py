@@ -0,0 +1,121 @@
+import itertools
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple, Optional
+
+from sqlalchemy import event, func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from .models import Inspection, ServiceHistory, ServiceNotification, TableVersion, Trip, User, Vehicle
+
+# Per-table version counters for conditional GETs. Session events record
+# which versioned tables a transaction wrote to, through the unit of work or
+# through insert()/update()/delete() statements, and bump their counters
+# right before the outermost commit. Write sites need no extra code, and the
+# row lock on a counter is held only for the commit itself.
+
+VERSIONED_MODELS = (Vehicle, User, Trip, Inspection, ServiceNotification, ServiceHistory)
+VERSIONED_TABLES = frozenset(model.__table__.name for model in VERSIONED_MODELS)
+
+_CHANGED_KEY = "changed_tables"
+
+
+def _changed(session) -> set:
+    return session.info.setdefault(_CHANGED_KEY, set())
+
+
+def _versioned_table(obj) -> Optional[str]:
+    table = getattr(type(obj), "__table__", None)
+    return table.name if table is not None and table.name in VERSIONED_TABLES else None
+
+
+@event.listens_for(Session, "after_flush")
+def _record_flushed_tables(session, flush_context):
+    changed = _changed(session)
+    for obj in itertools.chain(session.new, session.deleted):
+        changed.add(_versioned_table(obj))
+    for obj in session.dirty:
+        if session.is_modified(obj, include_collections=False):
+            changed.add(_versioned_table(obj))
+    changed.discard(None)
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _record_statement_tables(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, "table", None)
+        if table is not None and table.name in VERSIONED_TABLES:
+            _changed(orm_execute_state.session).add(table.name)
+
+
+def bump_statement(tables):
+    # Sorted, so concurrent writers lock the counters in the same order
+    now = func.clock_timestamp()
+    statement = insert(TableVersion).values(
+        [{"table_name": name, "version": 1, "updated_at": now} for name in sorted(tables)])
+    return statement.on_conflict_do_update(
+        index_elements=[TableVersion.table_name],
+        set_={"version": TableVersion.version + 1, "updated_at": now})
+
+
+@event.listens_for(Session, "before_commit")
+def _bump_versions(session):
+    if session.in_nested_transaction():
+        return
+    # Commit flushes after this hook runs; flush now so its tables count
+    session.flush()
+    tables = session.info.pop(_CHANGED_KEY, None)
+    if tables:
+        session.execute(bump_statement(tables))
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_changes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(_CHANGED_KEY, None)
+
+
+class Validators(NamedTuple):
+    etag: str
+    last_modified: Optional[object]
+
+
+async def current_validators(db, tables) -> Validators:
+    """ETag and Last-Modified for data read from ``tables``: one primary key lookup."""
+    rows = (await db.execute(
+        select(TableVersion.table_name, TableVersion.version, TableVersion.updated_at)
+        .where(TableVersion.table_name.in_(tables)))).all()
+    versions = {row.table_name: row.version for row in rows}
+    etag = 'W/"' + "-".join(f"{name}.{versions.get(name, 0)}" for name in sorted(tables)) + '"'
+    return Validators(etag, max((row.updated_at for row in rows), default=None))
+
+
+def validator_headers(validators: Validators) -> dict:
+    # no-cache: browsers keep the body but revalidate on every poll
+    headers = {"ETag": validators.etag, "Cache-Control": "no-cache"}
+    if validators.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(validators.last_modified.astimezone(timezone.utc), usegmt=True)
+    return headers
+
+
+def _opaque(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+
+def not_modified(headers, validators: Validators) -> bool:
+    """Evaluate If-None-Match (weak comparison), else If-Modified-Since."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip() for tag in if_none_match.split(",")]
+        return "*" in tags or _opaque(validators.etag) in {_opaque(tag) for tag in tags}
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and validators.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        return validators.last_modified.replace(microsecond=0) <= since
+    return False
@@ -0,0 +1,2 @@
+# Benchmarks for the Vehicle Management System API.
+# Run them from the backend directory, e.g. `python -m benchmarks.concurrency --help`.
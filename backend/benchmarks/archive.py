@@ -0,0 +1,212 @@
+"""Historical trip queries from PostgreSQL against the Parquet archive, with and without pushdown.
+
+Against the database named by DATABASE_URL: the oldest --months months of
+trips, inspections and service history are archived into a temporary
+ARCHIVE_DIR (python -m app.archive run, minus the daily schedule), queried,
+and restored, so the database ends as it started; the trip, Inspection and
+ServiceHistory checksums are compared to make sure.
+
+Each query kind runs --queries times with the same random windows, first on
+the database before archiving and then on the archive, once through
+archive.scan (predicate and column pushdown: files skipped by the manifest,
+row groups by their statistics, only the named columns decoded) and once by
+reading every trip file whole and filtering afterwards. The kinds: one
+vehicle's trips over a quarter, the distances of one month, and one trip by
+id. Also reported: archive and restore times, and the bytes the months take
+in PostgreSQL (tables and indexes) and as Parquet.
+
+    python -m benchmarks.archive --months 6 --output results/archive.json
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from app import archive
+from app.database import engine
+from app.partitions import add_months, partitions
+
+from .loadgen import percentile
+
+TRIPS = archive.ARCHIVED_TABLES["trips"]
+
+CHECKSUMS = """
+    SELECT 'trip', count(*), sum(hashtext(t::text)::bigint) FROM trip t UNION ALL
+    SELECT 'Inspection', count(*), sum(hashtext(t::text)::bigint) FROM "Inspection" t UNION ALL
+    SELECT 'ServiceHistory', count(*), sum(hashtext(t::text)::bigint) FROM "ServiceHistory" t
+"""
+
+
+def checksums(connection) -> list:
+    return [tuple(row) for row in connection.execute(text(CHECKSUMS)).all()]
+
+
+def postgres_bytes(connection, before) -> int:
+    total = 0
+    for table in (archive.ARCHIVED_TABLES["trips"], archive.ARCHIVED_TABLES["inspections"]):
+        total += sum(connection.execute(text("SELECT pg_total_relation_size(quote_ident(:name)::regclass)"), {"name": partition.name})
+                     .scalar() for partition in partitions(connection, table.name)
+                     if partition.upper is not None and partition.upper <= before)
+    # Service history is one table: its share by row count
+    total += connection.execute(text(
+        'SELECT (pg_total_relation_size(\'"ServiceHistory"\') * count(*) FILTER (WHERE service_date < :before) '
+        '/ greatest(count(*), 1))::bigint FROM "ServiceHistory"'), {"before": before}).scalar()
+    return total
+
+
+def windows(connection, count: int, first, before, seed: int) -> list:
+    rng = random.Random(seed)
+    vehicles = connection.execute(text(
+        "SELECT vehicle_id FROM trip WHERE trip_date < :before GROUP BY vehicle_id ORDER BY count(*) DESC LIMIT 50"),
+        {"before": before}).scalars().all()
+    ids = connection.execute(text(
+        "SELECT trip_id FROM trip WHERE trip_date < :before ORDER BY random() LIMIT :count"),
+        {"before": before, "count": count}).scalars().all()
+    months = []
+    month = first
+    while month < before:
+        months.append(month)
+        month = add_months(month, 1)
+    # Windows inside the archived months, so every source answers the same
+    starts = [month for month in months if add_months(month, 3) <= before] or months[:1]
+    result = []
+    for index in range(count):
+        start = rng.choice(starts)
+        result.append({"vehicle_id": rng.choice(vehicles), "start": start, "quarter_end": add_months(start, 3),
+                       "month_end": add_months(start, 1), "trip_id": ids[index % len(ids)]})
+    return result
+
+
+def database_queries(connection, params: list) -> dict:
+    queries = {
+        "vehicle_quarter": ("SELECT * FROM trip WHERE vehicle_id = :vehicle_id AND trip_date >= :start "
+                            "AND trip_date < :quarter_end ORDER BY trip_date, trip_id"),
+        "month_distance": ("SELECT trip_date, trip_id, distance FROM trip WHERE trip_date >= :start "
+                           "AND trip_date < :month_end ORDER BY trip_date, trip_id"),
+        "by_id": "SELECT * FROM trip WHERE trip_id = :trip_id",
+    }
+    return {kind: timed(lambda values: connection.execute(text(sql), values).all(), params)
+            for kind, sql in queries.items()}
+
+
+def pushdown_queries(params: list) -> dict:
+    # scan takes inclusive bounds
+    def vehicle_quarter(values):
+        return archive.scan(TRIPS, TRIPS.columns, values["start"], values["quarter_end"] - timedelta(days=1),
+                            {"vehicle_id": values["vehicle_id"]})
+
+    def month_distance(values):
+        return archive.scan(TRIPS, ["distance"], values["start"], values["month_end"] - timedelta(days=1))
+
+    return {"vehicle_quarter": timed(vehicle_quarter, params), "month_distance": timed(month_distance, params),
+            "by_id": timed(lambda values: archive.find(TRIPS, values["trip_id"]), params)}
+
+
+def full_read_queries(params: list) -> dict:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.parquet as pq
+    paths = [os.path.join(archive.ARCHIVE_DIR, entry["path"]) for entry in archive.archived_files(TRIPS)]
+
+    def read_all():
+        return pa.concat_tables([pq.read_table(path) for path in paths])
+
+    def vehicle_quarter(values):
+        table = read_all()
+        mask = pc.and_(pc.equal(table["vehicle_id"], values["vehicle_id"]),
+                       pc.and_(pc.greater_equal(table["trip_date"], values["start"]),
+                               pc.less(table["trip_date"], values["quarter_end"])))
+        return table.filter(mask).to_pylist()
+
+    def month_distance(values):
+        table = read_all()
+        mask = pc.and_(pc.greater_equal(table["trip_date"], values["start"]),
+                       pc.less(table["trip_date"], values["month_end"]))
+        return table.filter(mask).select(["trip_date", "trip_id", "distance"]).to_pylist()
+
+    def by_id(values):
+        table = read_all()
+        return table.filter(pc.equal(table["trip_id"], values["trip_id"])).to_pylist()
+
+    return {"vehicle_quarter": timed(vehicle_quarter, params), "month_distance": timed(month_distance, params),
+            "by_id": timed(by_id, params)}
+
+
+def timed(query, params: list) -> dict:
+    latencies, rows = [], 0
+    for values in params:
+        started = time.perf_counter()
+        result = query(values)
+        latencies.append(time.perf_counter() - started)
+        rows += len(result) if isinstance(result, list) else int(result is not None)
+    return {"p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2), "rows": rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--months", type=int, default=6, help="oldest months of trips to archive")
+    parser.add_argument("--queries", type=int, default=30, help="windows per query kind")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        attached = [partition for partition in partitions(connection, "trip") if partition.lower is not None]
+        if not attached:
+            raise SystemExit("trip has no monthly partitions; run python -m app.migrations upgrade")
+        first = attached[0].lower
+        before = add_months(first, args.months)
+        original = checksums(connection)
+        params = windows(connection, args.queries, first, before, args.seed)
+        report = {"months": args.months, "before": before.isoformat(),
+                  "postgres_bytes": postgres_bytes(connection, before)}
+        report["database"] = database_queries(connection, params)
+
+    archive.ARCHIVE_DIR = tempfile.mkdtemp(prefix="vms-archive-")
+    try:
+        started = time.perf_counter()
+        report["archived"] = archive.run(engine, before)
+        report["archive_seconds"] = round(time.perf_counter() - started, 2)
+        files = archive.load_manifest()["files"]
+        report["parquet_bytes"] = sum(entry["bytes"] for entry in files)
+        print(f"archived {sum(entry['rows'] for entry in files)} rows before {before} in "
+              f"{report['archive_seconds']}s: PostgreSQL {report['postgres_bytes'] / 2 ** 20:.1f} MiB, "
+              f"Parquet {report['parquet_bytes'] / 2 ** 20:.1f} MiB")
+
+        report["pushdown"] = pushdown_queries(params)
+        report["full_read"] = full_read_queries(params)
+        for kind in report["database"]:
+            print(f"{kind:<16}" + "".join(
+                f" {source}: p50={report[source][kind]['p50_ms']:>8}ms p95={report[source][kind]['p95_ms']:>8}ms"
+                for source in ("database", "pushdown", "full_read")))
+            rows = [report[source][kind]["rows"] for source in ("database", "pushdown", "full_read")]
+            if len(set(rows)) > 1:
+                print(f"  row counts differ: {rows}")
+    finally:
+        started = time.perf_counter()
+        for entry in sorted({(entry["table"], entry["month"]) for entry in archive.load_manifest()["files"]}):
+            table = next(table for table in archive.ARCHIVED_TABLES.values() if table.name == entry[0])
+            archive.restore(engine, table, date.fromisoformat(entry[1]))
+        report["restore_seconds"] = round(time.perf_counter() - started, 2)
+        shutil.rmtree(archive.ARCHIVE_DIR)
+
+    with engine.connect() as connection:
+        report["restored_intact"] = checksums(connection) == original
+    print(f"restored in {report['restore_seconds']}s, database unchanged: {report['restored_intact']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+    if not report["restored_intact"]:
+        raise SystemExit("restore did not reproduce the database")
+
+
+if __name__ == "__main__":
+    main()
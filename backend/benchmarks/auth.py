@@ -0,0 +1,178 @@
+"""Login throughput, event loop lag during login bursts, and per-request token cost.
+
+Three parts, the first two in-process:
+
+- scrypt cost: milliseconds per password check for a range of N, to pick
+  PASSWORD_SCRYPT_N for the hardware (aim for tens of milliseconds).
+- burst: --burst concurrent password checks at the configured cost, run
+  inline on the event loop and through the bounded hashing pool. A ticker
+  task measures how late the loop wakes it, which is the delay every other
+  request would see during a shift-start login burst.
+- token: the same ASGI route with and without the get_current_user
+  dependency, i.e. what authenticating a request adds.
+
+With --url, logins/sec are also measured end to end against a running API
+using the users written by benchmarks.dataset (password BENCH_PASSWORD).
+
+    python -m benchmarks.auth --burst 64 --output results/auth.json
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import Depends, FastAPI
+
+from app import security
+
+from .instrumentation import best_of, drive
+
+
+def scrypt_cost(ns, repeat: int) -> dict:
+    results = {}
+    for n in ns:
+        salt = b"0123456789abcdef"
+        started = time.perf_counter()
+        for _ in range(repeat):
+            security._scrypt("correct horse battery staple", salt, n, security.PASSWORD_SCRYPT_R,
+                             security.PASSWORD_SCRYPT_P)
+        results[str(n)] = round((time.perf_counter() - started) / repeat * 1000, 2)
+    return results
+
+
+async def _burst(count: int, check) -> dict:
+    stored = security.hash_password_sync("bench-password")
+    lag, stop = [0.0], asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag[0] = max(lag[0], time.perf_counter() - before - 0.001)
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(check("bench-password", stored) for _ in range(count)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticking
+    assert all(results)
+    return {"logins": count, "logins_per_sec": round(count / elapsed, 1),
+            "max_loop_lag_ms": round(lag[0] * 1000, 1)}
+
+
+async def _inline(password, stored):
+    return security.verify_password_sync(password, stored)
+
+
+def burst(count: int) -> dict:
+    # Stay under the queue limit so the pool path measures hashing, not 503s
+    pooled_count = min(count, security.PASSWORD_HASH_QUEUE)
+    return {"inline": asyncio.run(_burst(count, _inline)),
+            "pool": asyncio.run(_burst(pooled_count, security.verify_password)),
+            "workers": security.PASSWORD_HASH_WORKERS}
+
+
+def make_app(authenticated: bool) -> FastAPI:
+    app = FastAPI()
+    dependencies = [Depends(security.get_current_user)] if authenticated else []
+
+    @app.get("/api/ping", dependencies=dependencies)
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def status_of(app, headers) -> int:
+    statuses = []
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            statuses.append(message["status"])
+
+    await app({"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+               "scheme": "http", "path": "/api/ping", "raw_path": b"/api/ping", "query_string": b"",
+               "root_path": "", "headers": [(b"host", b"bench"), *headers]}, receive, send)
+    return statuses[0]
+
+
+def token_overhead(requests: int, repeat: int) -> dict:
+    token = security.create_token(1, "bench.user1@example.com", "employee")
+    headers = ((b"authorization", f"Bearer {token}".encode()),)
+    plain, authenticated = make_app(False), make_app(True)
+    assert asyncio.run(status_of(authenticated, headers)) == 200
+    decode_started = time.perf_counter()
+    for _ in range(requests):
+        security.decode_token(token)
+    decode = time.perf_counter() - decode_started
+    base, with_auth = best_of(repeat, lambda: asyncio.run(drive(plain, requests, "/api/ping", headers)),
+                              lambda: asyncio.run(drive(authenticated, requests, "/api/ping", headers)))
+    return {
+        "requests": requests,
+        "decode_us": round(decode / requests * 1e6, 2),
+        "plain_us": round(base / requests * 1e6, 2),
+        "authenticated_us": round(with_auth / requests * 1e6, 2),
+        "overhead_us": round((with_auth - base) / requests * 1e6, 2),
+    }
+
+
+def end_to_end(url: str, clients: int, duration: float) -> dict:
+    from app.database import engine
+
+    from .dataset import BENCH_PASSWORD
+    from .loadgen import run_load, summarize
+    from .workload import load_fleet
+
+    with engine.connect() as connection:
+        users = load_fleet(connection, sample=0).users
+    turn = [0]
+
+    def next_request(_index):
+        turn[0] += 1
+        _user_id, email, role = users[turn[0] % len(users)]
+        return "POST", "/api/login/", {"email": email, "password": BENCH_PASSWORD, "role": role}, "login"
+
+    summary = summarize(asyncio.run(run_load(url, clients, duration, next_request)))
+    return {"clients": clients, "statuses": summary["statuses"], **summary["total"]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, nargs="+", default=[2 ** 12, 2 ** 13, 2 ** 14, 2 ** 15],
+                        help="scrypt N values to time")
+    parser.add_argument("--burst", type=int, default=32, help="concurrent logins in the burst test")
+    parser.add_argument("--requests", type=int, default=20_000, help="requests for the token test")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--url", help="also measure logins/sec against this running API")
+    parser.add_argument("--clients", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {"scrypt_ms": scrypt_cost(args.n, args.repeat)}
+    print("scrypt ms per check: " + ", ".join(f"N={n}: {ms}" for n, ms in report["scrypt_ms"].items()))
+    report["burst"] = burst(args.burst)
+    for name in ("inline", "pool"):
+        result = report["burst"][name]
+        print(f"burst {name:<6} logins={result['logins']} logins/s={result['logins_per_sec']} "
+              f"max loop lag={result['max_loop_lag_ms']}ms")
+    report["token"] = token_overhead(args.requests, args.repeat)
+    print(f"token  decode={report['token']['decode_us']}us per-request overhead={report['token']['overhead_us']}us")
+    if args.url:
+        report["end_to_end"] = end_to_end(args.url, args.clients, args.duration)
+        result = report["end_to_end"]
+        print(f"login  clients={args.clients} logins/s={result['rps']} p50={result['p50_ms']}ms "
+              f"p99={result['p99_ms']}ms statuses={result['statuses']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Requests/sec and tail latency at increasing client concurrency.
+
+Written to compare the asyncio request path against the previous
+threadpool-bound sync handlers: start the API from each revision in turn
+and run the same command against both, e.g.
+
+    python -m benchmarks.concurrency --url http://localhost:8000 \\
+        --label async --output results/async.json
+
+The default mix is read-heavy (single-row lookups and a paged list) so the
+numbers reflect request handling rather than write contention.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+
+from .loadgen import run_load, summarize
+
+DEFAULT_PATHS = [
+    "/api/get_vehicle/1",
+    "/api/get_user/1",
+    "/api/get_all_trips/?limit=50",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--path", action="append", dest="paths",
+                        help="GET path to include in the mix (repeatable)")
+    parser.add_argument("--clients", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--duration", type=float, default=20.0,
+                        help="seconds per concurrency level")
+    parser.add_argument("--label", default="current")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    paths = itertools.cycle(args.paths or DEFAULT_PATHS)
+
+    def next_request(_index):
+        path = next(paths)
+        return "GET", path, None, path
+
+    report = {"label": args.label, "url": args.url, "runs": []}
+    for clients in args.clients:
+        result = asyncio.run(run_load(args.url, clients, args.duration, next_request))
+        summary = summarize(result)
+        report["runs"].append(summary)
+        total = summary["total"]
+        print(f"{args.label:>10} clients={clients:<5} rps={total['rps']:<9} "
+              f"p50={total['p50_ms']}ms p99={total['p99_ms']}ms errors={total['errors']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
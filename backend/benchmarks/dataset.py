@@ -0,0 +1,251 @@
+"""Synthetic fleet for benchmarks: vehicles, users, trips, inspections and service history.
+
+Writes into the database named by DATABASE_URL, which should be a scratch
+database. Distributions are skewed the way a real fleet's are: the busiest
+tenth of vehicles and drivers log close to half the trips, distances and mileages are
+log-normal, weekend trips are rare, recent trips are still pending, and
+each vehicle has one service per 15 000 km driven. Rows are tagged (VINs
+starting with BV, bench.* emails) so --replace can remove an earlier run.
+The same --seed produces the same data.
+
+    python -m benchmarks.dataset --vehicles 2000 --users 5000 --trips 1000000 --replace
+
+Every user's password is BENCH_PASSWORD. The change log triggers are
+disabled while loading, so clients of /api/changes should reload fully
+after seeding; the trip rollups and table versions are brought up to date.
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+from sqlalchemy import text
+
+from app import rollups
+from app.changes import CHANGE_FEEDS
+from app.database import engine
+from app.partitions import PARTITIONED_TABLES, add_months, ensure_partitions, month_start
+from app.security import hash_password_sync
+from app.versions import VERSIONED_TABLES, bump_statement
+
+BENCH_PASSWORD = "bench-password"
+
+# (make, model, weight): light commercial vehicles dominate the fleet
+VEHICLE_MODELS = [
+    ("Toyota", "Hilux", 30), ("Toyota", "Corolla", 10), ("Ford", "Ranger", 15),
+    ("Nissan", "Navara", 8), ("Volkswagen", "Amarok", 6), ("Volkswagen", "Polo", 8),
+    ("Isuzu", "D-Max", 10), ("Mercedes-Benz", "Sprinter", 5), ("Hyundai", "H100", 4),
+    ("Mazda", "BT-50", 4),
+]
+PLACES = ["Cape Town", "Carnarvon", "Sutherland", "Pretoria", "Johannesburg", "Stellenbosch",
+          "Upington", "Durban", "Klerefontein", "Beaufort West"]
+PURPOSES = ["Site visit", "Antenna maintenance", "Supplies", "Airport transfer", "Conference",
+            "Staff transport", "Equipment delivery"]
+
+
+def sql_array(values) -> str:
+    return "ARRAY[" + ", ".join("'" + value.replace("'", "''") + "'" for value in values) + "]"
+
+
+def _weighted_models() -> list:
+    return [f"{make}|{model}" for make, model, weight in VEHICLE_MODELS for _ in range(weight)]
+
+
+# Standard normal sample from two uniforms (Box-Muller); 1 - random() is never 0
+NORMAL = "(sqrt(-2 * ln(1 - random())) * cos(2 * pi() * random()))"
+# Index into a table of n rows, biased towards the front: a few rows get most of the picks
+SKEWED = "(1 + floor({n} * power(random(), {power})))::int"
+
+
+def remove_previous(connection):
+    connection.execute(text("""
+        CREATE TEMP TABLE bench_old_vehicles ON COMMIT DROP AS
+            SELECT id FROM vehicle WHERE vin LIKE 'BV%';
+        CREATE TEMP TABLE bench_old_users ON COMMIT DROP AS
+            SELECT user_id FROM users WHERE email LIKE 'bench.%@example.com';
+        DELETE FROM trip WHERE vehicle_id IN (SELECT id FROM bench_old_vehicles)
+                            OR user_id IN (SELECT user_id FROM bench_old_users);
+        DELETE FROM "Inspection" WHERE vehicle_id IN (SELECT id FROM bench_old_vehicles)
+                                    OR user_id IN (SELECT user_id FROM bench_old_users);
+        DELETE FROM "ServiceHistory" WHERE vehicle_vin IN (SELECT id FROM bench_old_vehicles);
+        DELETE FROM "ServiceNotification" WHERE vehicle_id IN (SELECT id FROM bench_old_vehicles);
+        DELETE FROM users WHERE user_id IN (SELECT user_id FROM bench_old_users);
+        DELETE FROM vehicle WHERE id IN (SELECT id FROM bench_old_vehicles);
+    """))
+
+
+def seed_vehicles(connection, count: int):
+    models = _weighted_models()
+    connection.execute(text(f"""
+        INSERT INTO vehicle (vin, make, model, year, licence_plate, fuel_type, mileage,
+                             last_service_date, last_service_km)
+        SELECT 'BV' || lpad(g::text, 15, '0'), split_part(pick, '|', 1), split_part(pick, '|', 2),
+               2008 + floor(random() * 17)::int, 'BM ' || lpad(g::text, 6, '0'),
+               CASE WHEN random() < 0.8 THEN 'Diesel' ELSE 'Petrol' END,
+               mileage, current_date - floor(random() * 420)::int,
+               greatest(0, mileage - floor(random() * 18000)::int)
+        FROM (SELECT g, ({sql_array(models)})[1 + floor(random() * {len(models)})::int] AS pick,
+                     least(450000, exp(11 + 0.6 * {NORMAL}))::int AS mileage
+              FROM generate_series(1, :count) AS g) AS s"""), {"count": count})
+    connection.execute(text("""
+        CREATE TEMP TABLE bench_vehicles ON COMMIT DROP AS
+            SELECT row_number() OVER (ORDER BY id) AS n, id FROM vehicle WHERE vin LIKE 'BV%';
+        CREATE UNIQUE INDEX ON bench_vehicles (n)"""))
+
+
+def seed_users(connection, count: int, vehicles: int):
+    connection.execute(text(f"""
+        INSERT INTO users (name, email, hashed_password, role, vehicle_id)
+        SELECT 'Bench User ' || g, 'bench.user' || g || '@example.com', :password,
+               CASE WHEN g % 20 = 0 THEN 'admin' ELSE 'employee' END::role,
+               CASE WHEN random() < 0.7 THEN v.id END
+        FROM generate_series(1, :count) AS g
+        JOIN bench_vehicles v ON v.n = 1 + (g * 7919) % :vehicles"""),
+        # One hash for everyone: same login cost as production without hashing N times
+        {"count": count, "vehicles": vehicles, "password": hash_password_sync(BENCH_PASSWORD)})
+    connection.execute(text("""
+        CREATE TEMP TABLE bench_users ON COMMIT DROP AS
+            SELECT row_number() OVER (ORDER BY user_id) AS n, user_id, name
+            FROM users WHERE email LIKE 'bench.%@example.com';
+        CREATE UNIQUE INDEX ON bench_users (n)"""))
+
+
+def seed_trips(connection, count: int, vehicles: int, users: int, days: int):
+    connection.execute(text(f"""
+        INSERT INTO trip (vehicle_id, user_id, start_location, destination, purpose,
+                          trip_date, distance, fuel_consumed, trip_status)
+        SELECT v.id, u.user_id, t.start_location, t.destination, t.purpose, t.trip_date, t.distance,
+               CASE WHEN t.r_fuel < 0.05 THEN NULL
+                    ELSE round((t.distance * (0.07 + 0.05 * t.r_fuel))::numeric, 2) END,
+               (CASE WHEN t.r_status < 0.04 THEN 'cancelled'
+                     WHEN t.trip_date > current_date - 3 OR t.r_status < 0.07 THEN 'pending'
+                     ELSE 'completed' END)::status
+        FROM (SELECT s.*,
+                     -- weekend trips are rare: most move to a weekday of the same week
+                     s.day - CASE WHEN extract(isodow FROM s.day) > 5 AND s.r_weekend < 0.9
+                                  THEN extract(isodow FROM s.day)::int - 5 + floor(s.r_weekend / 0.9 * 5)::int
+                                  ELSE 0 END AS trip_date
+              FROM (SELECT {SKEWED.format(n=':vehicles', power=3)} AS vn,
+                           {SKEWED.format(n=':users', power=3)} AS un,
+                           ({sql_array(PLACES)})[{SKEWED.format(n=len(PLACES), power=2)}] AS start_location,
+                           ({sql_array(PLACES)})[{SKEWED.format(n=len(PLACES), power=1.5)}] AS destination,
+                           ({sql_array(PURPOSES)})[1 + floor(random() * {len(PURPOSES)})::int] AS purpose,
+                           current_date - floor(random() * :days)::int AS day,
+                           round(least(1500, exp(3.5 + 0.9 * {NORMAL}))::numeric, 1) AS distance,
+                           random() AS r_fuel, random() AS r_status, random() AS r_weekend
+                    FROM generate_series(1, :count)) AS s) AS t
+        JOIN bench_vehicles v ON v.n = t.vn
+        JOIN bench_users u ON u.n = t.un"""),
+        {"count": count, "vehicles": vehicles, "users": users, "days": days})
+
+
+def seed_inspections(connection, count: int, vehicles: int, users: int, days: int):
+    connection.execute(text(f"""
+        INSERT INTO "Inspection" (vehicle_id, user_id, type, date, signed_by, status)
+        SELECT v.id, u.user_id,
+               (CASE WHEN s.r_type < 0.55 THEN 'pre_trip' ELSE 'post_trip' END)::inspectiontype,
+               s.date, u.name,
+               (CASE WHEN s.r_status < 0.02 THEN 'cancelled'
+                     WHEN s.r_status < 0.10 THEN 'pending' ELSE 'completed' END)::status
+        FROM (SELECT {SKEWED.format(n=':vehicles', power=2)} AS vn,
+                     {SKEWED.format(n=':users', power=2)} AS un,
+                     current_date - floor(random() * :days)::int AS date,
+                     random() AS r_type, random() AS r_status
+              FROM generate_series(1, :count)) AS s
+        JOIN bench_vehicles v ON v.n = s.vn
+        JOIN bench_users u ON u.n = s.un"""),
+        {"count": count, "vehicles": vehicles, "users": users, "days": days})
+
+
+def seed_service_history(connection, interval_km: int = 15000):
+    connection.execute(text("""
+        INSERT INTO "ServiceHistory" (vehicle_vin, service_date, service_mileage)
+        SELECT v.id,
+               v.last_service_date - (services - k) * (90 + floor(random() * 90)::int),
+               least(v.last_service_km, k * :interval + floor(random() * 2000)::int)
+        FROM vehicle v
+        JOIN bench_vehicles b ON b.id = v.id
+        CROSS JOIN LATERAL (SELECT greatest(1, least(30, v.last_service_km / :interval)) AS services) n
+        CROSS JOIN LATERAL generate_series(1, n.services) AS k"""), {"interval": interval_km})
+
+
+def set_change_log_triggers(connection, enabled: bool):
+    action = "ENABLE" if enabled else "DISABLE"
+    for model, _pk, _schema in CHANGE_FEEDS.values():
+        table = connection.dialect.identifier_preparer.quote(model.__table__.name)
+        # Before PostgreSQL 15 this does not recurse into partitions, so name each one
+        partitions = connection.execute(text(
+            "SELECT relid::regclass::text FROM pg_partition_tree(:table) WHERE level > 0"),
+            {"table": table}).scalars().all()
+        for relation in [table, *partitions]:
+            for trigger in ("vms_change_log", "vms_change_log_update"):
+                connection.execute(text(f"ALTER TABLE {relation} {action} TRIGGER {trigger}"))
+
+
+def create_partitions(connection, days: int):
+    # Weekend trips move back up to a few days, hence the margin
+    first, current = month_start(date.today() - timedelta(days=days + 7)), month_start(date.today())
+    months = []
+    while first <= current:
+        months.append(first)
+        first = add_months(first, 1)
+    for table in PARTITIONED_TABLES:
+        ensure_partitions(connection, table, months=months)
+
+
+def counts(connection) -> dict:
+    return dict(connection.execute(text("""
+        SELECT 'vehicles', count(*) FROM vehicle WHERE vin LIKE 'BV%'
+        UNION ALL SELECT 'users', count(*) FROM users WHERE email LIKE 'bench.%@example.com'
+        UNION ALL SELECT 'trips', count(*) FROM trip t JOIN vehicle v ON v.id = t.vehicle_id
+                  WHERE v.vin LIKE 'BV%'
+        UNION ALL SELECT 'inspections', count(*) FROM "Inspection" i JOIN vehicle v ON v.id = i.vehicle_id
+                  WHERE v.vin LIKE 'BV%'
+        UNION ALL SELECT 'service_history', count(*) FROM "ServiceHistory" s
+                  JOIN vehicle v ON v.id = s.vehicle_vin WHERE v.vin LIKE 'BV%'""")).all())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vehicles", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--trips", type=int, default=200_000)
+    parser.add_argument("--inspections", type=int, default=100_000)
+    parser.add_argument("--days", type=int, default=730, help="history covered by trips and inspections")
+    parser.add_argument("--seed", type=float, default=0.42, help="setseed() value, between -1 and 1")
+    parser.add_argument("--replace", action="store_true", help="delete the rows of an earlier run first")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    with engine.begin() as connection:
+        if args.replace:
+            remove_previous(connection)
+        elif connection.scalar(text("SELECT count(*) FROM vehicle WHERE vin LIKE 'BV%'")):
+            parser.error("benchmark rows already exist; pass --replace to regenerate them")
+        connection.execute(text("SELECT setseed(:seed)"), {"seed": args.seed})
+        create_partitions(connection, args.days)
+        set_change_log_triggers(connection, False)
+        steps = (
+            ("vehicles", lambda: seed_vehicles(connection, args.vehicles)),
+            ("users", lambda: seed_users(connection, args.users, args.vehicles)),
+            ("trips", lambda: seed_trips(connection, args.trips, args.vehicles, args.users, args.days)),
+            ("inspections", lambda: seed_inspections(
+                connection, args.inspections, args.vehicles, args.users, args.days)),
+            ("service history", lambda: seed_service_history(connection)),
+            ("trip rollups", lambda: rollups.rebuild(connection)),
+        )
+        for name, step in steps:
+            step_started = time.perf_counter()
+            step()
+            print(f"{name:<16} {time.perf_counter() - step_started:8.1f}s")
+        set_change_log_triggers(connection, True)
+        connection.execute(bump_statement(VERSIONED_TABLES))
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT")
+        for table in ("vehicle", "users", "trip", '"Inspection"', '"ServiceHistory"', "trip_daily_rollup"):
+            connection.execute(text(f"ANALYZE {table}"))
+        print(counts(connection))
+    print(f"done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
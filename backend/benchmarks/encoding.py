@@ -0,0 +1,93 @@
+"""Payload size and encode/parse time of the list formats on a 100k-trip export.
+
+Builds the trips in memory, so no database is needed, and encodes them the
+way the list endpoints do: the default response_model path, format=columnar
+and format=arrow (when pyarrow is installed). Each body is then compressed
+with gzip and brotli at the levels the middleware uses.
+
+    python -m benchmarks.encoding --rows 100000 --output results/encoding.json
+"""
+import argparse
+import gzip
+import json
+import random
+import time
+from datetime import date, timedelta
+from typing import List
+
+from pydantic import TypeAdapter
+
+from app.compression import BROTLI_QUALITY, GZIP_LEVEL, brotli
+from app.formats import list_response
+from app.models import Trip
+from app.schemas import TripResponse
+
+PLACES = ["Cape Town", "Carnarvon", "Pretoria", "Johannesburg", "Durban", "Stellenbosch", "Upington"]
+PURPOSES = ["Site visit", "Antenna maintenance", "Supplies", "Airport transfer", None]
+STATUSES = ["completed", "completed", "completed", "pending", "cancelled"]
+
+
+def make_trips(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    return [Trip(trip_id=i, vehicle_id=rng.randint(1, 500), user_id=rng.randint(1, 2000),
+                 start_location=rng.choice(PLACES), destination=rng.choice(PLACES),
+                 purpose=rng.choice(PURPOSES), trip_date=start + timedelta(days=rng.randrange(730)),
+                 distance=round(rng.uniform(2, 900), 1), fuel_consumed=round(rng.uniform(0.2, 90), 2),
+                 trip_status=rng.choice(STATUSES))
+            for i in range(1, count + 1)]
+
+
+def timed(fn, repeat: int):
+    best, result = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return result, round(best * 1000, 1)
+
+
+def encoders(trips):
+    adapter = TypeAdapter(List[TripResponse])
+    yield "json", lambda: adapter.dump_json(adapter.validate_python(trips, from_attributes=True)), json.loads
+    yield "columnar", lambda: list_response(trips, TripResponse, "columnar").body, json.loads
+    try:
+        import pyarrow as pa
+    except ImportError:
+        return
+    yield "arrow", lambda: list_response(trips, TripResponse, "arrow").body, \
+        lambda body: pa.ipc.open_stream(body).read_all()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N timings")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    trips = make_trips(args.rows)
+    report = {"rows": args.rows, "gzip_level": GZIP_LEVEL, "brotli_quality": BROTLI_QUALITY, "formats": {}}
+    print(f"{'format':<10} {'bytes':>11} {'encode_ms':>10} {'parse_ms':>9} "
+          f"{'gzip':>10} {'gzip_ms':>8} {'br':>10} {'br_ms':>7}")
+    for name, encode, parse in encoders(trips):
+        body, encode_ms = timed(encode, args.repeat)
+        _, parse_ms = timed(lambda: parse(body), args.repeat)
+        gzipped, gzip_ms = timed(lambda: gzip.compress(body, GZIP_LEVEL), args.repeat)
+        result = {"bytes": len(body), "encode_ms": encode_ms, "parse_ms": parse_ms,
+                  "gzip_bytes": len(gzipped), "gzip_ms": gzip_ms}
+        if brotli is not None:
+            compressed, br_ms = timed(lambda: brotli.compress(body, quality=BROTLI_QUALITY), args.repeat)
+            result.update(br_bytes=len(compressed), br_ms=br_ms)
+        report["formats"][name] = result
+        print(f"{name:<10} {result['bytes']:>11} {encode_ms:>10} {parse_ms:>9} "
+              f"{result['gzip_bytes']:>10} {gzip_ms:>8} {result.get('br_bytes', '-'):>10} {result.get('br_ms', '-'):>7}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+"""Rows per second and API memory while streaming a large trip export.
+
+Loads --rows synthetic trips into a monthly partition of trip far in the
+future (--month, 2099-01 by default), so nothing else reads them, then
+starts an API from this checkout and downloads
+/api/export/trips for that month in each of --formats (csv, csv.gz, xlsx),
+reading the body as it arrives. Reported per format: rows per second, time
+to first byte, bytes sent and the API process's resident memory, sampled
+during the download, before it and at its peak (VmHWM), so a growing
+buffer shows up as peak minus baseline. --json also times get_all_trips
+over the same month for comparison; it holds every row in memory, so try
+it with a smaller --rows.
+
+The trips are loaded with triggers off (session_replication_role =
+replica, which needs a superuser such as the compose admin) against
+existing vehicles and users, and the partition is dropped at the end
+unless --keep; --reuse exports a partition a --keep run left.
+
+    python -m benchmarks.exports --rows 10000000 --output results/exports.json
+"""
+import argparse
+import json
+import threading
+import time
+import urllib.request
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.partitions import PARTITIONED_TABLES, add_months, ensure_partitions, partition_name
+
+from .run import serve
+
+TRIPS = PARTITIONED_TABLES[0]
+FORMATS = {"csv": "format=csv", "csv.gz": "format=csv&gzip=true", "xlsx": "format=xlsx"}
+
+
+def load(connection, month, rows: int):
+    name = partition_name(TRIPS.name, month)
+    ensure_partitions(connection, TRIPS, months=[month])
+    connection.execute(text(f"TRUNCATE {name}"))
+    print(f"loading {rows} trips into {name} ...")
+    started = time.perf_counter()
+    connection.execute(text("SET session_replication_role = replica"))
+    # Ids above the sequence's reach for a while; the partition is dropped afterwards
+    connection.execute(text(f"""
+        INSERT INTO {name} (trip_id, vehicle_id, user_id, start_location, destination, purpose, trip_date,
+                            distance, fuel_consumed, trip_status)
+        SELECT 2000000000 - g, v.ids[1 + g % cardinality(v.ids)], u.ids[1 + g % cardinality(u.ids)],
+               'Cape Town', 'Carnarvon', 'Site visit, "north" road', :month + (g % 28),
+               round((20 + random() * 400)::numeric, 1), round((2 + random() * 40)::numeric, 2),
+               (CASE WHEN g % 25 = 0 THEN 'cancelled' ELSE 'completed' END)::status
+        FROM generate_series(1, :rows) g,
+             (SELECT array_agg(id) AS ids FROM (SELECT id FROM vehicle LIMIT 500) s) v,
+             (SELECT array_agg(user_id) AS ids FROM (SELECT user_id FROM users LIMIT 500) s) u"""),
+        {"month": month, "rows": rows})
+    connection.execute(text("SET session_replication_role = origin"))
+    print(f"  {time.perf_counter() - started:.1f}s")
+
+
+def drop(connection, month):
+    name = partition_name(TRIPS.name, month)
+    connection.execute(text(f"ALTER TABLE {TRIPS.name} DETACH PARTITION {name}"))
+    connection.execute(text(f"DROP TABLE {name}"))
+
+
+def memory(pid: int) -> dict:
+    values = {}
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            key, _, value = line.partition(":")
+            if key in ("VmRSS", "VmHWM"):
+                values[key] = int(value.split()[0]) * 1024
+    return values
+
+
+class RssSampler(threading.Thread):
+    def __init__(self, pid: int, interval: float = 0.05):
+        super().__init__(daemon=True)
+        self.pid, self.interval, self.samples, self.stopped = pid, interval, [], threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.samples.append(memory(self.pid)["VmRSS"])
+            time.sleep(self.interval)
+
+    def stop(self) -> int:
+        self.stopped.set()
+        self.join()
+        return max(self.samples, default=0)
+
+
+def download(url: str, pid: int) -> dict:
+    baseline = memory(pid)["VmRSS"]
+    sampler = RssSampler(pid)
+    sampler.start()
+    started = time.perf_counter()
+    first_byte, size = None, 0
+    with urllib.request.urlopen(url, timeout=3600) as response:
+        status = response.status
+        while True:
+            chunk = response.read(1 << 20)
+            if not chunk:
+                break
+            first_byte = first_byte or time.perf_counter() - started
+            size += len(chunk)
+    elapsed = time.perf_counter() - started
+    return {"status": status, "seconds": round(elapsed, 2), "first_byte_ms": round((first_byte or 0) * 1000, 1),
+            "bytes": size, "rss_before_mib": round(baseline / 2 ** 20, 1),
+            "rss_peak_mib": round(sampler.stop() / 2 ** 20, 1),
+            "rss_hwm_mib": round(memory(pid)["VmHWM"] / 2 ** 20, 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--month", default="2099-01", help="month (YYYY-MM) to load the trips into")
+    parser.add_argument("--formats", default=",".join(FORMATS), help=f"comma separated subset of {', '.join(FORMATS)}")
+    parser.add_argument("--json", action="store_true", help="also time get_all_trips over the month")
+    parser.add_argument("--port", type=int, default=8012)
+    parser.add_argument("--reuse", action="store_true", help="export the trips a --keep run left")
+    parser.add_argument("--keep", action="store_true", help="leave the loaded partition")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    month = datetime.strptime(args.month, "%Y-%m").date()
+    formats = [name.strip() for name in args.formats.split(",")]
+    unknown = set(formats) - set(FORMATS)
+    if unknown:
+        raise SystemExit(f"Unknown formats: {', '.join(sorted(unknown))}")
+    if not args.reuse:
+        with engine.begin() as connection:
+            load(connection, month, args.rows)
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT")
+        connection.execute(text(f"VACUUM ANALYZE {partition_name(TRIPS.name, month)}"))
+        rows = connection.execute(text(f"SELECT count(*) FROM {partition_name(TRIPS.name, month)}")).scalar()
+    report = {"rows": rows, "month": args.month, "formats": {}}
+
+    query = f"start_date={month}&end_date={add_months(month, 1) - timedelta(days=1)}"
+    process = serve(args.port, 1)
+    try:
+        base = f"http://127.0.0.1:{args.port}"
+        runs = [(name, f"{base}/api/export/trips?{query}&{FORMATS[name]}") for name in formats]
+        if args.json:
+            runs.append(("get_all_trips", f"{base}/api/get_all_trips/?{query}"))
+        for name, url in runs:
+            result = download(url, process.pid)
+            result["rows_per_sec"] = round(rows / result["seconds"]) if result["seconds"] else 0
+            report["formats"][name] = result
+            print(f"{name:<14} {result['rows_per_sec']:>9} rows/s {result['seconds']:>8}s "
+                  f"first byte {result['first_byte_ms']:>7}ms {result['bytes'] / 2 ** 20:>9.1f} MiB  "
+                  f"RSS {result['rss_before_mib']} -> peak {result['rss_peak_mib']} MiB "
+                  f"(high water {result['rss_hwm_mib']} MiB)")
+    finally:
+        process.terminate()
+        process.wait()
+        if not args.keep:
+            with engine.begin() as connection:
+                drop(connection, month)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
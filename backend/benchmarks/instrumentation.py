@@ -0,0 +1,119 @@
+"""Per-request and per-statement cost of the request metrics instrumentation.
+
+Runs in-process, so no database or server is needed: a small FastAPI app is
+called directly through ASGI with and without RequestMetricsMiddleware,
+and an in-memory SQLite engine executes trivial statements with and without
+the statement counter (querycount), which counts and times every statement
+and hands it to the slow query log. Both halves report the extra microseconds the
+instrumentation adds, which is what matters next to real request times of
+milliseconds. For an end-to-end number, run benchmarks.run twice with
+REQUEST_METRICS=false and true.
+
+    python -m benchmarks.instrumentation --requests 20000 --output results/instrumentation.json
+"""
+import argparse
+import asyncio
+import json
+import time
+
+from fastapi import FastAPI
+from sqlalchemy import create_engine, text
+
+from app.instrumentation import RequestMetricsMiddleware, log_slow_query
+from app.querycount import install_statement_counter, observe_statements
+
+
+def make_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/api/get_vehicle/{vehicle_id}")
+    async def get_vehicle(vehicle_id: int):
+        return {"id": vehicle_id, "make": "Toyota", "model": "Hilux", "mileage": 120345}
+
+    return app
+
+
+def best_of(repeat: int, baseline, candidate):
+    # Alternate the two so drift (thermal, GC) hits both equally
+    times = [(baseline(), candidate()) for _ in range(repeat)]
+    return min(t[0] for t in times), min(t[1] for t in times)
+
+
+async def drive(app, requests: int, path: str = "/api/get_vehicle/7", headers: tuple = ()) -> float:
+    """Call ``app`` directly through ASGI ``requests`` times; returns the seconds taken."""
+    scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET",
+             "scheme": "http", "path": path, "raw_path": path.encode(),
+             "query_string": b"", "root_path": "", "headers": [(b"host", b"bench"), *headers],
+             "client": ("127.0.0.1", 1), "server": ("bench", 80)}
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return time.perf_counter() - started
+
+
+def request_overhead(requests: int, repeat: int) -> dict:
+    plain, instrumented = make_app(), RequestMetricsMiddleware(make_app(), enabled=True)
+    asyncio.run(drive(plain, 500))
+    asyncio.run(drive(instrumented, 500))
+    base, with_metrics = best_of(repeat, lambda: asyncio.run(drive(plain, requests)),
+                                 lambda: asyncio.run(drive(instrumented, requests)))
+    return {
+        "requests": requests,
+        "plain_us": round(base / requests * 1e6, 2),
+        "instrumented_us": round(with_metrics / requests * 1e6, 2),
+        "overhead_us": round((with_metrics - base) / requests * 1e6, 2),
+    }
+
+
+def execute(engine, statements: int) -> float:
+    with engine.connect() as connection:
+        statement = text("SELECT :n")
+        started = time.perf_counter()
+        for n in range(statements):
+            connection.execute(statement, {"n": n})
+        return time.perf_counter() - started
+
+
+def statement_overhead(statements: int, repeat: int) -> dict:
+    plain, timed = create_engine("sqlite://"), create_engine("sqlite://")
+    install_statement_counter(timed)
+    observe_statements(log_slow_query)
+    execute(plain, 500)
+    execute(timed, 500)
+    base, with_timing = best_of(repeat, lambda: execute(plain, statements), lambda: execute(timed, statements))
+    return {
+        "statements": statements,
+        "plain_us": round(base / statements * 1e6, 2),
+        "instrumented_us": round(with_timing / statements * 1e6, 2),
+        "overhead_us": round((with_timing - base) / statements * 1e6, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--statements", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=5, help="best of N runs")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {"request": request_overhead(args.requests, args.repeat),
+              "statement": statement_overhead(args.statements, args.repeat)}
+    for name, result in report.items():
+        print(f"{name:<10} plain={result['plain_us']}us instrumented={result['instrumented_us']}us "
+              f"overhead={result['overhead_us']}us")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,158 @@
+"""Minimal asyncio HTTP/1.1 load generator.
+
+Uses only the standard library so it can run inside the backend image
+without extra packages. Each simulated client keeps one keep-alive
+connection open and issues requests back to back for the given duration.
+"""
+import asyncio
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# (method, path, json body or None, label used to group the latencies)
+Request = Tuple[str, str, Optional[dict], str]
+
+
+@dataclass
+class LoadResult:
+    clients: int
+    elapsed: float = 0.0
+    latencies: Dict[str, List[float]] = field(default_factory=dict)
+    errors: Dict[str, int] = field(default_factory=dict)
+    statuses: Dict[int, int] = field(default_factory=dict)
+
+
+class Connection:
+    def __init__(self, host: str, port: int):
+        self.host = host
+        self.port = port
+        self.reader = None
+        self.writer = None
+
+    async def open(self):
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self):
+        if self.writer:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def request(self, method: str, path: str, body: Optional[dict] = None,
+                      headers: Optional[dict] = None) -> Tuple[int, dict, bytes]:
+        if self.writer is None:
+            await self.open()
+        payload = json.dumps(body).encode() if body is not None else b""
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                 f"Content-Length: {len(payload)}"]
+        if body is not None:
+            lines.append("Content-Type: application/json")
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + payload)
+        await self.writer.drain()
+        return await self._read_response()
+
+    async def _read_response(self) -> Tuple[int, dict, bytes]:
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("server closed the connection")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        if response_headers.get("transfer-encoding") == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readline()
+            body = b"".join(chunks)
+        else:
+            body = await self.reader.readexactly(int(response_headers.get("content-length", 0)))
+        if response_headers.get("connection") == "close":
+            await self.close()
+            self.writer = None
+        return status, response_headers, body
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(result: LoadResult) -> dict:
+    endpoints = {}
+    all_latencies = []
+    for label, latencies in sorted(result.latencies.items()):
+        all_latencies.extend(latencies)
+        endpoints[label] = _summarize_latencies(latencies, result.elapsed)
+        endpoints[label]["errors"] = result.errors.get(label, 0)
+    total = _summarize_latencies(all_latencies, result.elapsed)
+    total["errors"] = sum(result.errors.values())
+    return {"clients": result.clients, "elapsed_s": round(result.elapsed, 3),
+            "statuses": {str(k): v for k, v in sorted(result.statuses.items())},
+            "total": total, "endpoints": endpoints}
+
+
+def _summarize_latencies(latencies: List[float], elapsed: float) -> dict:
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def run_load(base_url: str, clients: int, duration: float,
+                   next_request: Callable[[int], Request],
+                   headers: Optional[dict] = None) -> LoadResult:
+    """Drive ``clients`` concurrent connections for ``duration`` seconds.
+
+    ``next_request`` is called with the client index and returns the next
+    request that client should send.
+    """
+    url = urlsplit(base_url)
+    host, port = url.hostname, url.port or 80
+    result = LoadResult(clients=clients)
+    deadline = time.perf_counter() + duration
+
+    async def client(index: int):
+        connection = Connection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                method, path, body, label = next_request(index)
+                started = time.perf_counter()
+                try:
+                    status, _, _ = await connection.request(method, path, body, headers)
+                except (ConnectionError, asyncio.IncompleteReadError, OSError):
+                    result.errors[label] = result.errors.get(label, 0) + 1
+                    await connection.close()
+                    connection = Connection(host, port)
+                    continue
+                result.latencies.setdefault(label, []).append(time.perf_counter() - started)
+                result.statuses[status] = result.statuses.get(status, 0) + 1
+                if status >= 500:
+                    result.errors[label] = result.errors.get(label, 0) + 1
+        finally:
+            await connection.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(clients)))
+    result.elapsed = time.perf_counter() - started
+    return result
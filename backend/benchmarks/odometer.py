@@ -0,0 +1,265 @@
+"""Lost updates and lock waits when many drivers finish trips on one vehicle at once.
+
+Two parts, both against the database named by DATABASE_URL:
+
+- increments: --threads threads add 1 km to one vehicle's mileage
+  --increments times each, first as the read-modify-write that
+  update_vehicle amounts to (SELECT mileage, then UPDATE SET mileage =
+  :new) and then as the atomic UPDATE SET mileage = mileage + 1 that trip
+  completion now uses. Lost updates are the expected total minus the
+  mileage actually added.
+- api (with --url or --serve): --threads threads create pending trips on
+  one vehicle and complete them through update_trip, repeating some
+  completions and cancelling some completed trips, so idempotency and the
+  reversal are exercised under contention. Each thread drives as a
+  different user, so the vehicle row is what they share. The vehicle's final mileage
+  must equal its starting mileage plus the km of the trips left completed.
+  Meanwhile a sampler counts the backends waiting on locks; the peak, and
+  completion latency under contention against a single thread, show
+  whether writers queue behind each other's transactions.
+
+Exits with status 1 if the atomic path or the API loses an update.
+
+    python -m benchmarks.odometer --serve --threads 32 --output results/odometer.json
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+
+from sqlalchemy import text
+
+from app import rollups
+from app.database import engine
+from app.versions import bump_statement
+
+from .loadgen import percentile
+from .run import serve
+
+BENCH_PLATE = "BV-ODOMETER"
+
+
+def remove_vehicle(connection):
+    """Delete the benchmark vehicle with whatever a run that died before its cleanup left on it."""
+    days = connection.execute(text(
+        "DELETE FROM trip WHERE vehicle_id IN (SELECT id FROM vehicle WHERE licence_plate = :plate) "
+        "RETURNING trip_date"), {"plate": BENCH_PLATE}).scalars().all()
+    connection.execute(text('DELETE FROM "ServiceNotification" WHERE vehicle_id IN '
+                            "(SELECT id FROM vehicle WHERE licence_plate = :plate)"), {"plate": BENCH_PLATE})
+    connection.execute(text("DELETE FROM vehicle WHERE licence_plate = :plate"), {"plate": BENCH_PLATE})
+    if days:
+        # The trips went around the app, so recompute their days' rollups
+        rollups.rebuild(connection, min(days))
+    connection.execute(bump_statement(["trip", "vehicle"]))
+
+
+def create_vehicle(connection) -> int:
+    remove_vehicle(connection)
+    return connection.execute(text(
+        "INSERT INTO vehicle (vin, make, model, year, licence_plate, mileage, last_service_date, last_service_km) "
+        "VALUES (:plate, 'Bench', 'Odometer', 2024, :plate, 0, :today, 0) RETURNING id"),
+        {"plate": BENCH_PLATE, "today": date.today()}).scalar()
+
+
+def mileage(vehicle_id: int) -> int:
+    with engine.connect() as connection:
+        return connection.execute(text("SELECT mileage FROM vehicle WHERE id = :id"), {"id": vehicle_id}).scalar()
+
+
+class LockSampler(threading.Thread):
+    """Backends waiting on a lock, sampled every ``interval`` seconds, and the statements they wait in."""
+
+    def __init__(self, interval: float = 0.01):
+        super().__init__(daemon=True)
+        self.interval, self.samples, self.statements, self.stopped = interval, [], {}, threading.Event()
+
+    def run(self):
+        with engine.connect() as connection:
+            query = text("SELECT left(regexp_replace(query, '\\s+', ' ', 'g'), 60) FROM pg_stat_activity "
+                         "WHERE wait_event_type = 'Lock' AND datname = current_database()")
+            while not self.stopped.is_set():
+                waiting = connection.execute(query).scalars().all()
+                connection.commit()
+                self.samples.append(len(waiting))
+                for statement in waiting:
+                    self.statements[statement] = self.statements.get(statement, 0) + 1
+                time.sleep(self.interval)
+
+    def stop(self) -> dict:
+        self.stopped.set()
+        self.join()
+        return {"max_lock_waiters": max(self.samples, default=0),
+                "mean_lock_waiters": round(sum(self.samples) / len(self.samples), 2) if self.samples else 0,
+                "waiting_in": dict(sorted(self.statements.items(), key=lambda item: -item[1])[:5])}
+
+
+def _increment(vehicle_id: int, count: int, atomic: bool):
+    with engine.connect() as connection:
+        for _ in range(count):
+            if atomic:
+                connection.execute(text("UPDATE vehicle SET mileage = mileage + 1 WHERE id = :id"),
+                                   {"id": vehicle_id})
+            else:
+                current = connection.execute(text("SELECT mileage FROM vehicle WHERE id = :id"),
+                                             {"id": vehicle_id}).scalar()
+                connection.execute(text("UPDATE vehicle SET mileage = :mileage WHERE id = :id"),
+                                   {"mileage": current + 1, "id": vehicle_id})
+            connection.commit()
+
+
+def increments(vehicle_id: int, threads: int, count: int) -> dict:
+    results = {}
+    for name, atomic in (("read_modify_write", False), ("atomic", True)):
+        before = mileage(vehicle_id)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(threads) as pool:
+            for future in [pool.submit(_increment, vehicle_id, count, atomic) for _ in range(threads)]:
+                future.result()
+        elapsed = time.perf_counter() - started
+        added = mileage(vehicle_id) - before
+        results[name] = {"expected": threads * count, "added": added, "lost_updates": threads * count - added,
+                         "updates_per_sec": round(threads * count / elapsed)}
+    return results
+
+
+def _call(url: str, method: str, path: str, body=None):
+    request = urllib.request.Request(url + path, method=method, data=json.dumps(body).encode() if body else None,
+                                     headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(request, timeout=60) as response:
+            status, payload = response.status, json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        status, payload = e.code, None
+    return status, payload, time.perf_counter() - started
+
+
+def _driver(url: str, vehicle_id: int, user_id: int, trips: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    completed_km, latencies, statuses, trip_ids = 0, [], {}, []
+    for _ in range(trips):
+        body = {"vehicle_id": vehicle_id, "user_id": user_id, "start_location": "Depot", "destination": "Site",
+                "trip_date": date.today().isoformat(), "distance": round(rng.uniform(1, 80), 1),
+                "fuel_consumed": 2.0, "trip_status": "pending"}
+        status, trip, _ = _call(url, "POST", "/api/add_trip/", body)
+        statuses[status] = statuses.get(status, 0) + 1
+        if status != 200:
+            continue
+        trip_ids.append(trip["trip_id"])
+        done = {**body, "trip_status": "completed"}
+        status, _, elapsed = _call(url, "PUT", f"/api/update_trip/{trip['trip_id']}", done)
+        statuses[status] = statuses.get(status, 0) + 1
+        latencies.append(elapsed)
+        if status != 200:
+            continue
+        completed = True
+        if rng.random() < 0.2:
+            # A retried completion must not count twice
+            status, _, _ = _call(url, "PUT", f"/api/update_trip/{trip['trip_id']}", done)
+            statuses[status] = statuses.get(status, 0) + 1
+        if rng.random() < 0.1:
+            status, _, _ = _call(url, "PUT", f"/api/update_trip/{trip['trip_id']}",
+                                 {**body, "trip_status": "cancelled"})
+            statuses[status] = statuses.get(status, 0) + 1
+            completed = status != 200
+        if completed:
+            completed_km += round(body["distance"])
+    return {"completed_km": completed_km, "latencies": latencies, "statuses": statuses, "trip_ids": trip_ids}
+
+
+def api(url: str, vehicle_id: int, user_ids, threads: int, trips: int) -> dict:
+    before = mileage(vehicle_id)
+    sampler = LockSampler()
+    sampler.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(threads) as pool:
+        results = [future.result() for future in
+                   [pool.submit(_driver, url, vehicle_id, user_ids[seed % len(user_ids)], trips, seed)
+                    for seed in range(threads)]]
+    elapsed = time.perf_counter() - started
+    locks = sampler.stop()
+    expected = sum(result["completed_km"] for result in results)
+    added = mileage(vehicle_id) - before
+    latencies = [latency for result in results for latency in result["latencies"]]
+    statuses = {}
+    for result in results:
+        for status, count in result["statuses"].items():
+            statuses[str(status)] = statuses.get(str(status), 0) + count
+    return {
+        "threads": threads, "completions": len(latencies), "statuses": statuses,
+        "completions_per_sec": round(len(latencies) / elapsed, 1),
+        "complete_p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "complete_p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "expected_km": expected, "added_km": added, "lost_km": expected - added, **locks,
+        "trip_ids": [trip_id for result in results for trip_id in result["trip_ids"]],
+    }
+
+
+def cleanup(url: str, vehicle_id: int, trip_ids):
+    for trip_id in trip_ids:
+        _call(url, "DELETE", f"/api/delete_trip/{trip_id}")
+    _call(url, "DELETE", f"/api/delete_vehicle/{vehicle_id}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=32)
+    parser.add_argument("--increments", type=int, default=200, help="increments per thread in the first part")
+    parser.add_argument("--trips", type=int, default=20, help="trips per thread in the API part")
+    parser.add_argument("--url", help="run the API part against this running API")
+    parser.add_argument("--serve", action="store_true", help="start an API from this checkout for the API part")
+    parser.add_argument("--port", type=int, default=8011)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    with engine.begin() as connection:
+        vehicle_id = create_vehicle(connection)
+        # One driver per thread, as when a shift hands a pool vehicle around
+        user_ids = connection.execute(text("SELECT user_id FROM users ORDER BY user_id LIMIT :n"),
+                                      {"n": args.threads}).scalars().all()
+    report = {"vehicle_id": vehicle_id, "increments": increments(vehicle_id, args.threads, args.increments)}
+    for name, result in report["increments"].items():
+        print(f"{name:<18} expected={result['expected']} added={result['added']} "
+              f"lost={result['lost_updates']} updates/s={result['updates_per_sec']}")
+
+    failed = report["increments"]["atomic"]["lost_updates"] != 0
+    if args.url or args.serve:
+        process = serve(args.port, args.workers) if args.serve else None
+        url = args.url or f"http://127.0.0.1:{args.port}"
+        trip_ids = []
+        try:
+            report["api"] = {}
+            for name, threads, trips in (("single", 1, max(args.trips, 20)),
+                                         ("contended", args.threads, args.trips)):
+                result = api(url, vehicle_id, user_ids, threads, trips)
+                trip_ids += result.pop("trip_ids")
+                report["api"][name] = result
+                print(f"api {name:<10} threads={threads} completions/s={result['completions_per_sec']} "
+                      f"p50={result['complete_p50_ms']}ms p99={result['complete_p99_ms']}ms "
+                      f"lost_km={result['lost_km']} max lock waiters={result['max_lock_waiters']} "
+                      f"statuses={result['statuses']}")
+                failed = failed or result["lost_km"] != 0
+        finally:
+            cleanup(url, vehicle_id, trip_ids)
+            if process:
+                process.terminate()
+                process.wait()
+    else:
+        with engine.begin() as connection:
+            remove_vehicle(connection)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if failed:
+        raise SystemExit("lost updates detected")
+
+
+if __name__ == "__main__":
+    main()
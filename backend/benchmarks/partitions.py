@@ -0,0 +1,232 @@
+"""Date-bounded trip queries and retention on a monthly partitioned table against a plain one.
+
+Builds two copies of the same synthetic trips in the database named by
+DATABASE_URL: bench_trip_plain, a single table shaped like trip before
+migration 2, and bench_trip_parted, partitioned by month like trip is now.
+Both have the same indexes. Trips are generated roughly in date order, as
+they are recorded, over --months months.
+
+Each query kind runs --queries times on each table with the same random
+windows: totals for one month, the first page of a week ordered by date, one
+vehicle's trips over a quarter, and a count over the last seven days.
+Reported per kind: latency percentiles, planning time, buffers touched and
+partitions scanned (from EXPLAIN ANALYZE of one representative window).
+Then the oldest month is removed from each table, by DELETE from the plain
+one and by detaching and dropping the partition.
+
+The request this answers asked for 50M trips, which is the default; the
+two tables take about 15 GB and loading them takes a while, so try a smaller
+--rows first. --keep leaves the tables for another run with --reuse.
+
+    python -m benchmarks.partitions --rows 5000000 --output results/partitions.json
+"""
+import argparse
+import json
+import random
+import time
+from datetime import date
+
+from sqlalchemy import text
+
+from app.database import engine
+from app.partitions import add_months, month_start
+
+from .loadgen import percentile
+
+PLAIN, PARTED = "bench_trip_plain", "bench_trip_parted"
+
+COLUMNS = """
+    trip_id integer NOT NULL,
+    vehicle_id integer,
+    user_id integer,
+    start_location varchar,
+    destination varchar,
+    purpose varchar,
+    trip_date date NOT NULL,
+    distance double precision,
+    fuel_consumed double precision,
+    trip_status status
+"""
+
+# kind -> SQL with :table replaced by the table name
+QUERIES = {
+    "month_totals": "SELECT count(*), sum(distance), sum(fuel_consumed) FROM {table} "
+                    "WHERE trip_date >= :first AND trip_date < :next",
+    "week_page": "SELECT * FROM {table} WHERE trip_date >= :first AND trip_date < :first + 7 "
+                 "ORDER BY trip_date, trip_id LIMIT 100",
+    "vehicle_quarter": "SELECT * FROM {table} WHERE vehicle_id = :vehicle_id "
+                       "AND trip_date >= :first AND trip_date < :quarter ORDER BY trip_date",
+    "last_week_count": "SELECT count(*) FROM {table} WHERE trip_date > :today - 7",
+}
+
+
+def months_covered(today: date, months: int) -> list:
+    current = month_start(today)
+    return [add_months(current, offset) for offset in range(-months + 1, 1)]
+
+
+def load(connection, rows: int, months: int, vehicles: int, today: date):
+    first = months_covered(today, months)[0]
+    span = (today - first).days
+    print(f"loading {rows} trips from {first} to {today} ...")
+    started = time.perf_counter()
+    connection.execute(text(f"DROP TABLE IF EXISTS {PLAIN}, {PARTED}"))
+    connection.execute(text(f"CREATE TABLE {PLAIN} ({COLUMNS})"))
+    # Spread evenly over the period in id order, each a few days late at most
+    connection.execute(text(f"""
+        INSERT INTO {PLAIN}
+        SELECT g, 1 + floor({vehicles} * power(random(), 2))::int, 1 + floor(random() * 5000)::int,
+               'Cape Town', 'Carnarvon', 'Site visit',
+               least(:first + (g::bigint * {span} / {rows})::int + floor(random() * 4)::int, :today),
+               round((20 + random() * 400)::numeric, 1), round((2 + random() * 40)::numeric, 2),
+               (CASE WHEN random() < 0.04 THEN 'cancelled' ELSE 'completed' END)::status
+        FROM generate_series(1, {rows}) g"""), {"first": first, "today": today})
+    print(f"  plain table {time.perf_counter() - started:.1f}s")
+
+    started = time.perf_counter()
+    connection.execute(text(f"CREATE TABLE {PARTED} ({COLUMNS}) PARTITION BY RANGE (trip_date)"))
+    for month in months_covered(today, months):
+        connection.execute(text(
+            f"CREATE TABLE {PARTED}_p{month:%Y_%m} PARTITION OF {PARTED} "
+            f"FOR VALUES FROM ('{month}') TO ('{add_months(month, 1)}')"))
+    connection.execute(text(f"CREATE TABLE {PARTED}_default PARTITION OF {PARTED} DEFAULT"))
+    connection.execute(text(f"INSERT INTO {PARTED} SELECT * FROM {PLAIN}"))
+    print(f"  partitioned table {time.perf_counter() - started:.1f}s")
+
+    for table, key in ((PLAIN, "trip_id"), (PARTED, "trip_id, trip_date")):
+        started = time.perf_counter()
+        connection.execute(text(f"ALTER TABLE {table} ADD PRIMARY KEY ({key})"))
+        connection.execute(text(f"CREATE INDEX ON {table} (trip_date, trip_id)"))
+        connection.execute(text(f"CREATE INDEX ON {table} (vehicle_id)"))
+        print(f"  {table} indexes {time.perf_counter() - started:.1f}s")
+
+
+def vacuum(connection):
+    for table in (PLAIN, PARTED):
+        connection.execute(text(f"VACUUM ANALYZE {table}"))
+
+
+def table_bytes(connection, table: str) -> int:
+    # pg_partition_tree is empty for a table that is not partitioned
+    return connection.execute(text(
+        "SELECT pg_total_relation_size(:table) + coalesce((SELECT sum(pg_total_relation_size(relid)) "
+        "FROM pg_partition_tree(:table) WHERE level > 0), 0)"), {"table": table}).scalar()
+
+
+def windows(count: int, months: list, vehicles: int, today: date, seed: int) -> list:
+    rng = random.Random(seed)
+    result = []
+    for _ in range(count):
+        first = rng.choice(months[:-3] or months)
+        result.append({"first": first, "next": add_months(first, 1), "quarter": add_months(first, 3),
+                       "vehicle_id": 1 + int(vehicles * rng.random() ** 2), "today": today})
+    return result
+
+
+def _explain(connection, sql: str, params: dict) -> dict:
+    plan = connection.execute(text("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql), params).scalar()[0]
+    relations = set()
+
+    def walk(node):
+        if "Relation Name" in node:
+            relations.add(node["Relation Name"])
+        for child in node.get("Plans", ()):
+            walk(child)
+
+    walk(plan["Plan"])
+    # Buffer counts of a node include its children's
+    buffers = plan["Plan"].get("Shared Hit Blocks", 0) + plan["Plan"].get("Shared Read Blocks", 0)
+    return {"planning_ms": round(plan["Planning Time"], 2), "execution_ms": round(plan["Execution Time"], 2),
+            "buffers": buffers, "relations_scanned": len(relations)}
+
+
+def run_queries(connection, params: list) -> dict:
+    results = {}
+    for kind, template in QUERIES.items():
+        results[kind] = {}
+        for table in (PLAIN, PARTED):
+            sql = template.format(table=table)
+            latencies = []
+            for values in params:
+                started = time.perf_counter()
+                connection.execute(text(sql), values).all()
+                latencies.append(time.perf_counter() - started)
+            results[kind][table] = {
+                "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+                "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+                **_explain(connection, sql, params[len(params) // 2]),
+            }
+    return results
+
+
+def retention(connection, months: list) -> dict:
+    oldest = months[0]
+    name = f"{PARTED}_p{oldest:%Y_%m}"
+    result = {"month": oldest.isoformat()}
+    started = time.perf_counter()
+    deleted = connection.execute(text(f"DELETE FROM {PLAIN} WHERE trip_date < :next"),
+                                 {"next": add_months(oldest, 1)}).rowcount
+    result["delete_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    result["deleted_rows"] = deleted
+    started = time.perf_counter()
+    connection.execute(text(f"ALTER TABLE {PARTED} DETACH PARTITION {name}"))
+    result["detach_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    started = time.perf_counter()
+    connection.execute(text(f"DROP TABLE {name}"))
+    result["drop_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    # What the DELETE leaves for vacuum to clean up; the partition leaves nothing
+    started = time.perf_counter()
+    connection.execute(text(f"VACUUM {PLAIN}"))
+    result["vacuum_after_delete_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000_000)
+    parser.add_argument("--months", type=int, default=60, help="months of history")
+    parser.add_argument("--vehicles", type=int, default=2000)
+    parser.add_argument("--queries", type=int, default=30, help="windows per query kind")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--reuse", action="store_true", help="query the tables a --keep run left")
+    parser.add_argument("--keep", action="store_true", help="leave the tables (retention is then skipped)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    today = date.today()
+    months = months_covered(today, args.months)
+    with engine.connect() as connection:
+        connection.execution_options(isolation_level="AUTOCOMMIT")
+        if not args.reuse:
+            load(connection, args.rows, args.months, args.vehicles, today)
+            vacuum(connection)
+        rows = connection.execute(text(f"SELECT count(*) FROM {PLAIN}")).scalar()
+        report = {"rows": rows, "months": args.months,
+                  "bytes": {table: table_bytes(connection, table) for table in (PLAIN, PARTED)}}
+        print(f"{rows} trips; plain {report['bytes'][PLAIN] / 2 ** 30:.2f} GiB, "
+              f"partitioned {report['bytes'][PARTED] / 2 ** 30:.2f} GiB")
+
+        report["queries"] = run_queries(
+            connection, windows(args.queries, months, args.vehicles, today, args.seed))
+        for kind, tables in report["queries"].items():
+            for table, result in tables.items():
+                label = "partitioned" if table == PARTED else "plain"
+                print(f"{kind:<16} {label:<12} p50={result['p50_ms']:>9}ms p95={result['p95_ms']:>9}ms "
+                      f"plan={result['planning_ms']:>6}ms buffers={result['buffers']:>8} "
+                      f"relations={result['relations_scanned']}")
+
+        if not args.keep:
+            report["retention"] = retention(connection, months)
+            result = report["retention"]
+            print(f"remove {result['month']}: DELETE {result['deleted_rows']} rows {result['delete_ms']}ms "
+                  f"(+ VACUUM {result['vacuum_after_delete_ms']}ms), "
+                  f"DETACH {result['detach_ms']}ms, DROP {result['drop_ms']}ms")
+            connection.execute(text(f"DROP TABLE IF EXISTS {PLAIN}, {PARTED}"))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2, default=str)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,180 @@
+"""PDF report render cost, process pool versus inline rendering, and cache hits.
+
+Runs in-process on synthetic trip logs, so no database is needed:
+
+- render: seconds per report for a range of row counts, i.e. what a cache
+  miss costs and where REPORT_MAX_ROWS should sit.
+- concurrency: --reports distinct reports rendered at once, inline on the
+  event loop and through the report process pool. A ticker task measures
+  how late the loop wakes it, which is the delay every other request on
+  that worker would see while reports render.
+- hit: latency of ensure_rendered for a report that is already cached.
+
+With --month, a monthly batch job is also run against the database (the
+seeded dataset from benchmarks.dataset) and its reports/sec recorded.
+
+    python -m benchmarks.reports --rows 100 1000 5000 --month 2026-05 --output results/reports.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+from app import reports
+from app.reportrender import render
+
+
+def synthetic_report(rows: int, seed: int) -> dict:
+    rng = random.Random(seed)
+    places = ["Depot", "Airport", "Harbour", "North Site", "City Centre", "Warehouse 3", "Training Ground"]
+    return {
+        "title": "Trip Log",
+        "orientation": "L",
+        "lines": [f"Vehicle: BV-{seed:05d}", "Period: benchmark"],
+        "columns": [
+            {"title": "Date", "width": 22}, {"title": "Vehicle", "width": 24}, {"title": "Driver", "width": 34},
+            {"title": "From", "width": 32}, {"title": "To", "width": 32}, {"title": "Purpose", "width": 40},
+            {"title": "km", "width": 18, "align": "R"}, {"title": "Fuel (L)", "width": 18, "align": "R"},
+            {"title": "Status", "width": 20},
+        ],
+        "rows": [[f"2026-05-{index % 28 + 1:02d}", f"BV-{seed:05d}", f"Bench Driver {rng.randrange(200)}",
+                  rng.choice(places), rng.choice(places), "Delivery run " * rng.randrange(1, 5),
+                  f"{rng.uniform(5, 400):,.1f}", f"{rng.uniform(1, 40):,.2f}", "Completed"]
+                 for index in range(rows)],
+        "totals": [f"{rows} trips"],
+    }
+
+
+def render_cost(row_counts, repeat: int, directory: str) -> dict:
+    results = {}
+    for rows in row_counts:
+        report = synthetic_report(rows, rows)
+        times, size = [], 0
+        for _ in range(repeat):
+            started = time.perf_counter()
+            size = render(report, os.path.join(directory, f"render-{rows}.pdf"))
+            times.append(time.perf_counter() - started)
+        results[str(rows)] = {"seconds": round(min(times), 3), "bytes": size,
+                              "rows_per_sec": round(rows / min(times))}
+    return results
+
+
+async def _concurrent(count: int, rows: int, seed: int, render_one) -> dict:
+    lag, stop = [0.0], asyncio.Event()
+
+    async def ticker():
+        while not stop.is_set():
+            before = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lag[0] = max(lag[0], time.perf_counter() - before - 0.001)
+
+    ticking = asyncio.create_task(ticker())
+    await asyncio.sleep(0.01)
+    started = time.perf_counter()
+    await asyncio.gather(*(render_one(synthetic_report(rows, seed + index)) for index in range(count)))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await ticking
+    return {"reports": count, "seconds": round(elapsed, 2), "reports_per_sec": round(count / elapsed, 2),
+            "max_loop_lag_ms": round(lag[0] * 1000, 1)}
+
+
+def concurrency(count: int, rows: int, directory: str) -> dict:
+    async def inline(report):
+        render(report, reports.cache_path(reports.report_key(report)))
+
+    async def pooled(report):
+        await reports.ensure_rendered(report, prune=False)
+
+    async def warm():
+        # Process start-up is paid once per worker, not per report
+        await asyncio.gather(*(pooled(synthetic_report(1, -index)) for index in range(reports.REPORT_WORKERS)))
+
+    asyncio.run(warm())
+    # Distinct seeds, so the pool run cannot hit files the inline run wrote
+    result = {"rows": rows, "workers": reports.REPORT_WORKERS,
+              "inline": asyncio.run(_concurrent(count, rows, 1_000, inline)),
+              "pool": asyncio.run(_concurrent(count, rows, 2_000, pooled))}
+    reports.shutdown_pool()
+    return result
+
+
+def cache_hit(requests: int) -> dict:
+    report = synthetic_report(500, 3_000)
+
+    async def hits():
+        await reports.ensure_rendered(report, prune=False)
+        started = time.perf_counter()
+        for _ in range(requests):
+            await reports.ensure_rendered(report, prune=False)
+        return time.perf_counter() - started
+
+    elapsed = asyncio.run(hits())
+    reports.shutdown_pool()
+    return {"requests": requests, "us_per_hit": round(elapsed / requests * 1e6, 1)}
+
+
+def monthly(month: str, kinds: str) -> dict:
+    from app.database import AsyncSessionLocal
+    from app.models import ReportJob
+
+    async def run():
+        async with AsyncSessionLocal() as db:
+            job = await reports.start_job(db, reports.parse_month(month), reports.parse_kinds(kinds))
+        started = time.perf_counter()
+        await asyncio.gather(*reports._jobs)
+        elapsed = time.perf_counter() - started
+        async with AsyncSessionLocal() as db:
+            job = await db.get(ReportJob, job.job_id)
+        return job, elapsed
+
+    job, elapsed = asyncio.run(run())
+    reports.shutdown_pool()
+    return {"job_id": job.job_id, "status": job.status.value, "reports": job.done, "failed": job.failed,
+            "seconds": round(elapsed, 1), "reports_per_sec": round(job.done / elapsed, 2) if elapsed else None}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, nargs="+", default=[100, 1000, 5000], help="row counts to render")
+    parser.add_argument("--repeat", type=int, default=3, help="best of N renders")
+    parser.add_argument("--reports", type=int, default=8, help="reports rendered at once in the concurrency test")
+    parser.add_argument("--report-rows", type=int, default=300, help="rows per report in the concurrency test")
+    parser.add_argument("--hits", type=int, default=2000)
+    parser.add_argument("--month", help="also run a monthly batch job for this YYYY-MM against the database")
+    parser.add_argument("--kinds", default="inspections,trips")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        report = {"render": render_cost(args.rows, args.repeat, directory)}
+        for rows, result in report["render"].items():
+            print(f"render rows={rows:<6} {result['seconds']}s {result['bytes']} bytes "
+                  f"rows/s={result['rows_per_sec']}")
+        # The in-process tests use a scratch cache; the batch job writes to the real one
+        configured = reports.REPORTS_DIR
+        reports.REPORTS_DIR = directory
+        report["concurrency"] = concurrency(args.reports, args.report_rows, directory)
+        for name in ("inline", "pool"):
+            result = report["concurrency"][name]
+            print(f"concurrent {name:<6} reports={result['reports']} reports/s={result['reports_per_sec']} "
+                  f"max loop lag={result['max_loop_lag_ms']}ms")
+        report["hit"] = cache_hit(args.hits)
+        print(f"cache hit {report['hit']['us_per_hit']}us")
+        reports.REPORTS_DIR = configured
+    if args.month:
+        report["monthly"] = monthly(args.month, args.kinds)
+        result = report["monthly"]
+        print(f"monthly {args.month} status={result['status']} reports={result['reports']} "
+              f"failed={result['failed']} {result['seconds']}s reports/s={result['reports_per_sec']}")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,164 @@
+"""Throughput and p50/p95/p99 per endpoint for the benchmarks.workload mix.
+
+Seed the database named by DATABASE_URL once with benchmarks.dataset, then
+run against an API that is already up (--url) or let the runner start one
+from this checkout (--serve). Reports record the commit they were taken on,
+so two runs can be compared:
+
+    python -m benchmarks.dataset --replace
+    python -m benchmarks.run --serve --clients 10 50 --output results/before.json
+    git checkout my-branch
+    python -m benchmarks.run --serve --clients 10 50 --compare results/before.json
+
+--compare exits with status 1 when an endpoint's p95 grows, or its
+throughput drops, by more than --threshold percent. Run long enough for
+each endpoint to collect --min-requests samples, or it is not judged.
+"""
+import argparse
+import asyncio
+import json
+import os
+import secrets
+import subprocess
+import sys
+import time
+import urllib.request
+from datetime import datetime, timezone
+
+from app.database import engine
+
+from .dataset import counts
+from .loadgen import run_load, summarize
+from .workload import load_fleet, make_workload
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def serve(port: int, workers: int) -> subprocess.Popen:
+    env = dict(os.environ, SERVICE_SCHEDULER_ENABLED="false", OUTBOX_WORKER_ENABLED="false")
+    # The API refuses to start without a signing key; the workers must share it
+    env.setdefault("JWT_SECRET", secrets.token_urlsafe(32))
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=env)
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"API exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/readyz", timeout=2):
+                return process
+        except OSError:
+            time.sleep(0.5)
+    process.terminate()
+    raise SystemExit("API did not become ready within 60s")
+
+
+def print_run(summary: dict):
+    print(f"clients={summary['clients']} elapsed={summary['elapsed_s']}s statuses={summary['statuses']}")
+    print(f"  {'endpoint':<28} {'requests':>9} {'rps':>8} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'errors':>7}")
+    for label, stats in [*summary["endpoints"].items(), ("total", summary["total"])]:
+        print(f"  {label:<28} {stats['requests']:>9} {stats['rps']:>8} {stats['p50_ms']:>8} "
+              f"{stats['p95_ms']:>8} {stats['p99_ms']:>8} {stats['errors']:>7}")
+
+
+def compare(report: dict, baseline: dict, threshold: float, min_requests: int) -> list:
+    """Print per-endpoint deltas against ``baseline``; return the regressions.
+
+    Endpoints with fewer than ``min_requests`` samples in either run are
+    shown but not judged, since their percentiles are mostly noise.
+    """
+    regressions = []
+    previous_runs = {run["clients"]: run for run in baseline["runs"]}
+    print(f"\ncompared with {baseline.get('label')} @ {baseline.get('commit')} (threshold {threshold}%)")
+    for run in report["runs"]:
+        previous = previous_runs.get(run["clients"])
+        if previous is None:
+            continue
+        print(f"clients={run['clients']}")
+        print(f"  {'endpoint':<28} {'rps':>16} {'p50_ms':>20} {'p95_ms':>20} {'p99_ms':>20}")
+        for label, stats in [*run["endpoints"].items(), ("total", run["total"])]:
+            old = previous["endpoints"].get(label) if label != "total" else previous["total"]
+            if not old or not old["requests"]:
+                continue
+            cells = []
+            for metric in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+                change = (stats[metric] - old[metric]) / old[metric] * 100 if old[metric] else 0.0
+                cells.append(f"{stats[metric]:>9} {change:>+6.1f}%")
+                worse = -change if metric == "rps" else change
+                judged = min(stats["requests"], old["requests"]) >= min_requests
+                if judged and metric in ("rps", "p95_ms") and worse > threshold:
+                    regressions.append((run["clients"], label, metric, round(change, 1)))
+            print(f"  {label:<28} " + " ".join(f"{cell:>20}" for cell in cells))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--serve", action="store_true", help="start the API from this checkout")
+    parser.add_argument("--port", type=int, default=8011, help="port for --serve")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn workers for --serve")
+    parser.add_argument("--clients", type=int, nargs="+", default=[10, 50])
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds per concurrency level")
+    parser.add_argument("--warmup", type=float, default=5.0, help="unmeasured seconds before the first level")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--label", default=None, help="name for this run (default: the commit)")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    parser.add_argument("--compare", help="earlier report to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0,
+                        help="percent change in p95 or rps counted as a regression")
+    parser.add_argument("--min-requests", type=int, default=200,
+                        help="samples an endpoint needs before --compare judges it")
+    args = parser.parse_args()
+
+    with engine.connect() as connection:
+        fleet = load_fleet(connection)
+        dataset = counts(connection)
+    next_request = make_workload(fleet, args.seed)
+
+    process = serve(args.port, args.workers) if args.serve else None
+    url = f"http://127.0.0.1:{args.port}" if args.serve else args.url
+    commit = git_commit()
+    report = {
+        "label": args.label or commit, "commit": commit,
+        "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "workers": args.workers if args.serve else None, "duration_s": args.duration,
+        "dataset": dataset, "runs": [],
+    }
+    try:
+        if args.warmup:
+            asyncio.run(run_load(url, min(args.clients), args.warmup, next_request))
+        for clients in args.clients:
+            summary = summarize(asyncio.run(run_load(url, clients, args.duration, next_request)))
+            report["runs"].append(summary)
+            print_run(summary)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(report, json.load(f), args.threshold, args.min_requests)
+        for clients, label, metric, change in regressions:
+            print(f"regression: clients={clients} {label} {metric} {change:+}%")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""Search latency on a seeded dataset: trigram indexes versus sequential scans.
+
+Seeds 100k vehicles (plus users and trips) into the database named by
+DATABASE_URL inside one transaction, runs every query with the search
+indexes usable and again with index scans disabled, which is what the old
+leading-wildcard ILIKE filters always got, and rolls the seed back at the
+end unless --keep is given.
+
+    python -m benchmarks.search --output results/search.json
+"""
+import argparse
+import json
+import statistics
+import time
+
+from sqlalchemy import select, text
+
+from app.database import engine
+from app.models import Vehicle
+from app.search import ensure_search_extension, ensure_search_indexes, search_statement, vehicle_contains
+
+MAKES = ["Toyota", "Ford", "Nissan", "Volkswagen", "Isuzu", "Mercedes-Benz", "Hyundai", "Mazda"]
+MODELS = ["Hilux", "Ranger", "Navara", "Amarok", "D-Max", "Sprinter", "H100", "BT-50", "Corolla", "Polo"]
+PLACES = ["Cape Town", "Carnarvon", "Pretoria", "Johannesburg", "Durban", "Stellenbosch", "Upington"]
+PURPOSES = ["Site visit", "Antenna maintenance", "Supplies", "Airport transfer", "Conference"]
+
+DEFAULT_QUERIES = ["toyota", "hil", "BN000042", "corola", "toyota hilux", "carnarvon", "zzqx"]
+
+
+def _array(values):
+    return "ARRAY[" + ", ".join("'" + value.replace("'", "''") + "'" for value in values) + "]"
+
+
+def seed(connection, vehicles, users, trips):
+    connection.execute(text(f"""
+        INSERT INTO vehicle (vin, make, model, year, licence_plate, fuel_type, mileage,
+                             last_service_date, last_service_km)
+        SELECT 'BENCH' || lpad(g::text, 12, '0'),
+               ({_array(MAKES)})[1 + g % {len(MAKES)}],
+               ({_array(MODELS)})[1 + (g / 7) % {len(MODELS)}],
+               2000 + g % 25, 'BN' || lpad(g::text, 6, '0'), 'Diesel', g % 300000,
+               DATE '2024-01-01' + g % 365, g % 200000
+        FROM generate_series(1, :vehicles) AS g"""), {"vehicles": vehicles})
+    connection.execute(text("""
+        INSERT INTO users (name, email, role)
+        SELECT 'Bench User ' || g, 'bench.user' || g || '@example.com', 'employee'
+        FROM generate_series(1, :users) AS g"""), {"users": users})
+    connection.execute(text(f"""
+        INSERT INTO trip (vehicle_id, user_id, start_location, destination, purpose,
+                          trip_date, distance, trip_status)
+        SELECT v.id, u.user_id,
+               ({_array(PLACES)})[1 + g % {len(PLACES)}],
+               ({_array(PLACES)})[1 + (g / 3) % {len(PLACES)}],
+               ({_array(PURPOSES)})[1 + g % {len(PURPOSES)}],
+               DATE '2024-01-01' + g % 365, g % 500, 'completed'
+        FROM generate_series(1, :trips) AS g
+        JOIN LATERAL (SELECT min(id) AS id FROM vehicle) v ON true
+        JOIN LATERAL (SELECT min(user_id) AS user_id FROM users) u ON true"""), {"trips": trips})
+    for table in ("vehicle", "users", "trip"):
+        connection.execute(text(f"ANALYZE {table}"))
+
+
+def scan_nodes(connection, statement):
+    compiled = statement.compile(connection)
+    plan = connection.exec_driver_sql(
+        "EXPLAIN (FORMAT JSON) " + compiled.string, compiled.params).scalar()
+    nodes, stack = set(), [plan[0]["Plan"]]
+    while stack:
+        node = stack.pop()
+        if "Scan" in node["Node Type"]:
+            nodes.add(node["Node Type"])
+        stack.extend(node.get("Plans", []))
+    return sorted(nodes)
+
+
+def time_query(connection, statement, repeat):
+    connection.execute(statement).all()  # warm up
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = connection.execute(statement).all()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "rows": len(rows),
+        "median_ms": round(statistics.median(timings), 3),
+        "p95_ms": round(timings[int(0.95 * (len(timings) - 1))], 3),
+        "plan": scan_nodes(connection, statement),
+    }
+
+
+def workload(queries, limit):
+    for q in queries:
+        yield f"search {q!r}", search_statement(q, limit=limit)
+        yield f"get_all_vehicles make={q!r}", (
+            select(Vehicle).where(vehicle_contains(Vehicle.make, q)).order_by(Vehicle.id).limit(limit))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--vehicles", type=int, default=100_000)
+    parser.add_argument("--users", type=int, default=10_000)
+    parser.add_argument("--trips", type=int, default=100_000)
+    parser.add_argument("--query", action="append", dest="queries")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="commit the seeded rows")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {"vehicles": args.vehicles, "users": args.users, "trips": args.trips, "results": []}
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            ensure_search_extension(connection)
+            ensure_search_indexes(connection)
+            started = time.perf_counter()
+            seed(connection, args.vehicles, args.users, args.trips)
+            report["seed_seconds"] = round(time.perf_counter() - started, 2)
+            print(f"seeded in {report['seed_seconds']}s")
+
+            for name, statement in workload(args.queries or DEFAULT_QUERIES, args.limit):
+                indexed = time_query(connection, statement, args.repeat)
+                connection.execute(text("SET LOCAL enable_bitmapscan = off"))
+                connection.execute(text("SET LOCAL enable_indexscan = off"))
+                scanned = time_query(connection, statement, args.repeat)
+                connection.execute(text("RESET enable_bitmapscan"))
+                connection.execute(text("RESET enable_indexscan"))
+                report["results"].append({"query": name, "indexed": indexed, "seq_scan": scanned})
+                print(f"{name:<45} indexed {indexed['median_ms']:>9}ms {indexed['plan']}  "
+                      f"seq {scanned['median_ms']:>9}ms  rows={indexed['rows']}")
+        finally:
+            if args.keep:
+                transaction.commit()
+            else:
+                transaction.rollback()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""List serialization throughput: ORM objects plus response_model versus plain rows plus orjson.
+
+Seeds vehicles, users (each assigned a vehicle) and trips into the database
+named by DATABASE_URL inside one transaction that is rolled back at the
+end, then serializes --rows rows of each response schema both ways: the
+way FastAPI does it for response_model=List[...], and the fast path the
+list endpoints now take. Both bodies are checked for equality.
+
+    python -m benchmarks.serialization --rows 50000 --output results/serialization.json
+"""
+import argparse
+import json
+import time
+from typing import List
+
+import orjson
+from pydantic import TypeAdapter
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from app.database import engine
+from app.loading import loader_options
+from app.models import Trip, User, Vehicle
+from app.schemas import TripResponse, UserResponse, VehicleResponse
+from app.serialization import rows_to_dicts, select_rows
+
+from .search import seed
+
+# Newest first, so the seeded rows are the ones measured
+TARGETS = (
+    ("VehicleResponse", Vehicle, VehicleResponse, Vehicle.id.desc()),
+    ("UserResponse", User, UserResponse, User.user_id.desc()),
+    ("TripResponse", Trip, TripResponse, Trip.trip_id.desc()),
+)
+
+
+def orm_path(session, model, schema, order, rows):
+    adapter = TypeAdapter(List[schema])
+    started = time.perf_counter()
+    objects = session.scalars(
+        select(model).options(*loader_options(model, schema)).order_by(order).limit(rows)).all()
+    fetched = time.perf_counter()
+    body = adapter.dump_json(adapter.validate_python(objects, from_attributes=True))
+    session.expunge_all()
+    return body, fetched - started, time.perf_counter() - fetched
+
+
+def fast_path(session, model, schema, order, rows):
+    started = time.perf_counter()
+    result = session.execute(select_rows(model, schema).order_by(order).limit(rows)).all()
+    fetched = time.perf_counter()
+    body = orjson.dumps(rows_to_dicts(result, model, schema))
+    return body, fetched - started, time.perf_counter() - fetched
+
+
+def measure(path, session, target, rows, repeat):
+    _name, model, schema, order = target
+    best = None
+    for _ in range(repeat):
+        body, fetch, encode = path(session, model, schema, order, rows)
+        if best is None or fetch + encode < best[1] + best[2]:
+            best = (body, fetch, encode)
+    body, fetch, encode = best
+    count = len(json.loads(body))
+    return body, {
+        "rows": count,
+        "fetch_ms": round(fetch * 1000, 1),
+        "encode_ms": round(encode * 1000, 1),
+        "rows_per_sec": round(count / (fetch + encode)),
+        "encode_rows_per_sec": round(count / encode),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {"rows": args.rows, "results": {}}
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        try:
+            seed(connection, args.rows, args.rows, args.rows)
+            connection.execute(text("""
+                UPDATE users SET vehicle_id = v.id
+                FROM (SELECT id, row_number() OVER (ORDER BY id) AS n FROM vehicle) v
+                WHERE users.email LIKE 'bench.user%'
+                  AND v.n = 1 + users.user_id % (SELECT count(*) FROM vehicle)"""))
+            session = Session(bind=connection)
+            print(f"{'schema':<16} {'path':<5} {'rows':>7} {'fetch_ms':>9} {'encode_ms':>10} "
+                  f"{'rows/s':>9} {'encode rows/s':>14}")
+            for target in TARGETS:
+                name = target[0]
+                orm_body, orm = measure(orm_path, session, target, args.rows, args.repeat)
+                fast_body, fast = measure(fast_path, session, target, args.rows, args.repeat)
+                fast["same_output"] = json.loads(orm_body) == json.loads(fast_body)
+                report["results"][name] = {"orm": orm, "fast": fast}
+                for label, result in (("orm", orm), ("fast", fast)):
+                    print(f"{name:<16} {label:<5} {result['rows']:>7} {result['fetch_ms']:>9} "
+                          f"{result['encode_ms']:>10} {result['rows_per_sec']:>9} "
+                          f"{result['encode_rows_per_sec']:>14}")
+                print(f"{'':<16} speedup x{round(fast['rows_per_sec'] / orm['rows_per_sec'], 1)}, "
+                      f"same output: {fast['same_output']}")
+        finally:
+            transaction.rollback()
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
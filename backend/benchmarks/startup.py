@@ -0,0 +1,129 @@
+"""Import time and cold start of the API, checked against time budgets.
+
+Every measurement uses a fresh interpreter, as a new worker would:
+
+- import: wall time of ``import app.main``, less the bare interpreter
+  start-up, best of --repeat; plus the slowest imports by cumulative time
+  from ``python -X importtime``.
+- startup: uvicorn is started --repeat times against DATABASE_URL, timing
+  the first /healthz answer (serving) and the first /readyz 200 (database
+  reachable and migrated).
+
+With --import-budget-ms or --ready-budget-ms the run exits with status 1
+when the best time exceeds the budget, so it can gate CI:
+
+    python -m benchmarks.startup --import-budget-ms 1500 --ready-budget-ms 3000 --output results/startup.json
+"""
+import argparse
+import json
+import os
+import secrets
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from .run import BACKEND_DIR, git_commit
+
+
+def _env() -> dict:
+    env = dict(os.environ, PYTHONPATH=BACKEND_DIR, SERVICE_SCHEDULER_ENABLED="false",
+               OUTBOX_WORKER_ENABLED="false")
+    env.setdefault("JWT_SECRET", secrets.token_urlsafe(32))
+    return env
+
+
+def _interpreter_seconds(code: str) -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], cwd=BACKEND_DIR, env=_env(), check=True)
+    return time.perf_counter() - started
+
+
+def import_time(repeat: int, top: int) -> dict:
+    bare = min(_interpreter_seconds("pass") for _ in range(repeat))
+    loaded = min(_interpreter_seconds("import app.main") for _ in range(repeat))
+    trace = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app.main"], cwd=BACKEND_DIR,
+                           env=_env(), capture_output=True, text=True, check=True).stderr
+    modules = {}
+    for line in trace.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Top-level packages and the app's own modules; nested imports are inside those
+        name = name.rstrip()[1:]
+        depth = (len(name) - len(name.lstrip())) // 2
+        if depth <= 1 or name.strip().startswith("app."):
+            modules[name.strip()] = max(modules.get(name.strip(), 0), int(cumulative_us))
+    slowest = sorted(modules.items(), key=lambda item: -item[1])[:top]
+    return {"interpreter_ms": round(bare * 1000, 1), "import_ms": round((loaded - bare) * 1000, 1),
+            "slowest": {name: round(us / 1000, 1) for name, us in slowest}}
+
+
+def _poll(url: str, deadline: float, process: subprocess.Popen) -> float:
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"API exited with status {process.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return time.perf_counter()
+        except (urllib.error.HTTPError, OSError):
+            time.sleep(0.005)
+    raise SystemExit(f"{url} did not answer 200 in time")
+
+
+def cold_start(port: int, timeout: float) -> dict:
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=BACKEND_DIR, env=_env())
+    try:
+        serving = _poll(f"http://127.0.0.1:{port}/healthz", started + timeout, process)
+        ready = _poll(f"http://127.0.0.1:{port}/readyz", started + timeout, process)
+        return {"serving_ms": round((serving - started) * 1000, 1), "ready_ms": round((ready - started) * 1000, 1)}
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="best of N fresh processes")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--port", type=int, default=8012)
+    parser.add_argument("--timeout", type=float, default=60.0, help="seconds to wait for /readyz")
+    parser.add_argument("--skip-startup", action="store_true", help="only measure imports (no database needed)")
+    parser.add_argument("--import-budget-ms", type=float)
+    parser.add_argument("--ready-budget-ms", type=float)
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {"commit": git_commit(), "import": import_time(args.repeat, args.top)}
+    result = report["import"]
+    print(f"import app.main {result['import_ms']}ms (interpreter {result['interpreter_ms']}ms)")
+    for name, ms in result["slowest"].items():
+        print(f"  {ms:>8}ms  {name}")
+    if not args.skip_startup:
+        runs = [cold_start(args.port, args.timeout) for _ in range(args.repeat)]
+        report["startup"] = {"runs": runs, "serving_ms": min(run["serving_ms"] for run in runs),
+                             "ready_ms": min(run["ready_ms"] for run in runs)}
+        print(f"cold start: serving after {report['startup']['serving_ms']}ms, "
+              f"ready after {report['startup']['ready_ms']}ms (best of {args.repeat})")
+
+    over = []
+    if args.import_budget_ms is not None and result["import_ms"] > args.import_budget_ms:
+        over.append(f"import {result['import_ms']}ms > budget {args.import_budget_ms}ms")
+    if args.ready_budget_ms is not None and "startup" in report \
+            and report["startup"]["ready_ms"] > args.ready_budget_ms:
+        over.append(f"ready {report['startup']['ready_ms']}ms > budget {args.ready_budget_ms}ms")
+    report["over_budget"] = over
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if over:
+        print("over budget: " + "; ".join(over))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+"""Scripted request mix over the fleet written by benchmarks.dataset.
+
+Each simulated client draws from MIX by weight: mostly single-row lookups
+and short lists, with logins, search, analytics and a steady share of
+writes (new trips, inspections and completing pending trips). Ids come
+from the seeded rows, so every request hits data that exists.
+"""
+import random
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Callable, Dict, List
+
+from sqlalchemy import text
+
+from .dataset import BENCH_PASSWORD, PLACES, PURPOSES, VEHICLE_MODELS
+from .loadgen import Request
+
+# (label, weight)
+MIX = [
+    ("login", 5),
+    ("get_vehicle", 20),
+    ("get_user", 15),
+    ("get_all_trips", 15),
+    ("get_user_trips", 10),
+    ("get_inspections_by_vehicle", 3),
+    ("search", 5),
+    ("fleet_analytics", 3),
+    ("add_trip", 12),
+    ("complete_trip", 4),
+    ("add_inspection", 8),
+]
+
+
+@dataclass
+class Fleet:
+    vehicle_ids: List[int]
+    # (user_id, email, role)
+    users: List[tuple]
+    # request bodies for pending trips, keyed by trip id; consumed by complete_trip
+    pending: Dict[int, dict] = field(default_factory=dict)
+
+
+def load_fleet(connection, sample: int = 5000) -> Fleet:
+    vehicle_ids = connection.execute(text(
+        "SELECT id FROM vehicle WHERE vin LIKE 'BV%' ORDER BY id")).scalars().all()
+    users = [tuple(row) for row in connection.execute(text(
+        "SELECT user_id, email, role FROM users WHERE email LIKE 'bench.%@example.com' ORDER BY user_id"))]
+    if not vehicle_ids or not users:
+        raise SystemExit("No benchmark fleet found; run python -m benchmarks.dataset first")
+    pending = {}
+    for row in connection.execute(text("""
+            SELECT t.trip_id, t.vehicle_id, t.user_id, t.start_location, t.destination,
+                   t.purpose, t.trip_date, t.distance, t.fuel_consumed
+            FROM trip t JOIN vehicle v ON v.id = t.vehicle_id
+            WHERE v.vin LIKE 'BV%' AND t.trip_status = 'pending'
+            ORDER BY random() LIMIT :sample"""), {"sample": sample}).mappings():
+        body = dict(row)
+        trip_id = body.pop("trip_id")
+        body["trip_date"] = body["trip_date"].isoformat()
+        body["trip_status"] = "completed"
+        pending[trip_id] = body
+    return Fleet(list(vehicle_ids), users, pending)
+
+
+class Workload:
+    def __init__(self, fleet: Fleet, seed: int = 0):
+        self.fleet = fleet
+        self.seed = seed
+        self.rngs: Dict[int, random.Random] = {}
+        self.labels = [label for label, _ in MIX]
+        self.weights = [weight for _, weight in MIX]
+        self.pending = list(fleet.pending.items())
+        self.search_terms = sorted({make for make, _, _ in VEHICLE_MODELS} | set(PLACES))
+        self.today = date.today()
+
+    def next_request(self, index: int) -> Request:
+        rng = self.rngs.get(index)
+        if rng is None:
+            rng = self.rngs[index] = random.Random(self.seed * 100_003 + index)
+        label = rng.choices(self.labels, self.weights)[0]
+        if label == "complete_trip" and not self.pending:
+            label = "add_trip"
+        method, path, body = getattr(self, label)(rng)
+        return method, path, body, label
+
+    def vehicle(self, rng) -> int:
+        return rng.choice(self.fleet.vehicle_ids)
+
+    def user(self, rng) -> tuple:
+        return rng.choice(self.fleet.users)
+
+    def login(self, rng):
+        _user_id, email, role = self.user(rng)
+        return "POST", "/api/login/", {"email": email, "password": BENCH_PASSWORD, "role": role}
+
+    def get_vehicle(self, rng):
+        return "GET", f"/api/get_vehicle/{self.vehicle(rng)}", None
+
+    def get_user(self, rng):
+        return "GET", f"/api/get_user/{self.user(rng)[0]}", None
+
+    def get_all_trips(self, rng):
+        return "GET", "/api/get_all_trips/?limit=50&desc=true", None
+
+    def get_user_trips(self, rng):
+        return "GET", f"/api/get_user_trips/{self.user(rng)[0]}", None
+
+    def get_inspections_by_vehicle(self, rng):
+        return "GET", f"/api/get_inspections_by_vehicle/{self.vehicle(rng)}", None
+
+    def search(self, rng):
+        return "GET", f"/api/search?q={rng.choice(self.search_terms).replace(' ', '+')}", None
+
+    def fleet_analytics(self, rng):
+        return "GET", "/api/analytics/fleet", None
+
+    def add_trip(self, rng):
+        start, destination = rng.sample(PLACES, 2)
+        distance = round(rng.lognormvariate(3.5, 0.9), 1)
+        return "POST", "/api/add_trip/", {
+            "vehicle_id": self.vehicle(rng), "user_id": self.user(rng)[0],
+            "start_location": start, "destination": destination, "purpose": rng.choice(PURPOSES),
+            "trip_date": (self.today - timedelta(days=rng.randrange(3))).isoformat(),
+            "distance": distance, "fuel_consumed": round(distance * rng.uniform(0.07, 0.12), 2),
+            "trip_status": "pending",
+        }
+
+    def complete_trip(self, rng):
+        trip_id, body = self.pending.pop(rng.randrange(len(self.pending)))
+        return "PUT", f"/api/update_trip/{trip_id}", body
+
+    def add_inspection(self, rng):
+        user_id, _email, _role = self.user(rng)
+        return "POST", "/api/add_inspection/", {
+            "vehicle_id": self.vehicle(rng), "user_id": user_id,
+            "type": rng.choice(("pre_trip", "post_trip")), "date": self.today.isoformat(),
+            "signed_by": f"Bench user {user_id}", "status": "completed",
+        }
+
+
+def make_workload(fleet: Fleet, seed: int = 0) -> Callable[[int], Request]:
+    return Workload(fleet, seed).next_request
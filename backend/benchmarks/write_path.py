@@ -0,0 +1,77 @@
+"""Write-path latency with and without the vehicle/user read-through cache.
+
+The create endpoints check that the referenced vehicle and user exist
+before inserting; with the cache those checks are usually answered
+in-process. Start the API once with CACHE_BACKEND=off and once with the
+default, and run the same command against both, e.g.
+
+    CACHE_BACKEND=off uvicorn app.main:app
+    python -m benchmarks.write_path --vehicle-id 1 --user-id 1 --label uncached
+
+Every request inserts a trip, inspection or service notification, so point
+it at a scratch database.
+"""
+import argparse
+import asyncio
+import itertools
+import json
+from datetime import date
+
+from .loadgen import run_load, summarize
+
+
+def write_requests(vehicle_id: int, user_id: int, vehicles: int):
+    today = date.today().isoformat()
+    for i in itertools.count():
+        vid = vehicle_id + i % vehicles
+        kind = i % 3
+        if kind == 0:
+            yield "POST", "/api/add_trip/", {
+                "vehicle_id": vid, "user_id": user_id, "start_location": "Cape Town",
+                "destination": "Carnarvon", "purpose": "benchmark", "trip_date": today,
+                "distance": 10.0, "fuel_consumed": 1.0, "trip_status": "completed"}, "add_trip"
+        elif kind == 1:
+            yield "POST", "/api/add_inspection/", {
+                "vehicle_id": vid, "user_id": user_id, "type": "pre_trip", "date": today,
+                "signed_by": "benchmark", "status": "completed"}, "add_inspection"
+        else:
+            yield "POST", "/api/add_service_notification/", {
+                "vehicle_id": vid, "service_date": today, "notified": True}, "add_service_notification"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--vehicle-id", type=int, default=1,
+                        help="first of --vehicles consecutive existing vehicle ids")
+    parser.add_argument("--vehicles", type=int, default=1)
+    parser.add_argument("--user-id", type=int, default=1)
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 20])
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--label", default="current")
+    parser.add_argument("--output", help="write the JSON report to this file")
+    args = parser.parse_args()
+
+    requests = write_requests(args.vehicle_id, args.user_id, args.vehicles)
+
+    def next_request(_index):
+        return next(requests)
+
+    report = {"label": args.label, "url": args.url, "runs": []}
+    for clients in args.clients:
+        result = asyncio.run(run_load(args.url, clients, args.duration, next_request))
+        summary = summarize(result)
+        report["runs"].append(summary)
+        total = summary["total"]
+        print(f"{args.label:>10} clients={clients:<5} rps={total['rps']:<9} "
+              f"p50={total['p50_ms']}ms p99={total['p99_ms']}ms errors={total['errors']}")
+        for label, endpoint in summary["endpoints"].items():
+            print(f"{'':>10} {label:<26} p50={endpoint['p50_ms']}ms p99={endpoint['p99_ms']}ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
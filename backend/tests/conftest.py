@@ -0,0 +1,27 @@
+import os
+
+import pytest
+
+# Tests that need PostgreSQL run against DATABASE_URL (a migrated database,
+# see python -m app.migrations upgrade) and are skipped when it is unset or
+# unreachable. Background workers stay off so they cannot touch the data.
+os.environ.setdefault("JWT_SECRET", "test-secret")
+os.environ.setdefault("SERVICE_SCHEDULER_ENABLED", "false")
+os.environ.setdefault("OUTBOX_WORKER_ENABLED", "false")
+os.environ.setdefault("PARTITION_MAINTENANCE_ENABLED", "false")
+
+
+@pytest.fixture(scope="session")
+def engine():
+    if not os.getenv("DATABASE_URL"):
+        pytest.skip("DATABASE_URL is not set")
+    from sqlalchemy import text
+    from sqlalchemy.exc import OperationalError
+
+    from app.database import engine
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+    except OperationalError as e:
+        pytest.skip(f"PostgreSQL is not reachable: {e.orig}")
+    return engine
@@ -0,0 +1,45 @@
+import socket
+
+import pytest
+from sqlalchemy import text
+
+from benchmarks import odometer
+from benchmarks.run import serve
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def vehicle(engine):
+    with engine.begin() as connection:
+        vehicle_id = odometer.create_vehicle(connection)
+        user_ids = connection.execute(text("SELECT user_id FROM users ORDER BY user_id LIMIT 8")).scalars().all()
+    yield vehicle_id, user_ids
+    with engine.begin() as connection:
+        odometer.remove_vehicle(connection)
+
+
+def test_atomic_increments_lose_nothing(vehicle):
+    vehicle_id, _ = vehicle
+    assert odometer.increments(vehicle_id, 8, 25)["atomic"]["lost_updates"] == 0
+
+
+def test_concurrent_trip_completions_lose_no_km(vehicle):
+    vehicle_id, user_ids = vehicle
+    if not user_ids:
+        pytest.skip("no users to drive with")
+    port = free_port()
+    process = serve(port, 1)
+    url = f"http://127.0.0.1:{port}"
+    result = {"trip_ids": []}
+    try:
+        result = odometer.api(url, vehicle_id, user_ids, threads=8, trips=5)
+        assert result["lost_km"] == 0
+    finally:
+        odometer.cleanup(url, vehicle_id, result["trip_ids"])
+        process.terminate()
+        process.wait()
@@ -0,0 +1,34 @@
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select
+
+from app.models import Trip, Vehicle
+from app.pagination import encode_cursor, paginate
+
+
+def page(model, pk_attr, sort, cursor):
+    statement, _ = paginate(select(model), model, pk_attr, sort, (pk_attr, sort), 20, cursor, False)
+    return statement
+
+
+@pytest.mark.parametrize("model, pk_attr, sort, values", [
+    (Trip, "trip_id", "trip_date", ["not-a-date", 1]),
+    (Trip, "trip_id", "trip_date", [20240101, 1]),
+    (Trip, "trip_id", "trip_date", ["2024-01-01", "1"]),
+    (Vehicle, "id", "year", ["2020", 1]),
+    (Vehicle, "id", "year", [2020, True]),
+    (Vehicle, "id", "licence_plate", [["CA", 1], 1]),
+    (Vehicle, "id", "licence_plate", ["CA 123", None]),
+])
+def test_malformed_cursor_values_are_rejected(model, pk_attr, sort, values):
+    with pytest.raises(HTTPException) as raised:
+        page(model, pk_attr, sort, encode_cursor(*values))
+    assert raised.value.status_code == 400
+
+
+def test_valid_cursor_values_bind_as_their_column_types():
+    statement = page(Trip, "trip_id", "trip_date", encode_cursor(date(2024, 1, 1), 7))
+    assert {date(2024, 1, 1), 7} <= set(statement.compile().params.values())
+    page(Vehicle, "id", "licence_plate", encode_cursor(None, 7))
@@ -0,0 +1,62 @@
+import pytest
+from fastapi import Depends
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app import querycount
+from app.querycount import QueryBudgetExceeded, StatementCounter, counting, install_statement_counter, query_budget
+
+
+@pytest.fixture(scope="module")
+def strict_client(engine):
+    from app.database import async_engine
+    from app.main import create_app, get_db
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(querycount, "QUERY_BUDGET_MODE", "strict")
+        app = create_app()
+
+        @app.get("/test/selects/{count}", dependencies=[Depends(query_budget(2, "selects"))])
+        async def selects(count: int, db=Depends(get_db)):
+            for _ in range(count):
+                await db.execute(text("SELECT 1"))
+            return {"count": count}
+
+        with TestClient(app) as client:
+            yield client
+            # Pooled asyncpg connections belong to this client's event loop
+            client.portal.call(async_engine.dispose)
+
+
+def test_within_budget_passes_in_strict_mode(strict_client):
+    assert strict_client.get("/test/selects/2").json() == {"count": 2}
+
+
+def test_over_budget_fails_in_strict_mode(strict_client):
+    with pytest.raises(QueryBudgetExceeded, match="selects issued 3 SQL statements, budget is 2"):
+        strict_client.get("/test/selects/3")
+
+
+def test_budgeted_endpoints_stay_within_budget(strict_client, engine):
+    with engine.connect() as connection:
+        vehicle_id = connection.execute(text("SELECT min(id) FROM vehicle")).scalar()
+    if vehicle_id is None:
+        pytest.skip("no vehicles to read")
+    assert strict_client.get(f"/api/get_vehicle/{vehicle_id}").status_code == 200
+    assert strict_client.get("/api/get_all_vehicles/", params={"limit": 20}).status_code == 200
+
+
+def test_nested_counters_share_one_hook():
+    sqlite = create_engine("sqlite://")
+    install_statement_counter(sqlite)
+    outer, inner = StatementCounter(), StatementCounter()
+    with sqlite.connect() as connection, counting(outer):
+        connection.execute(text("SELECT 1"))
+        with counting(inner):
+            connection.execute(text("SELECT 2"))
+            connection.execute(text("SELECT 3"))
+        connection.execute(text("SELECT 4"))
+    connection_free = StatementCounter()
+    with counting(connection_free):
+        pass
+    assert (outer.count, inner.count, connection_free.count) == (4, 2, 0)
+    assert outer.db_time >= inner.db_time > 0
@@ -0,0 +1,75 @@
+import asyncio
+import socket
+from datetime import date
+
+import pytest
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Message
+from sqlalchemy import select
+from sqlalchemy.orm import sessionmaker
+
+from app import database, scheduler
+from app.emailSender import SMTPConnectionPool
+from app.models import EmailOutbox, Role, ServiceNotification, User, Vehicle
+from app.outbox import OutboxWorker
+
+
+class Inbox(Message):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def handle_message(self, message):
+        self.messages.append(message)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    inbox = Inbox()
+    controller = Controller(inbox, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield inbox, controller.port
+    controller.stop()
+
+
+@pytest.fixture
+def session(engine, monkeypatch):
+    # The scheduler's transaction becomes a savepoint in ours, rolled back at the end
+    with engine.connect() as connection, connection.begin() as transaction:
+        factory = sessionmaker(bind=connection, join_transaction_mode="create_savepoint")
+        monkeypatch.setattr(database, "SessionLocal", factory)
+        with factory() as db:
+            yield db
+        transaction.rollback()
+
+
+def test_due_vehicle_notifies_admins_over_smtp(session, smtp_server, monkeypatch):
+    inbox, port = smtp_server
+    monkeypatch.setenv("EMAIL_FROM", "fleet@example.com")
+    vehicle = Vehicle(make="Test", model="Due", year=2020, licence_plate="SCHED-TEST-1", vin="SCHED-TEST-1",
+                      mileage=scheduler.SERVICE_INTERVAL_KM + 100, last_service_km=0,
+                      last_service_date=date.today())
+    session.add_all([vehicle, User(name="Scheduler Admin", email="scheduler-admin@example.com", role=Role.admin)])
+    session.commit()
+
+    result = scheduler.run_once()
+    assert result["created"] >= 1 and result["queued"] >= 1
+    assert session.scalar(select(ServiceNotification.notified)
+                          .where(ServiceNotification.vehicle_id == vehicle.id)) is True
+    entry = session.scalars(select(EmailOutbox).where(EmailOutbox.subject == "Service due: SCHED-TEST-1")).one()
+
+    worker = OutboxWorker(pool=SMTPConnectionPool("127.0.0.1", port, size=1, use_tls=False), rate=0)
+    assert asyncio.run(worker.deliver(entry)) is None
+    worker.pool.close()
+
+    [message] = inbox.messages
+    assert message["Subject"] == "Service due: SCHED-TEST-1"
+    assert message["From"] == "fleet@example.com"
+    assert "scheduler-admin@example.com" in message["To"]
+    assert f"Current mileage: {vehicle.mileage} km" in message.get_payload()
@@ -0,0 +1,22 @@
+import pytest
+
+from app.security import hash_password_sync, verify_password_sync
+
+
+def test_verifies_its_own_hash():
+    stored = hash_password_sync("correct horse")
+    assert verify_password_sync("correct horse", stored)
+    assert not verify_password_sync("wrong horse", stored)
+
+
+@pytest.mark.parametrize("corrupt", [
+    lambda stored: stored[:20],
+    lambda stored: stored.rsplit("$", 1)[0],
+    lambda stored: stored + "$extra",
+    lambda stored: stored.replace("$8$", "$eight$", 1),
+    lambda stored: stored.replace("$8$", "$99999999999999999999$", 1),
+    lambda stored: stored[:-3] + "@@@",
+    lambda stored: "scrypt$",
+])
+def test_malformed_hash_matches_nothing(corrupt):
+    assert not verify_password_sync("correct horse", corrupt(hash_password_sync("correct horse")))
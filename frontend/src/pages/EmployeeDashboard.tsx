@@ -48,7 +48,7 @@ const EmployeeDashboard: React.FC = () => {
     const fetchAssignedVehicle = async () => {
         try {
             const response = await axios.get(`${process.env.REACT_APP_BACKEND_URL}/api/vehicles/assigned`, {
-                params: { email: user?.email },
+                headers: { Authorization: `Bearer ${token}` },
             });
             setVehicle(response.data);
         } catch (error: any) {